@@ -6,38 +6,11 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt
 from PyQt5 import QtGui
 from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
-import sqlite3
-import datetime
 import os
+from core import Cart, Store, cart_summary, format_money
+from core.receipts import receipt_path, render_receipt_text
 
-def initialize_database():
-    conn = sqlite3.connect('database.db')
-    cursor = conn.cursor()
-    
-    # Create articles table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS articles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            price REAL NOT NULL,
-            stock INTEGER NOT NULL
-        )
-    ''')
-    
-    # Insert sample data if table is empty
-    cursor.execute('SELECT COUNT(*) FROM articles')
-    if cursor.fetchone()[0] == 0:
-        sample_articles = [
-            ('Apple', 0.50, 100),
-            ('Banana', 0.30, 150),
-            ('Orange', 0.80, 80),
-            ('Milk', 1.20, 50),
-            ('Bread', 1.00, 60),
-        ]
-        cursor.executemany('INSERT INTO articles (name, price, stock) VALUES (?, ?, ?)', sample_articles)
-    
-    conn.commit()
-    conn.close()
+DB_PATH = 'database.db'
 
 class ReceiptWindow(QDialog):
     def __init__(self, receipt_content):
@@ -90,11 +63,12 @@ class ReceiptWindow(QDialog):
             QMessageBox.critical(self, 'Print Error', f"An error occurred while printing:\n{str(e)}")
 
 class CashDeskApp(QWidget):
-    def __init__(self):
+    def __init__(self, store):
         super().__init__()
+        self.store = store
         self.setWindowTitle('Cash Desk App')
         self.setGeometry(100, 100, 1000, 600)
-        self.cart = []
+        self.cart = Cart()
         self.discount = 0
         self.init_ui()
         self.load_articles()
@@ -203,13 +177,9 @@ class CashDeskApp(QWidget):
         self.setLayout(main_layout)
 
     def load_articles(self):
-        conn = sqlite3.connect('database.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, price, stock FROM articles')
-        articles = cursor.fetchall()
+        articles = self.store.list_articles()
         self.articles = articles  # Update the current articles
         self.display_articles(articles)
-        conn.close()
 
     def display_articles(self, articles):
         self.articles_list.clear()
@@ -221,75 +191,44 @@ class CashDeskApp(QWidget):
 
     def search_articles(self):
         query = self.search_input.text().strip()
-        conn = sqlite3.connect('database.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, price, stock FROM articles WHERE name LIKE ?", ('%' + query + '%',))
-        results = cursor.fetchall()
-        self.display_articles(results)
-        conn.close()
+        self.display_articles(self.store.search_articles(query))
 
     def add_to_cart(self):
         selected_item = self.articles_list.currentItem()
         if selected_item:
             article = selected_item.data(Qt.UserRole)
             quantity = self.qty_spinbox.value()
-            if article[3] >= quantity:
-                # Check if article is already in cart
-                for idx, cart_item in enumerate(self.cart):
-                    if cart_item['id'] == article[0]:
-                        self.cart[idx]['quantity'] += quantity
-                        break
-                else:
-                    self.cart.append({
-                        'id': article[0],
-                        'name': article[1],
-                        'price': article[2],
-                        'quantity': quantity
-                    })
+            # Update stock in real-time
+            if self.store.take_stock(article[0], quantity) is not None:
+                self.cart.add(article[0], article[1], article[2], quantity, article[6])
                 self.refresh_cart()
-                # Update stock in real-time
-                self.update_stock(article[0], article[3] - quantity)
             else:
                 QMessageBox.warning(self, 'Out of Stock', f"Only {article[3]} units of {article[1]} are available.")
-
-    def update_stock(self, article_id, new_stock):
-        conn = sqlite3.connect('database.db')
-        cursor = conn.cursor()
-        cursor.execute("UPDATE articles SET stock = ? WHERE id = ?", (new_stock, article_id))
-        conn.commit()
-        conn.close()
-        self.load_articles()
+            self.load_articles()
 
     def refresh_cart(self):
         self.cart_list.clear()
-        for item in self.cart:
-            self.cart_list.addItem(f"{item['name']} x{item['quantity']} - ${item['price'] * item['quantity']:.2f}")
+        for line in self.cart:
+            self.cart_list.addItem(f"{line.name} x{line.quantity} - ${format_money(line.line_cents)}")
         self.update_totals()
 
     def update_totals(self):
-        total = sum(item['price'] * item['quantity'] for item in self.cart)
-        self.total_label.setText(f"Total: ${total:.2f}")
-
         try:
-            self.discount = float(self.discount_input.text())
-            if not (0 <= self.discount <= 100):
-                raise ValueError
+            self.cart.set_discount(self.discount_input.text())
         except ValueError:
-            self.discount = 0
+            self.cart.set_discount(0)
             self.discount_input.setText('0')
+        self.discount = self.cart.discount_percent
 
+        self.total_label.setText(f"Total: ${format_money(self.cart.net_cents)}")
         self.discount_label.setText(f"Discount (%): {self.discount}")
-        discount_amount = total * (self.discount / 100)
-        final_total = total - discount_amount
-        self.final_total_label.setText(f"Final Total: ${final_total:.2f}")
+        self.final_total_label.setText(f"Final Total: ${format_money(self.cart.final_cents)}")
 
     def process_payment(self):
         if not self.cart:
             QMessageBox.warning(self, 'Empty Cart', 'Add items to the cart before payment.')
             return
-        total = sum(item['price'] * item['quantity'] for item in self.cart)
-        discount_amount = total * (self.discount / 100)
-        final_total = total - discount_amount
+        total, discount_amount, final_total = cart_summary(self.cart)
 
         # Simulate payment process
         reply = QMessageBox.question(
@@ -301,50 +240,32 @@ class CashDeskApp(QWidget):
         )
 
         if reply == QMessageBox.Yes:
-            # Here you can integrate actual payment processing
+            try:
+                receipt = self.store.commit_sale(self.cart, 'Cash')
+            except Exception as e:
+                QMessageBox.critical(self, 'Database Error', f"An error occurred while recording the sale:\n{str(e)}")
+                return
             QMessageBox.information(
                 self,
                 'Payment Successful',
-                f"Payment of ${final_total:.2f} was successful!"
+                f"Payment of ${receipt['final_total']:.2f} was successful!"
             )
-            receipt_content = self.generate_receipt(total, discount_amount, final_total)
-            self.print_receipt(receipt_content)
+            receipt_content = render_receipt_text(receipt)
+            self.print_receipt(receipt['sale_id'], receipt_content)
             self.show_receipt(receipt_content)
             self.cart.clear()
             self.cart_list.clear()
             self.update_totals()
 
-    def generate_receipt(self, total, discount, final_total):
-        receipt_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        receipt_lines = [
-            "----- Receipt -----",
-            f"Date: {receipt_time}",
-            "",
-            "Items:",
-        ]
-        for item in self.cart:
-            line = f"{item['name']} x{item['quantity']} @ ${item['price']:.2f} each: ${item['price'] * item['quantity']:.2f}"
-            receipt_lines.append(line)
-        receipt_lines += [
-            "",
-            f"Total: ${total:.2f}",
-            f"Discount: ${discount:.2f}",
-            f"Final Total: ${final_total:.2f}",
-            "-------------------"
-        ]
-        receipt_content = "\n".join(receipt_lines)
-        return receipt_content
-
-    def print_receipt(self, receipt_content):
+    def print_receipt(self, sale_id, receipt_content):
         try:
             if not os.path.exists('receipts'):
                 os.makedirs('receipts')
-            receipt_time = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            receipt_path = f"receipts/receipt_{receipt_time}.txt"
-            with open(receipt_path, 'w') as f:
+            path = os.path.splitext(receipt_path(sale_id))[0] + '.txt'
+            with open(path, 'w') as f:
                 f.write(receipt_content)
             # Optionally, implement actual printing here
-            # QMessageBox.information(self, 'Receipt Saved', f"Receipt saved to {receipt_path}")
+            # QMessageBox.information(self, 'Receipt Saved', f"Receipt saved to {path}")
         except Exception as e:
             QMessageBox.critical(self, 'Error', f"Failed to save receipt:\n{str(e)}")
 
@@ -353,9 +274,10 @@ class CashDeskApp(QWidget):
         receipt_window.exec_()
 
 if __name__ == '__main__':
-    initialize_database()
+    # Opening the store creates or migrates the database
+    store = Store(DB_PATH)
     app = QApplication(sys.argv)
     app.setStyle('Fusion')  # Set a modern style
-    window = CashDeskApp()
+    window = CashDeskApp(store)
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
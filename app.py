@@ -1,22 +1,37 @@
 import sys
 import os
-import sqlite3
+import uuid
 import datetime
-import base64
-import pandas as pd
+import sqlite3
+import threading
 import matplotlib.pyplot as plt
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QListWidget, QMessageBox, QSpinBox, QListWidgetItem, QDialog,
     QTextEdit, QTabWidget, QTableWidget, QTableWidgetItem, QFileDialog,
-    QRadioButton, QButtonGroup, QFormLayout
+    QRadioButton, QButtonGroup, QFormLayout, QStackedWidget, QCheckBox, QComboBox
 )
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5 import QtGui
 from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_pdf import PdfPages
+from core import (
+    ArticleChanged, ArticleDeleted, Cart, ChangesMissed, DuplicateBarcodeError, InvalidArticleError, SaleCommitted,
+    StockChanged, cart_summary, format_money, get_store
+)
+from core.reporting import AnalyticsData
+from core.receipts import render_receipt_html, get_receipt_writer
+from core.escpos import configured_printer, print_receipt_escpos
+from core.backup import BackupError, BackupScheduler, backup_database, backup_hours, list_backups, restore_backup
+from core.events import sale_committed
+from core.offline import OFFLINE_ERRORS, JournalInUseError, OutOfSaleIdsError, SalesJournal, SyncAgent, journal_path, write_ahead_enabled
+from core import instrumentation
+from core.instrumentation import span, timed
+from photo_grid import ArticleGridView
+from thumbnails import get_thumbnail_cache
+from photo_store import ingest_photo, is_stored_photo, release_photo
 
 # Ensure images and receipts directories exist
 if not os.path.exists('images'):
@@ -25,74 +40,50 @@ if not os.path.exists('images'):
 if not os.path.exists('receipts'):
     os.makedirs('receipts')
 
-def initialize_database():
-    conn = sqlite3.connect('stock_management.db')
-    cursor = conn.cursor()
-    
-    # Create articles table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS articles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            price REAL NOT NULL,
-            stock INTEGER NOT NULL,
-            photo TEXT
-        )
-    ''')
-    
-    # Create sales table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sales (
-            sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            total REAL NOT NULL,
-            discount REAL NOT NULL,
-            final_total REAL NOT NULL,
-            payment_type TEXT NOT NULL  -- New Column Added
-        )
-    ''')
-    
-    # Create sales_items table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sales_items (
-            sale_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sale_id INTEGER NOT NULL,
-            article_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            price REAL NOT NULL,
-            FOREIGN KEY (sale_id) REFERENCES sales(sale_id),
-            FOREIGN KEY (article_id) REFERENCES articles(id)
-        )
-    ''')
-    
-    # Insert sample data if articles table is empty
-    cursor.execute('SELECT COUNT(*) FROM articles')
-    if cursor.fetchone()[0] == 0:
-        sample_articles = [
-            ('Apple', 0.50, 100, None),
-            ('Banana', 0.30, 150, None),
-            ('Orange', 0.80, 80, None),
-            ('Milk', 1.20, 50, None),
-            ('Bread', 1.00, 60, None),
-        ]
-        cursor.executemany('INSERT INTO articles (name, price, stock, photo) VALUES (?, ?, ?, ?)', sample_articles)
-    
-    conn.commit()
-    conn.close()
+# How often a window checks the database for changes made by other processes
+CHANGE_POLL_MS = 1000
 
-def encode_image_to_base64(image_path):
-    if not os.path.exists(image_path):
-        return ''
-    with open(image_path, 'rb') as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-    return encoded_string
+def watch_changes(widget, store):
+    # Polls the store's change feed for as long as the widget exists. The feed
+    # publishes other processes' changes as the same events our own writes do.
+    store.feed  # Follow from now on
+    def poll():
+        try:
+            store.feed.poll()
+        except OFFLINE_ERRORS:
+            pass  # Caught up with once the database is back
+    timer = QTimer(widget)
+    timer.setInterval(CHANGE_POLL_MS)
+    timer.timeout.connect(poll)
+    timer.start()
+    return timer
+
+# Periods the history and analytics tabs can show. They open on this year,
+# which a default archive run never moves, so archives are read only on request.
+HISTORY_PERIODS = [
+    ('This year', lambda today: datetime.date(today.year, 1, 1)),
+    ('Last 12 months', lambda today: datetime.date(today.year - 1, today.month, 1)),
+    ('All years (reads archives)', lambda today: None),
+]
+
+def period_selector(on_change):
+    combo = QComboBox()
+    for label, _ in HISTORY_PERIODS:
+        combo.addItem(label)
+    combo.currentIndexChanged.connect(lambda index: on_change())
+    return combo
+
+def period_start(combo):
+    return HISTORY_PERIODS[combo.currentIndex()][1](datetime.date.today())
 
 class ReceiptWindow(QDialog):
-    def __init__(self, receipt_content):
+    def __init__(self, receipt_content, receipt=None, thermal_printer=None):
         super().__init__()
         self.setWindowTitle('Receipt')
         self.setGeometry(150, 150, 500, 700)
         self.receipt_content = receipt_content
+        self.receipt = receipt
+        self.thermal_printer = thermal_printer
         self.init_ui()
     
     def init_ui(self):
@@ -129,6 +120,10 @@ class ReceiptWindow(QDialog):
     
     def print_receipt(self):
         try:
+            # Thermal printers get the raw ESC/POS stream directly, no dialog
+            if self.thermal_printer and self.receipt:
+                print_receipt_escpos(self.thermal_printer, self.receipt)
+                return
             printer = QPrinter(QPrinter.HighResolution)
             dialog = QPrintDialog(printer, self)
             if dialog.exec_() == QPrintDialog.Accepted:
@@ -137,6 +132,37 @@ class ReceiptWindow(QDialog):
         except Exception as e:
             QMessageBox.critical(self, 'Print Error', f"An error occurred while printing:\n{str(e)}")
 
+def plot_sales_over_time(axes, data):
+    if data.empty:
+        axes.text(0.5, 0.5, 'No sales data available.', horizontalalignment='center', verticalalignment='center', transform=axes.transAxes)
+    else:
+        data_sorted = data.sort_values('date')
+        axes.plot(data_sorted['date'], data_sorted['final_total'], marker='o', linestyle='-')
+        axes.set_title('Total Sales Over Time')
+        axes.set_xlabel('Date')
+        axes.set_ylabel('Final Total ($)')
+        axes.tick_params(axis='x', rotation=45)
+
+def plot_top_selling_items(axes, data):
+    if data.empty:
+        axes.text(0.5, 0.5, 'No top selling items data available.', horizontalalignment='center', verticalalignment='center', transform=axes.transAxes)
+    else:
+        top_items = data.set_index('name')['quantity']
+        top_items.plot(kind='bar', ax=axes, color='skyblue')
+        axes.set_title('Top Selling Items')
+        axes.set_xlabel('Item')
+        axes.set_ylabel('Quantity Sold')
+        axes.tick_params(axis='x', rotation=45)
+
+def plot_discount_distribution(axes, data):
+    if data.empty:
+        axes.text(0.5, 0.5, 'No discount data available.', horizontalalignment='center', verticalalignment='center', transform=axes.transAxes)
+    else:
+        data['discount'].plot(kind='hist', bins=20, ax=axes, color='salmon')
+        axes.set_title('Discount Distribution')
+        axes.set_xlabel('Discount (%)')
+        axes.set_ylabel('Number of Sales')
+
 class AnalyticsCanvas(FigureCanvas):
     def __init__(self, parent=None, width=5, height=4, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi, tight_layout=True)
@@ -144,54 +170,43 @@ class AnalyticsCanvas(FigureCanvas):
         super().__init__(self.fig)
         self.setParent(parent)
     
-    def plot_sales_over_time(self, data):
+    def _plot(self, plot, data):
         self.axes.clear()
-        if data.empty:
-            self.axes.text(0.5, 0.5, 'No sales data available.', horizontalalignment='center', verticalalignment='center', transform=self.axes.transAxes)
-        else:
-            data_sorted = data.sort_values('date')
-            self.axes.plot(data_sorted['date'], data_sorted['final_total'], marker='o', linestyle='-')
-            self.axes.set_title('Total Sales Over Time')
-            self.axes.set_xlabel('Date')
-            self.axes.set_ylabel('Final Total ($)')
-            self.axes.tick_params(axis='x', rotation=45)
+        plot(self.axes, data)
         self.fig.tight_layout()
         self.draw()
     
+    def plot_sales_over_time(self, data):
+        self._plot(plot_sales_over_time, data)
+    
     def plot_top_selling_items(self, data):
-        self.axes.clear()
-        if data.empty:
-            self.axes.text(0.5, 0.5, 'No top selling items data available.', horizontalalignment='center', verticalalignment='center', transform=self.axes.transAxes)
-        else:
-            top_items = data.set_index('name')['quantity']
-            top_items.plot(kind='bar', ax=self.axes, color='skyblue')
-            self.axes.set_title('Top Selling Items')
-            self.axes.set_xlabel('Item')
-            self.axes.set_ylabel('Quantity Sold')
-            self.axes.tick_params(axis='x', rotation=45)
-        self.fig.tight_layout()
-        self.draw()
+        self._plot(plot_top_selling_items, data)
     
     def plot_discount_distribution(self, data):
-        self.axes.clear()
-        if data.empty:
-            self.axes.text(0.5, 0.5, 'No discount data available.', horizontalalignment='center', verticalalignment='center', transform=self.axes.transAxes)
-        else:
-            data['discount'].plot(kind='hist', bins=20, ax=self.axes, color='salmon')
-            self.axes.set_title('Discount Distribution')
-            self.axes.set_xlabel('Discount (%)')
-            self.axes.set_ylabel('Number of Sales')
-        self.fig.tight_layout()
-        self.draw()
+        self._plot(plot_discount_distribution, data)
 
 class HistoryTab(QWidget):
-    def __init__(self):
+    def __init__(self, store=None):
         super().__init__()
+        self.store = store or get_store()
+        self.total_sellings = 0
+        # Sales shown; the change feed can report one again
+        self.added_sale_ids = set()
         self.init_ui()
+        self.store.events.subscribe(SaleCommitted, self.on_sale_committed)
+        self.store.events.subscribe(ChangesMissed, lambda event: self.load_history())
     
     def init_ui(self):
         layout = QVBoxLayout()
         
+        # Period shown; older years are read from the archives only when chosen
+        period_layout = QHBoxLayout()
+        period_layout.addWidget(QLabel('Show:'))
+        self.period = period_selector(self.load_history)
+        period_layout.addWidget(self.period)
+        period_layout.addStretch()
+        layout.addLayout(period_layout)
+        
         # Table to display sales history
         self.table = QTableWidget()
         self.table.setColumnCount(6)
@@ -200,8 +215,8 @@ class HistoryTab(QWidget):
         self.table.setEditTriggers(QTableWidget.NoEditTriggers)
         layout.addWidget(self.table)
         
-        # QLabel to display the total of all sellings
-        self.total_label = QLabel('Total of All Sellings: $0.00')
+        # QLabel to display the total of the sellings shown
+        self.total_label = QLabel('Total of Sellings: $0.00')
         self.total_label.setAlignment(Qt.AlignRight)
         self.total_label.setStyleSheet("font-size: 16px; font-weight: bold;")
         layout.addWidget(self.total_label)
@@ -216,45 +231,41 @@ class HistoryTab(QWidget):
         self.setLayout(layout)
         self.load_history()
     
+    @timed('load_history')
     def load_history(self):
-        conn = sqlite3.connect('stock_management.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT sale_id, date, total, discount, final_total, payment_type FROM sales ORDER BY date DESC')
-        sales = cursor.fetchall()
-        conn.close()
+        sales, self.total_sellings = self.store.sales_history(since=period_start(self.period))
+        # The change feed can still report sales this load already has
+        self.added_sale_ids = {sale[0] for sale in sales}
         
         self.table.setRowCount(len(sales))
-        total_sellings = 0  # Initialize total
-        
         for row_idx, sale in enumerate(sales):
-            for col_idx, item in enumerate(sale):
-                table_item = QTableWidgetItem(str(item))
-                table_item.setTextAlignment(Qt.AlignCenter)
-                self.table.setItem(row_idx, col_idx, table_item)
-            # Accumulate the final_total for each sale
-            try:
-                final_total = float(sale[4])  # sale[4] corresponds to 'final_total'
-                total_sellings += final_total
-            except (ValueError, TypeError):
-                # Handle cases where conversion to float fails
-                pass
+            self.set_row(row_idx, sale)
         
         # Update the total_label with the calculated total
-        self.total_label.setText(f'Total of All Sellings: ${total_sellings:.2f}')
+        self.update_total()
+    
+    def set_row(self, row_idx, sale):
+        for col_idx, item in enumerate(sale):
+            table_item = QTableWidgetItem(str(item))
+            table_item.setTextAlignment(Qt.AlignCenter)
+            self.table.setItem(row_idx, col_idx, table_item)
+    
+    def update_total(self):
+        self.total_label.setText(f'Total of Sellings: ${self.total_sellings:.2f}')
+    
+    def on_sale_committed(self, event):
+        if event.sale[0] in self.added_sale_ids:
+            return
+        self.added_sale_ids.add(event.sale[0])
+        # Newest first, as load_history orders them
+        self.table.insertRow(0)
+        self.set_row(0, event.sale)
+        self.total_sellings += event.sale[4]
+        self.update_total()
     
     def export_history_csv(self):
         try:
-            conn = sqlite3.connect('stock_management.db')
-            query = '''
-                SELECT sales.sale_id, sales.date, sales.total, sales.discount, sales.final_total, sales.payment_type,
-                       articles.name, sales_items.quantity, sales_items.price
-                FROM sales
-                JOIN sales_items ON sales.sale_id = sales_items.sale_id
-                JOIN articles ON sales_items.article_id = articles.id
-                ORDER BY sales.date DESC
-            '''
-            df = pd.read_sql_query(query, conn)
-            conn.close()
+            df = self.store.history_export(since=period_start(self.period))
             
             # Save to CSV
             options = QFileDialog.Options()
@@ -266,20 +277,36 @@ class HistoryTab(QWidget):
             QMessageBox.critical(self, 'Export Error', f"An error occurred while exporting history:\n{str(e)}")
 
 class AnalyticsTab(QWidget):
-    def __init__(self):
+    canvas_class = AnalyticsCanvas
+    
+    def __init__(self, store=None):
         super().__init__()
+        self.store = store or get_store()
+        self.data = None
+        # Sales committed while the tab is open are drawn once they stop arriving
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(500)
+        self.redraw_timer.timeout.connect(self.redraw)
         self.init_ui()
+        self.store.events.subscribe(SaleCommitted, self.on_sale_committed)
+        self.store.events.subscribe(ChangesMissed, lambda event: self.load_analytics())
     
     def init_ui(self):
         layout = QVBoxLayout()
         
         # Analytics Canvas
-        self.canvas = AnalyticsCanvas(self, width=8, height=6, dpi=100)
+        self.canvas = self.canvas_class(self, width=8, height=6, dpi=100)
         layout.addWidget(self.canvas)
         
         # Buttons Layout
         buttons_layout = QHBoxLayout()
         
+        # Period shown; older years are read from the archives only when chosen
+        buttons_layout.addWidget(QLabel('Show:'))
+        self.period = period_selector(self.load_analytics)
+        buttons_layout.addWidget(self.period)
+        
         # Export Button
         export_btn = QPushButton('Export Analytics as PDF')
         export_btn.setFixedHeight(40)
@@ -291,7 +318,7 @@ class AnalyticsTab(QWidget):
         refresh_btn = QPushButton('Refresh Analytics')
         refresh_btn.setFixedHeight(40)
         refresh_btn.setStyleSheet("background-color: #FF9800; color: white; font-size: 14px;")
-        refresh_btn.clicked.connect(self.load_analytics)
+        refresh_btn.clicked.connect(lambda: self.load_analytics())
         buttons_layout.addWidget(refresh_btn)
         
         buttons_layout.addStretch()
@@ -300,132 +327,60 @@ class AnalyticsTab(QWidget):
         self.setLayout(layout)
         self.load_analytics()
     
+    @timed('load_analytics')
     def load_analytics(self):
-        conn = sqlite3.connect('stock_management.db')
-        cursor = conn.cursor()
-        
-        # Total Sales Over Time
-        cursor.execute('SELECT date, final_total FROM sales')
-        sales_over_time = cursor.fetchall()
-        df_sales_time = pd.DataFrame(sales_over_time, columns=['date', 'final_total'])
-        df_sales_time['date'] = pd.to_datetime(df_sales_time['date'])
-        df_sales_time['final_total'] = pd.to_numeric(df_sales_time['final_total'], errors='coerce')
-        print("Sales Over Time DataFrame:")
-        print(df_sales_time.head())
-        print(df_sales_time.dtypes)
-        
-        # Top Selling Items
-        cursor.execute('''
-            SELECT articles.name, SUM(sales_items.quantity) as quantity
-            FROM sales_items
-            JOIN articles ON sales_items.article_id = articles.id
-            GROUP BY articles.name
-            ORDER BY quantity DESC
-            LIMIT 10
-        ''')
-        top_selling = cursor.fetchall()
-        df_top_selling = pd.DataFrame(top_selling, columns=['name', 'quantity'])
-        df_top_selling['quantity'] = pd.to_numeric(df_top_selling['quantity'], errors='coerce')
-        print("Top Selling Items DataFrame:")
-        print(df_top_selling.head())
-        print(df_top_selling.dtypes)
-        
-        # Discount Distribution
-        cursor.execute('SELECT discount FROM sales')
-        discounts = cursor.fetchall()
-        df_discounts = pd.DataFrame(discounts, columns=['discount'])
-        df_discounts['discount'] = pd.to_numeric(df_discounts['discount'], errors='coerce')
-        print("Discount Distribution DataFrame:")
-        print(df_discounts.head())
-        print(df_discounts.dtypes)
-        
-        conn.close()
-        
-        # Plotting
-        self.canvas.plot_sales_over_time(df_sales_time)
-        self.canvas.plot_top_selling_items(df_top_selling)
-        self.canvas.plot_discount_distribution(df_discounts)
+        self.data = AnalyticsData.load(self.store, since=period_start(self.period))
+        self.redraw()
+    
+    def redraw(self):
+        self.canvas.plot_sales_over_time(self.data.sales_over_time())
+        self.canvas.plot_top_selling_items(self.data.top_selling_items())
+        self.canvas.plot_discount_distribution(self.data.discount_distribution())
+    
+    def on_sale_committed(self, event):
+        # Added to the loaded data; drawn now if the tab is showing, otherwise when it is shown
+        if not self.data.add_sale(event.sale, event.items):
+            return
+        if self.isVisible():
+            self.redraw_timer.start()
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.data.has_pending():
+            self.redraw()
     
     def export_analytics_pdf(self):
         try:
             options = QFileDialog.Options()
             file_path, _ = QFileDialog.getSaveFileName(self, "Save Analytics as PDF", "", "PDF Files (*.pdf)", options=options)
             if file_path:
+                pages = [
+                    (plot_sales_over_time, self.data.sales_over_time()),
+                    (plot_top_selling_items, self.data.top_selling_items()),
+                    (plot_discount_distribution, self.data.discount_distribution()),
+                ]
                 with PdfPages(file_path) as pdf:
-                    # Plot Sales Over Time
-                    fig1 = Figure(figsize=(8,6))
-                    ax1 = fig1.add_subplot(111)
-                    conn = sqlite3.connect('stock_management.db')
-                    query = 'SELECT date, final_total FROM sales'
-                    df = pd.read_sql_query(query, conn)
-                    conn.close()
-                    df['date'] = pd.to_datetime(df['date'])
-                    df_sorted = df.sort_values('date')
-                    df_sorted['final_total'] = pd.to_numeric(df_sorted['final_total'], errors='coerce')
-                    ax1.plot(df_sorted['date'], df_sorted['final_total'], marker='o', linestyle='-')
-                    ax1.set_title('Total Sales Over Time')
-                    ax1.set_xlabel('Date')
-                    ax1.set_ylabel('Final Total ($)')
-                    ax1.tick_params(axis='x', rotation=45)
-                    fig1.tight_layout()
-                    pdf.savefig(fig1)
-                    plt.close(fig1)
-                    
-                    # Plot Top Selling Items
-                    fig2 = Figure(figsize=(8,6))
-                    ax2 = fig2.add_subplot(111)
-                    conn = sqlite3.connect('stock_management.db')
-                    query = '''
-                        SELECT articles.name, SUM(sales_items.quantity) as quantity
-                        FROM sales_items
-                        JOIN articles ON sales_items.article_id = articles.id
-                        GROUP BY articles.name
-                        ORDER BY quantity DESC
-                        LIMIT 10
-                    '''
-                    df_top = pd.read_sql_query(query, conn)
-                    conn.close()
-                    df_top['quantity'] = pd.to_numeric(df_top['quantity'], errors='coerce')
-                    if df_top.empty:
-                        ax2.text(0.5, 0.5, 'No top selling items data available.', horizontalalignment='center', verticalalignment='center', transform=ax2.transAxes)
-                    else:
-                        top_items = df_top.set_index('name')['quantity']
-                        top_items.plot(kind='bar', ax=ax2, color='skyblue')
-                        ax2.set_title('Top Selling Items')
-                        ax2.set_xlabel('Item')
-                        ax2.set_ylabel('Quantity Sold')
-                        ax2.tick_params(axis='x', rotation=45)
-                    fig2.tight_layout()
-                    pdf.savefig(fig2)
-                    plt.close(fig2)
-                    
-                    # Plot Discount Distribution
-                    fig3 = Figure(figsize=(8,6))
-                    ax3 = fig3.add_subplot(111)
-                    conn = sqlite3.connect('stock_management.db')
-                    query = 'SELECT discount FROM sales'
-                    df_discount = pd.read_sql_query(query, conn)
-                    conn.close()
-                    df_discount['discount'] = pd.to_numeric(df_discount['discount'], errors='coerce')
-                    if df_discount.empty:
-                        ax3.text(0.5, 0.5, 'No discount data available.', horizontalalignment='center', verticalalignment='center', transform=ax3.transAxes)
-                    else:
-                        df_discount['discount'].plot(kind='hist', bins=20, ax=ax3, color='salmon')
-                        ax3.set_title('Discount Distribution')
-                        ax3.set_xlabel('Discount (%)')
-                        ax3.set_ylabel('Number of Sales')
-                    fig3.tight_layout()
-                    pdf.savefig(fig3)
-                    plt.close(fig3)
+                    for plot, data in pages:
+                        fig = Figure(figsize=(8,6))
+                        plot(fig.add_subplot(111), data)
+                        fig.tight_layout()
+                        pdf.savefig(fig)
+                        plt.close(fig)
                 
                 QMessageBox.information(self, 'Export Successful', f"Analytics exported to {file_path}")
         except Exception as e:
             QMessageBox.critical(self, 'Export Error', f"An error occurred while exporting analytics:\n{str(e)}")
 
 class ArticleManagementTab(QWidget):
-    def __init__(self):
+    def __init__(self, store=None):
         super().__init__()
+        self.store = store or get_store()
+        self.table_rows = {}  # article id -> row in the table
         self.init_ui()
+        self.store.events.subscribe(ArticleChanged, self.on_article_changed)
+        self.store.events.subscribe(ArticleDeleted, self.on_article_deleted)
+        self.store.events.subscribe(StockChanged, self.on_stock_changed)
+        self.store.events.subscribe(ChangesMissed, lambda event: self.load_articles())
     
     def init_ui(self):
         layout = QVBoxLayout()
@@ -445,6 +400,14 @@ class ArticleManagementTab(QWidget):
         self.stock_input.setMaximum(1000000)
         form_layout.addRow('Stock:', self.stock_input)
         
+        self.barcode_input = QLineEdit()
+        self.barcode_input.setPlaceholderText('Optional barcode / SKU')
+        form_layout.addRow('Barcode:', self.barcode_input)
+        
+        self.category_input = QLineEdit()
+        self.category_input.setPlaceholderText('Optional, used by category promotions')
+        form_layout.addRow('Category:', self.category_input)
+        
         self.photo_path = ''
         self.photo_label = QLabel('No Photo Selected')
         self.photo_label.setAlignment(Qt.AlignCenter)
@@ -479,8 +442,8 @@ class ArticleManagementTab(QWidget):
         
         # Table to Display Articles
         self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(['ID', 'Name', 'Price ($)', 'Stock', 'Photo'])
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels(['ID', 'Name', 'Price ($)', 'Stock', 'Photo', 'Barcode', 'Category'])
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setEditTriggers(QTableWidget.NoEditTriggers)
         self.table.setSelectionBehavior(QTableWidget.SelectRows)
@@ -503,14 +466,16 @@ class ArticleManagementTab(QWidget):
         if file_path:
             self.photo_path = file_path
             # Display the photo in the label
-            pixmap = QtGui.QPixmap(file_path)
-            pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.photo_label.setPixmap(pixmap)
+            pixmap = get_thumbnail_cache().pixmap(file_path)
+            if pixmap:
+                self.photo_label.setPixmap(pixmap)
     
     def add_article(self):
         name = self.name_input.text().strip()
         price = self.price_input.text().strip()
         stock = self.stock_input.value()
+        barcode = self.barcode_input.text().strip() or None
+        category = self.category_input.text().strip() or None
         photo = self.photo_path
         
         if not name or not price:
@@ -525,12 +490,9 @@ class ArticleManagementTab(QWidget):
         
         # Handle photo
         if photo:
-            # Copy the photo to the images directory
-            photo_filename = os.path.basename(photo)
-            destination = os.path.join('images', photo_filename)
+            # Store a normalised copy under its content hash
             try:
-                if not os.path.exists(destination):
-                    os.rename(photo, destination)
+                destination = ingest_photo(photo)
             except Exception as e:
                 QMessageBox.critical(self, 'Photo Error', f"Failed to upload photo:\n{str(e)}")
                 return
@@ -539,53 +501,69 @@ class ArticleManagementTab(QWidget):
         
         # Insert into database
         try:
-            conn = sqlite3.connect('stock_management.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO articles (name, price, stock, photo)
-                VALUES (?, ?, ?, ?)
-            ''', (name, price, stock, destination))
-            conn.commit()
-            conn.close()
+            self.store.add_article(name, price, stock, destination, barcode, category)
             QMessageBox.information(self, 'Success', 'Article added successfully.')
             self.clear_form()
-            self.load_articles()
+        except (DuplicateBarcodeError, InvalidArticleError) as e:
+            QMessageBox.warning(self, 'Input Error', str(e))
         except Exception as e:
             QMessageBox.critical(self, 'Database Error', f"An error occurred while adding the article:\n{str(e)}")
     
     def load_articles(self):
-        conn = sqlite3.connect('stock_management.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, price, stock, photo FROM articles')
-        articles = cursor.fetchall()
-        conn.close()
+        articles = self.store.list_articles()
         
         self.table.setRowCount(len(articles))
+        self.table_rows = {}
         for row_idx, article in enumerate(articles):
-            for col_idx, item in enumerate(article):
-                if col_idx == 4 and item:
-                    # Display photo as text (file path)
-                    table_item = QTableWidgetItem(os.path.basename(item))
-                else:
-                    table_item = QTableWidgetItem(str(item))
-                table_item.setTextAlignment(Qt.AlignCenter)
-                self.table.setItem(row_idx, col_idx, table_item)
+            self.set_row(row_idx, article)
+    
+    def set_row(self, row_idx, article):
+        self.table_rows[article[0]] = row_idx
+        for col_idx, item in enumerate(article):
+            self.set_cell(row_idx, col_idx, item)
+    
+    def set_cell(self, row_idx, col_idx, item):
+        if col_idx == 4 and item:
+            # Display photo as text (file path)
+            table_item = QTableWidgetItem(os.path.basename(item))
+        elif item is None:
+            table_item = QTableWidgetItem('')
+        else:
+            table_item = QTableWidgetItem(str(item))
+        table_item.setTextAlignment(Qt.AlignCenter)
+        self.table.setItem(row_idx, col_idx, table_item)
+    
+    def on_article_changed(self, event):
+        row_idx = self.table_rows.get(event.article.id)
+        if row_idx is None:
+            row_idx = self.table.rowCount()
+            self.table.insertRow(row_idx)
+        self.set_row(row_idx, event.article)
+    
+    def on_article_deleted(self, event):
+        row_idx = self.table_rows.pop(event.article_id, None)
+        if row_idx is None:
+            return
+        self.table.removeRow(row_idx)
+        self.table_rows = {article_id: row - 1 if row > row_idx else row for article_id, row in self.table_rows.items()}
+    
+    def on_stock_changed(self, event):
+        row_idx = self.table_rows.get(event.article_id)
+        if row_idx is not None:
+            self.set_cell(row_idx, 3, event.stock)
     
     def load_article_details(self, row, column):
-        conn = sqlite3.connect('stock_management.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, price, stock, photo FROM articles WHERE id = ?', (self.table.item(row, 0).text(),))
-        article = cursor.fetchone()
-        conn.close()
+        article = self.store.get_article(int(self.table.item(row, 0).text()))
         
         if article:
             self.name_input.setText(article[1])
             self.price_input.setText(str(article[2]))
             self.stock_input.setValue(article[3])
+            self.barcode_input.setText(article[5] or '')
+            self.category_input.setText(article[6] or '')
             photo = article[4]
-            if photo and os.path.exists(photo):
-                pixmap = QtGui.QPixmap(photo)
-                pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            pixmap = get_thumbnail_cache().pixmap(photo) if photo else None
+            if pixmap:
                 self.photo_label.setPixmap(pixmap)
                 self.photo_path = photo
             else:
@@ -598,10 +576,12 @@ class ArticleManagementTab(QWidget):
             QMessageBox.warning(self, 'Selection Error', 'Please select an article to edit.')
             return
         
-        article_id = selected_items[0].text()
+        article_id = int(selected_items[0].text())
         name = self.name_input.text().strip()
         price = self.price_input.text().strip()
         stock = self.stock_input.value()
+        barcode = self.barcode_input.text().strip() or None
+        category = self.category_input.text().strip() or None
         photo = self.photo_path
         
         if not name or not price:
@@ -616,13 +596,10 @@ class ArticleManagementTab(QWidget):
         
         # Handle photo
         if photo:
-            # Copy the photo to the images directory if it's a new photo
-            if not photo.startswith(os.path.abspath('images')):
-                photo_filename = os.path.basename(photo)
-                destination = os.path.join('images', photo_filename)
+            # Store the photo if it's a new one
+            if not is_stored_photo(photo):
                 try:
-                    if not os.path.exists(destination):
-                        os.rename(photo, destination)
+                    destination = ingest_photo(photo)
                 except Exception as e:
                     QMessageBox.critical(self, 'Photo Error', f"Failed to upload photo:\n{str(e)}")
                     return
@@ -633,18 +610,13 @@ class ArticleManagementTab(QWidget):
         
         # Update database
         try:
-            conn = sqlite3.connect('stock_management.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE articles
-                SET name = ?, price = ?, stock = ?, photo = ?
-                WHERE id = ?
-            ''', (name, price, stock, destination, article_id))
-            conn.commit()
-            conn.close()
+            old_photo = self.store.update_article(article_id, name, price, stock, destination, barcode, category)
+            if old_photo != destination:
+                release_photo(self.store, old_photo)
             QMessageBox.information(self, 'Success', 'Article updated successfully.')
             self.clear_form()
-            self.load_articles()
+        except (DuplicateBarcodeError, InvalidArticleError) as e:
+            QMessageBox.warning(self, 'Input Error', str(e))
         except Exception as e:
             QMessageBox.critical(self, 'Database Error', f"An error occurred while updating the article:\n{str(e)}")
     
@@ -654,7 +626,7 @@ class ArticleManagementTab(QWidget):
             QMessageBox.warning(self, 'Selection Error', 'Please select an article to delete.')
             return
         
-        article_id = selected_items[0].text()
+        article_id = int(selected_items[0].text())
         reply = QMessageBox.question(
             self,
             'Confirm Deletion',
@@ -665,23 +637,13 @@ class ArticleManagementTab(QWidget):
         
         if reply == QMessageBox.Yes:
             try:
-                # Get photo path to delete the image file
-                conn = sqlite3.connect('stock_management.db')
-                cursor = conn.cursor()
-                cursor.execute('SELECT photo FROM articles WHERE id = ?', (article_id,))
-                result = cursor.fetchone()
-                photo = result[0] if result else None
-                cursor.execute('DELETE FROM articles WHERE id = ?', (article_id,))
-                conn.commit()
-                conn.close()
+                photo = self.store.delete_article(article_id)
                 
-                # Delete the photo file if it exists
-                if photo and os.path.exists(photo):
-                    os.remove(photo)
+                # Delete the photo file unless another article still uses it
+                release_photo(self.store, photo)
                 
                 QMessageBox.information(self, 'Success', 'Article deleted successfully.')
                 self.clear_form()
-                self.load_articles()
             except Exception as e:
                 QMessageBox.critical(self, 'Database Error', f"An error occurred while deleting the article:\n{str(e)}")
     
@@ -689,15 +651,14 @@ class ArticleManagementTab(QWidget):
         self.name_input.clear()
         self.price_input.clear()
         self.stock_input.setValue(0)
+        self.barcode_input.clear()
+        self.category_input.clear()
         self.photo_label.setText('No Photo Selected')
         self.photo_path = ''
     
     def export_articles_csv(self):
         try:
-            conn = sqlite3.connect('stock_management.db')
-            query = 'SELECT id, name, price, stock, photo FROM articles'
-            df = pd.read_sql_query(query, conn)
-            conn.close()
+            df = self.store.articles_export()
             
             # Save to CSV
             options = QFileDialog.Options()
@@ -708,232 +669,219 @@ class ArticleManagementTab(QWidget):
         except Exception as e:
             QMessageBox.critical(self, 'Export Error', f"An error occurred while exporting articles:\n{str(e)}")
 
-class AnalyticsCanvasEnhanced(FigureCanvas):
-    def __init__(self, parent=None, width=5, height=4, dpi=100):
-        self.fig = Figure(figsize=(width, height), dpi=dpi, tight_layout=True)
-        self.axes = self.fig.add_subplot(111)
-        super().__init__(self.fig)
-        self.setParent(parent)
+class AnalyticsCanvasEnhanced(AnalyticsCanvas):
+    pass
+
+class AnalyticsTabEnhanced(AnalyticsTab):
+    canvas_class = AnalyticsCanvasEnhanced
+
+class DiagnosticsTab(QWidget):
+    # Rolling latency percentiles of the timed operations on this till
+    COLUMNS = ['Operation', 'Calls', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'Max (ms)']
     
-    def plot_sales_over_time(self, data):
-        self.axes.clear()
-        if data.empty:
-            self.axes.text(0.5, 0.5, 'No sales data available.', horizontalalignment='center', verticalalignment='center', transform=self.axes.transAxes)
-        else:
-            data_sorted = data.sort_values('date')
-            self.axes.plot(data_sorted['date'], data_sorted['final_total'], marker='o', linestyle='-')
-            self.axes.set_title('Total Sales Over Time')
-            self.axes.set_xlabel('Date')
-            self.axes.set_ylabel('Final Total ($)')
-            self.axes.tick_params(axis='x', rotation=45)
-        self.fig.tight_layout()
-        self.draw()
+    def __init__(self):
+        super().__init__()
+        self.init_ui()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(2000)
+        self.refresh_timer.timeout.connect(self.refresh)
     
-    def plot_top_selling_items(self, data):
-        self.axes.clear()
-        if data.empty:
-            self.axes.text(0.5, 0.5, 'No top selling items data available.', horizontalalignment='center', verticalalignment='center', transform=self.axes.transAxes)
-        else:
-            top_items = data.set_index('name')['quantity']
-            top_items.plot(kind='bar', ax=self.axes, color='skyblue')
-            self.axes.set_title('Top Selling Items')
-            self.axes.set_xlabel('Item')
-            self.axes.set_ylabel('Quantity Sold')
-            self.axes.tick_params(axis='x', rotation=45)
-        self.fig.tight_layout()
-        self.draw()
+    def init_ui(self):
+        layout = QVBoxLayout()
+        
+        controls_layout = QHBoxLayout()
+        self.enabled_checkbox = QCheckBox('Record timings')
+        self.enabled_checkbox.setChecked(instrumentation.is_enabled())
+        self.enabled_checkbox.toggled.connect(instrumentation.set_enabled)
+        controls_layout.addWidget(self.enabled_checkbox)
+        reset_btn = QPushButton('Reset')
+        reset_btn.clicked.connect(self.reset)
+        controls_layout.addWidget(reset_btn)
+        controls_layout.addStretch()
+        layout.addLayout(controls_layout)
+        
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+        
+        self.setLayout(layout)
     
-    def plot_discount_distribution(self, data):
-        self.axes.clear()
-        if data.empty:
-            self.axes.text(0.5, 0.5, 'No discount data available.', horizontalalignment='center', verticalalignment='center', transform=self.axes.transAxes)
-        else:
-            data['discount'].plot(kind='hist', bins=20, ax=self.axes, color='salmon')
-            self.axes.set_title('Discount Distribution')
-            self.axes.set_xlabel('Discount (%)')
-            self.axes.set_ylabel('Number of Sales')
-        self.fig.tight_layout()
-        self.draw()
+    def showEvent(self, event):
+        # Only refreshes while the tab is on screen
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+    
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.refresh_timer.stop()
+    
+    def refresh(self):
+        stats = sorted(instrumentation.snapshot().items())
+        self.table.setRowCount(len(stats))
+        for row_idx, (name, summary) in enumerate(stats):
+            values = [name, str(summary['count'])] + [
+                f"{summary[key] * 1000:.2f}" for key in ('p50', 'p95', 'p99', 'max')
+            ]
+            for col_idx, value in enumerate(values):
+                table_item = QTableWidgetItem(value)
+                table_item.setTextAlignment(Qt.AlignCenter)
+                self.table.setItem(row_idx, col_idx, table_item)
+    
+    def reset(self):
+        instrumentation.reset()
+        self.refresh()
 
-class AnalyticsTabEnhanced(QWidget):
-    def __init__(self):
+class BackupTab(QWidget):
+    # Backs up the local database on a background thread, lists the backups and
+    # restores one, also in the background. With CASHIER_BACKUP_HOURS set,
+    # backups are also scheduled.
+    backup_finished = pyqtSignal(object, object)  # path, error
+    restore_finished = pyqtSignal(object, object)  # pre-restore backup's path, error
+    
+    def __init__(self, store):
         super().__init__()
+        self.store = store
+        self.restoring = False
+        self.backup_finished.connect(lambda path, error: self.on_backup_finished(path, error))
+        self.restore_finished.connect(lambda saved, error: self.on_restore_finished(saved, error))
         self.init_ui()
+        self.scheduler = None
+        hours = backup_hours()
+        if hours:
+            self.scheduler = BackupScheduler(self.store.db_path, hours, on_report=self.backup_finished.emit)
+            self.scheduler.start()
     
     def init_ui(self):
         layout = QVBoxLayout()
         
-        # Enhanced Analytics Canvas
-        self.canvas = AnalyticsCanvasEnhanced(self, width=8, height=6, dpi=100)
-        layout.addWidget(self.canvas)
+        self.backups_list = QListWidget()
+        layout.addWidget(self.backups_list)
         
-        # Buttons Layout
-        buttons_layout = QHBoxLayout()
+        self.status_label = QLabel('')
+        layout.addWidget(self.status_label)
         
-        # Export Button
-        export_btn = QPushButton('Export Analytics as PDF')
-        export_btn.setFixedHeight(40)
-        export_btn.setStyleSheet("background-color: #4CAF50; color: white; font-size: 14px;")
-        export_btn.clicked.connect(self.export_analytics_pdf)
-        buttons_layout.addWidget(export_btn)
-        
-        # Refresh Button
-        refresh_btn = QPushButton('Refresh Analytics')
-        refresh_btn.setFixedHeight(40)
-        refresh_btn.setStyleSheet("background-color: #FF9800; color: white; font-size: 14px;")
-        refresh_btn.clicked.connect(self.load_analytics)
-        buttons_layout.addWidget(refresh_btn)
+        buttons_layout = QHBoxLayout()
+        self.backup_btn = QPushButton('Back Up Now')
+        self.backup_btn.setFixedHeight(40)
+        self.backup_btn.setStyleSheet("background-color: #3F51B5; color: white; font-size: 14px;")
+        self.backup_btn.clicked.connect(self.back_up_now)
+        buttons_layout.addWidget(self.backup_btn)
+        
+        self.restore_btn = QPushButton('Restore Selected Backup')
+        self.restore_btn.setFixedHeight(40)
+        self.restore_btn.setStyleSheet("background-color: #f44336; color: white; font-size: 14px;")
+        self.restore_btn.clicked.connect(self.restore_selected)
+        buttons_layout.addWidget(self.restore_btn)
         
         buttons_layout.addStretch()
         layout.addLayout(buttons_layout)
         
         self.setLayout(layout)
-        self.load_analytics()
+        self.load_backups()
+    
+    def load_backups(self):
+        self.backups_list.clear()
+        for path in list_backups(self.store.db_path):
+            item = QListWidgetItem(f"{os.path.basename(path)}  ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+            item.setData(Qt.UserRole, path)
+            self.backups_list.addItem(item)
+    
+    def set_buttons_enabled(self, enabled):
+        self.backup_btn.setEnabled(enabled)
+        self.restore_btn.setEnabled(enabled)
+    
+    def back_up_now(self):
+        self.set_buttons_enabled(False)
+        self.status_label.setText('Backing up...')
+        threading.Thread(target=self.run_backup, name='backup', daemon=True).start()
+    
+    def run_backup(self):
+        # On the backup thread; the result reaches the GUI through backup_finished
+        try:
+            path = backup_database(self.store.db_path)
+        except (OSError, sqlite3.Error, BackupError) as e:
+            self.backup_finished.emit(None, e)
+        else:
+            self.backup_finished.emit(path, None)
     
-    def load_analytics(self):
-        conn = sqlite3.connect('stock_management.db')
-        cursor = conn.cursor()
-        
-        # Total Sales Over Time
-        cursor.execute('SELECT date, final_total FROM sales')
-        sales_over_time = cursor.fetchall()
-        df_sales_time = pd.DataFrame(sales_over_time, columns=['date', 'final_total'])
-        df_sales_time['date'] = pd.to_datetime(df_sales_time['date'])
-        df_sales_time['final_total'] = pd.to_numeric(df_sales_time['final_total'], errors='coerce')
-        print("Sales Over Time DataFrame:")
-        print(df_sales_time.head())
-        print(df_sales_time.dtypes)
-        
-        # Top Selling Items
-        cursor.execute('''
-            SELECT articles.name, SUM(sales_items.quantity) as quantity
-            FROM sales_items
-            JOIN articles ON sales_items.article_id = articles.id
-            GROUP BY articles.name
-            ORDER BY quantity DESC
-            LIMIT 10
-        ''')
-        top_selling = cursor.fetchall()
-        df_top_selling = pd.DataFrame(top_selling, columns=['name', 'quantity'])
-        df_top_selling['quantity'] = pd.to_numeric(df_top_selling['quantity'], errors='coerce')
-        print("Top Selling Items DataFrame:")
-        print(df_top_selling.head())
-        print(df_top_selling.dtypes)
-        
-        # Discount Distribution
-        cursor.execute('SELECT discount FROM sales')
-        discounts = cursor.fetchall()
-        df_discounts = pd.DataFrame(discounts, columns=['discount'])
-        df_discounts['discount'] = pd.to_numeric(df_discounts['discount'], errors='coerce')
-        print("Discount Distribution DataFrame:")
-        print(df_discounts.head())
-        print(df_discounts.dtypes)
-        
-        conn.close()
-        
-        # Plotting
-        self.canvas.plot_sales_over_time(df_sales_time)
-        self.canvas.plot_top_selling_items(df_top_selling)
-        self.canvas.plot_discount_distribution(df_discounts)
+    def on_backup_finished(self, path, error):
+        # A scheduled backup can finish while a restore is still running
+        self.set_buttons_enabled(not self.restoring)
+        if error is not None:
+            self.status_label.setText(f"Backup failed: {error}")
+        else:
+            self.status_label.setText(f"Backed up to {path}")
+        self.load_backups()
     
-    def export_analytics_pdf(self):
+    def restore_selected(self):
+        item = self.backups_list.currentItem()
+        if not item:
+            QMessageBox.warning(self, 'No Selection', 'Please select a backup to restore.')
+            return
+        path = item.data(Qt.UserRole)
+        reply = QMessageBox.question(
+            self, 'Confirm Restore',
+            f"Replace the database with {os.path.basename(path)}?\n\nThe database as it is now is backed up first.",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        self.restoring = True
+        self.set_buttons_enabled(False)
+        self.status_label.setText('Restoring...')
+        threading.Thread(target=self.run_restore, args=(path,), name='restore', daemon=True).start()
+    
+    def run_restore(self, path):
+        # On the restore thread; the result reaches the GUI through restore_finished
         try:
-            options = QFileDialog.Options()
-            file_path, _ = QFileDialog.getSaveFileName(self, "Save Analytics as PDF", "", "PDF Files (*.pdf)", options=options)
-            if file_path:
-                with PdfPages(file_path) as pdf:
-                    # Plot Sales Over Time
-                    fig1 = Figure(figsize=(8,6))
-                    ax1 = fig1.add_subplot(111)
-                    conn = sqlite3.connect('stock_management.db')
-                    query = 'SELECT date, final_total FROM sales'
-                    df = pd.read_sql_query(query, conn)
-                    conn.close()
-                    df['date'] = pd.to_datetime(df['date'])
-                    df_sorted = df.sort_values('date')
-                    df_sorted['final_total'] = pd.to_numeric(df_sorted['final_total'], errors='coerce')
-                    ax1.plot(df_sorted['date'], df_sorted['final_total'], marker='o', linestyle='-')
-                    ax1.set_title('Total Sales Over Time')
-                    ax1.set_xlabel('Date')
-                    ax1.set_ylabel('Final Total ($)')
-                    ax1.tick_params(axis='x', rotation=45)
-                    fig1.tight_layout()
-                    pdf.savefig(fig1)
-                    plt.close(fig1)
-                    
-                    # Plot Top Selling Items
-                    fig2 = Figure(figsize=(8,6))
-                    ax2 = fig2.add_subplot(111)
-                    conn = sqlite3.connect('stock_management.db')
-                    query = '''
-                        SELECT articles.name, SUM(sales_items.quantity) as quantity
-                        FROM sales_items
-                        JOIN articles ON sales_items.article_id = articles.id
-                        GROUP BY articles.name
-                        ORDER BY quantity DESC
-                        LIMIT 10
-                    '''
-                    df_top = pd.read_sql_query(query, conn)
-                    conn.close()
-                    df_top['quantity'] = pd.to_numeric(df_top['quantity'], errors='coerce')
-                    if df_top.empty:
-                        ax2.text(0.5, 0.5, 'No top selling items data available.', horizontalalignment='center', verticalalignment='center', transform=ax2.transAxes)
-                    else:
-                        top_items = df_top.set_index('name')['quantity']
-                        top_items.plot(kind='bar', ax=ax2, color='skyblue')
-                        ax2.set_title('Top Selling Items')
-                        ax2.set_xlabel('Item')
-                        ax2.set_ylabel('Quantity Sold')
-                        ax2.tick_params(axis='x', rotation=45)
-                    fig2.tight_layout()
-                    pdf.savefig(fig2)
-                    plt.close(fig2)
-                    
-                    # Plot Discount Distribution
-                    fig3 = Figure(figsize=(8,6))
-                    ax3 = fig3.add_subplot(111)
-                    conn = sqlite3.connect('stock_management.db')
-                    query = 'SELECT discount FROM sales'
-                    df_discount = pd.read_sql_query(query, conn)
-                    conn.close()
-                    df_discount['discount'] = pd.to_numeric(df_discount['discount'], errors='coerce')
-                    if df_discount.empty:
-                        ax3.text(0.5, 0.5, 'No discount data available.', horizontalalignment='center', verticalalignment='center', transform=ax3.transAxes)
-                    else:
-                        df_discount['discount'].plot(kind='hist', bins=20, ax=ax3, color='salmon')
-                        ax3.set_title('Discount Distribution')
-                        ax3.set_xlabel('Discount (%)')
-                        ax3.set_ylabel('Number of Sales')
-                    fig3.tight_layout()
-                    pdf.savefig(fig3)
-                    plt.close(fig3)
-                
-                QMessageBox.information(self, 'Export Successful', f"Analytics exported to {file_path}")
-        except Exception as e:
-            QMessageBox.critical(self, 'Export Error', f"An error occurred while exporting analytics:\n{str(e)}")
+            saved = restore_backup(path, self.store.db_path)
+        except (OSError, sqlite3.Error, BackupError) as e:
+            self.restore_finished.emit(None, e)
+        else:
+            self.restore_finished.emit(saved, None)
+    
+    def on_restore_finished(self, saved, error):
+        self.restoring = False
+        self.set_buttons_enabled(True)
+        self.status_label.setText('')
+        self.load_backups()
+        if error is not None:
+            QMessageBox.critical(self, 'Restore Error', f"The backup was not restored:\n{str(error)}")
+            return
+        # Every view reloads from the change feed
+        self.store.feed.poll()
+        QMessageBox.information(self, 'Restore Successful', f"Database restored.\nThe previous database was saved as {saved}")
 
 class StockManagementApp(QWidget):
-    sale_processed = pyqtSignal()
-    
-    def __init__(self):
+    def __init__(self, store=None):
         super().__init__()
+        self.store = store or get_store()
         self.setWindowTitle('Stock Management System')
         self.setGeometry(100, 100, 1300, 800)
         self.init_ui()
         self.load_articles()
+        self.change_timer = watch_changes(self, self.store)
     
     def init_ui(self):
         layout = QVBoxLayout()
         
         # Tabs
         self.tabs = QTabWidget()
-        self.tab_article_management = ArticleManagementTab()
-        self.tab_sales_history = HistoryTab()
-        self.tab_analytics = AnalyticsTabEnhanced()
+        self.tab_article_management = ArticleManagementTab(self.store)
+        self.tab_sales_history = HistoryTab(self.store)
+        self.tab_analytics = AnalyticsTabEnhanced(self.store)
         
         self.tabs.addTab(self.tab_article_management, "Article Management")
         self.tabs.addTab(self.tab_sales_history, "Sales History")
         self.tabs.addTab(self.tab_analytics, "Analytics Dashboard")
+        # Backups are taken where the database is; a client of server.py has none
+        if getattr(self.store, 'db_path', None):
+            self.tab_backups = BackupTab(self.store)
+            self.tabs.addTab(self.tab_backups, "Backups")
         
         layout.addWidget(self.tabs)
         self.setLayout(layout)
@@ -942,16 +890,39 @@ class StockManagementApp(QWidget):
         self.tab_article_management.load_articles()
 
 class CashDeskApp(QWidget):
-    sale_processed = pyqtSignal()
+    sync_reported = pyqtSignal(object)
     
-    def __init__(self):
+    def __init__(self, store=None):
         super().__init__()
+        self.store = store or get_store()
         self.setWindowTitle('Cash Desk App')
         self.setGeometry(100, 100, 1200, 700)
-        self.cart = []
+        self.cart = Cart()
+        self.cart.subscribe(self.on_cart_changed)
+        self.cart_rows = {}  # article id -> QListWidgetItem in the cart list
         self.discount = 0
+        self.displayed_articles = []
+        self.articles_by_id = {}
+        self.barcode_map = {}  # barcode -> article id
+        self.list_items = {}  # article id -> QListWidgetItem in the articles list
+        self.receipt_writer = get_receipt_writer()
+        self.thermal_printer = configured_printer()
+        # Sales made while the database is unreachable are journaled on this till
+        # [article id, quantity, request key] sold offline, not yet taken from stock
+        self.pending_stock = []
+        self.journal = SalesJournal(journal_path())
+        # Write-ahead checkout journals every sale and leaves the database write to the agent
+        self.write_ahead = write_ahead_enabled()
+        self.sync_agent = SyncAgent(self.store, self.journal, on_report=self.sync_reported.emit)
+        self.sync_reported.connect(self.show_sync_report)
         self.init_ui()
         self.load_articles()
+        self.store.events.subscribe(ArticleChanged, self.on_article_changed)
+        self.store.events.subscribe(ArticleDeleted, self.on_article_deleted)
+        self.store.events.subscribe(StockChanged, self.on_stock_changed)
+        self.store.events.subscribe(ChangesMissed, lambda event: self.load_articles())
+        self.change_timer = watch_changes(self, self.store)
+        self.sync_agent.start()
     
     def init_ui(self):
         layout = QVBoxLayout()
@@ -959,12 +930,14 @@ class CashDeskApp(QWidget):
         # Tabs
         self.tabs = QTabWidget()
         self.tab_main = QWidget()
-        self.tab_history = HistoryTab()
-        self.tab_analytics = AnalyticsTabEnhanced()
+        self.tab_history = HistoryTab(self.store)
+        self.tab_analytics = AnalyticsTabEnhanced(self.store)
+        self.tab_diagnostics = DiagnosticsTab()
         
         self.tabs.addTab(self.tab_main, "POS")
         self.tabs.addTab(self.tab_history, "History")
         self.tabs.addTab(self.tab_analytics, "Analytics")
+        self.tabs.addTab(self.tab_diagnostics, "Diagnostics")
         
         layout.addWidget(self.tabs)
         self.setLayout(layout)
@@ -981,6 +954,17 @@ class CashDeskApp(QWidget):
         left_layout = QVBoxLayout()
         left_layout.setSpacing(10)
     
+        # Barcode Scanner Input
+        scan_layout = QHBoxLayout()
+        self.scan_input = QLineEdit()
+        self.scan_input.setPlaceholderText('Scan barcode...')
+        self.scan_input.setFixedHeight(30)
+        self.scan_input.returnPressed.connect(self.scan_barcode)
+        self.scan_status = QLabel('')
+        scan_layout.addWidget(self.scan_input)
+        scan_layout.addWidget(self.scan_status)
+        left_layout.addLayout(scan_layout)
+    
         # Search Bar
         search_layout = QHBoxLayout()
         self.search_input = QLineEdit()
@@ -988,15 +972,25 @@ class CashDeskApp(QWidget):
         self.search_input.setFixedHeight(30)
         self.search_button = QPushButton('Search')
         self.search_button.setFixedHeight(30)
-        self.search_button.clicked.connect(self.search_articles)
+        self.search_button.clicked.connect(lambda: self.search_articles())
+        self.grid_toggle = QPushButton('Grid View')
+        self.grid_toggle.setCheckable(True)
+        self.grid_toggle.setFixedHeight(30)
+        self.grid_toggle.toggled.connect(self.toggle_grid_view)
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(self.search_button)
+        search_layout.addWidget(self.grid_toggle)
         left_layout.addLayout(search_layout)
     
-        # Articles List
+        # Articles List, with an optional photo grid in the same place
         self.articles_list = QListWidget()
         self.articles_list.setStyleSheet("QListWidget { font-size: 16px; }")
-        left_layout.addWidget(self.articles_list)
+        self.articles_grid = ArticleGridView()
+        self.articles_grid.doubleClicked.connect(lambda index: self.add_to_cart())
+        self.articles_view = QStackedWidget()
+        self.articles_view.addWidget(self.articles_list)
+        self.articles_view.addWidget(self.articles_grid)
+        left_layout.addWidget(self.articles_view)
     
         # Quantity Selection and Add to Cart
         add_layout = QHBoxLayout()
@@ -1017,7 +1011,7 @@ class CashDeskApp(QWidget):
         refresh_btn = QPushButton('Refresh Articles')
         refresh_btn.setFixedHeight(30)
         refresh_btn.setStyleSheet("background-color: #FF9800; color: white;")
-        refresh_btn.clicked.connect(self.load_articles)
+        refresh_btn.clicked.connect(lambda: self.load_articles())
         left_layout.addWidget(refresh_btn)
     
         # Right side: Cart and Payment
@@ -1072,12 +1066,16 @@ class CashDeskApp(QWidget):
         self.discount_input.setFixedHeight(30)
         self.discount_input.setFixedWidth(50)
         self.discount_input.setValidator(QtGui.QDoubleValidator(0.0, 100.0, 2))
-        self.discount_input.textChanged.connect(self.update_totals)
+        self.discount_input.textChanged.connect(self.update_discount)
         discount_layout.addWidget(discount_label)
         discount_layout.addWidget(self.discount_input)
         discount_layout.addStretch()
         right_layout.addLayout(discount_layout)
     
+        # Offline and sync status
+        self.sync_status = QLabel('')
+        right_layout.addWidget(self.sync_status)
+    
         # Payment Button
         payment_btn = QPushButton('Process Payment')
         payment_btn.setFixedHeight(40)
@@ -1091,95 +1089,200 @@ class CashDeskApp(QWidget):
     
         self.tab_main.setLayout(main_layout)
     
+    @timed('load_articles')
     def load_articles(self):
-        conn = sqlite3.connect('stock_management.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, price, stock, photo FROM articles')
-        articles = cursor.fetchall()
-        conn.close()
+        articles = self.store.list_articles()
+        # Promotion rules are recompiled with the catalogue
+        self.cart.set_pricing(self.store.load_promotions())
         
         self.articles = articles  # Update the current articles
+        self.articles_by_id = {article[0]: article for article in articles}
+        self.barcode_map = {article[5]: article[0] for article in articles if article[5]}
         self.display_articles(articles)
     
     def display_articles(self, articles):
+        self.displayed_articles = articles
+        # Rows are drawn from articles_by_id, which the store's events keep current
+        articles = [self.articles_by_id.get(article[0], article) for article in articles]
+        # Only the visible view is rebuilt; the other one catches up when toggled
+        if self.grid_toggle.isChecked():
+            self.articles_grid.set_articles(articles)
+            return
         self.articles_list.clear()
+        self.list_items = {}
         for article in articles:
             item_text = f"{article[1]} - ${article[2]:.2f} (Stock: {article[3]})"
             item = QListWidgetItem(item_text)
             item.setData(Qt.UserRole, article)  # Store the entire article tuple
             self.articles_list.addItem(item)
+            self.list_items[article[0]] = item
+    
+    def apply_stock(self, article_id, new_stock):
+        article = self.articles_by_id.get(article_id)
+        if article is not None:
+            self.replace_article(article._replace(stock=new_stock))
+    
+    def replace_article(self, article):
+        # Updates the in-memory article and its row in place instead of reloading everything
+        self.articles_by_id[article[0]] = article
+        item = self.list_items.get(article[0])
+        if item is not None:
+            item.setText(f"{article[1]} - ${article[2]:.2f} (Stock: {article[3]})")
+            item.setData(Qt.UserRole, article)
+        self.articles_grid.grid_model.update_article(article)
+    
+    def on_stock_changed(self, event):
+        self.apply_stock(event.article_id, event.stock)
+    
+    def on_article_changed(self, event):
+        article = event.article
+        old = self.articles_by_id.get(article.id)
+        if old is not None and old.barcode and self.barcode_map.get(old.barcode) == article.id:
+            del self.barcode_map[old.barcode]
+        if article.barcode:
+            self.barcode_map[article.barcode] = article.id
+        if old is not None:
+            self.replace_article(article)
+            return
+        self.articles_by_id[article.id] = article
+        self.articles.append(article)
+        # New articles show up at once in the full list, and in search results with the next search
+        if self.displayed_articles is self.articles:
+            self.display_articles(self.articles)
+    
+    def on_article_deleted(self, event):
+        article = self.articles_by_id.pop(event.article_id, None)
+        if article is None:
+            return
+        if article.barcode and self.barcode_map.get(article.barcode) == article.id:
+            del self.barcode_map[article.barcode]
+        showing_all = self.displayed_articles is self.articles
+        self.articles = [a for a in self.articles if a[0] != event.article_id]
+        if showing_all:
+            self.display_articles(self.articles)
+        else:
+            self.display_articles([a for a in self.displayed_articles if a[0] != event.article_id])
     
+    def toggle_grid_view(self, checked):
+        self.articles_view.setCurrentIndex(1 if checked else 0)
+        self.display_articles(self.displayed_articles)
+    
+    def selected_article(self):
+        if self.grid_toggle.isChecked():
+            return self.articles_grid.selected_article()
+        selected_item = self.articles_list.currentItem()
+        return selected_item.data(Qt.UserRole) if selected_item else None
+    
+    @timed('search_articles')
     def search_articles(self):
         query = self.search_input.text().strip()
-        conn = sqlite3.connect('stock_management.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, price, stock, photo FROM articles WHERE name LIKE ?", ('%' + query + '%',))
-        results = cursor.fetchall()
-        self.display_articles(results)
-        conn.close()
+        articles = self.store.search_articles(query)
+        # Fresh from the database, so they replace what was loaded earlier
+        self.articles_by_id.update((article[0], article) for article in articles)
+        self.display_articles(articles)
     
     def add_to_cart(self):
-        selected_item = self.articles_list.currentItem()
-        if selected_item:
-            article = selected_item.data(Qt.UserRole)
-            quantity = self.qty_spinbox.value()
-            if article[3] >= quantity:
-                # Check if article is already in cart
-                for idx, cart_item in enumerate(self.cart):
-                    if cart_item['id'] == article[0]:
-                        self.cart[idx]['quantity'] += quantity
-                        break
-                else:
-                    self.cart.append({
-                        'id': article[0],
-                        'name': article[1],
-                        'price': article[2],
-                        'quantity': quantity
-                    })
-                self.refresh_cart()
-                # Update stock in real-time
-                self.update_stock(article[0], article[3] - quantity)
-            else:
+        article = self.selected_article()
+        if article:
+            # The row may be older than our own last stock change
+            article = self.articles_by_id.get(article[0], article)
+            if not self.add_article_to_cart(article, self.qty_spinbox.value()):
                 QMessageBox.warning(self, 'Out of Stock', f"Only {article[3]} units of {article[1]} are available.")
     
-    def update_stock(self, article_id, new_stock):
-        conn = sqlite3.connect('stock_management.db')
-        cursor = conn.cursor()
-        cursor.execute("UPDATE articles SET stock = ? WHERE id = ?", (new_stock, article_id))
-        conn.commit()
-        conn.close()
-        self.load_articles()
-    
-    def refresh_cart(self):
-        self.cart_list.clear()
-        for item in self.cart:
-            self.cart_list.addItem(f"{item['name']} x{item['quantity']} - ${item['price'] * item['quantity']:.2f}")
+    @timed('add_to_cart')
+    def add_article_to_cart(self, article, quantity):
+        if article[3] < quantity:
+            return False
+        # Stock is taken in real-time; this fails if another till got there first.
+        # The key lets the replay tell whether a take whose reply was lost got through.
+        request_key = uuid.uuid4().hex
+        try:
+            with span('update_stock'):
+                new_stock = self.store.take_stock(article[0], quantity, request_key)
+        except OFFLINE_ERRORS:
+            # Sold against the stock last seen; it is taken when the sale is synced
+            self.pending_stock.append([article[0], quantity, request_key])
+            new_stock = article[3] - quantity
+            self.apply_stock(article[0], new_stock)
+            self.sync_status.setText('Offline: sales are kept on this till until the database is back')
+        if new_stock is None:
+            current = self.store.get_article(article[0])
+            if current is not None:
+                self.apply_stock(current.id, current.stock)
+            return False
+        # Merges into the existing line for this article, if any; the stock shown
+        # was updated by the StockChanged event from take_stock
+        self.cart.add(article[0], article[1], article[2], quantity, article[6])
+        return True
+    
+    def scan_barcode(self):
+        code = self.scan_input.text().strip()
+        self.scan_input.clear()
+        if not code:
+            return
+        article_id = self.barcode_map.get(code)
+        if article_id is None:
+            # Not in the loaded catalogue, e.g. added in the back office since; one indexed lookup
+            article = self.store.find_by_barcode(code)
+            if article is None:
+                self.scan_status.setText(f"Unknown barcode: {code}")
+                return
+            self.articles_by_id[article[0]] = article
+            self.barcode_map[code] = article[0]
+        else:
+            article = self.articles_by_id[article_id]
+        if self.add_article_to_cart(article, 1):
+            self.scan_status.setText(f"Added {article[1]}")
+        else:
+            self.scan_status.setText(f"Out of stock: {article[1]}")
+    
+    def on_cart_changed(self, event, line):
+        # Only the cart row that changed is touched
+        if event == Cart.ADDED:
+            item = QListWidgetItem(self.cart_row_text(line))
+            self.cart_list.addItem(item)
+            self.cart_rows[line.article_id] = item
+        elif event == Cart.CHANGED:
+            self.cart_rows[line.article_id].setText(self.cart_row_text(line))
+        elif event == Cart.REMOVED:
+            item = self.cart_rows.pop(line.article_id)
+            self.cart_list.takeItem(self.cart_list.row(item))
+        elif event == Cart.CLEARED:
+            self.cart_rows.clear()
+            self.cart_list.clear()
         self.update_totals()
     
-    def update_totals(self):
-        total = sum(item['price'] * item['quantity'] for item in self.cart)
-        self.total_label.setText(f"Total: ${total:.2f}")
+    def cart_row_text(self, line):
+        text = f"{line.name} x{line.quantity} - ${format_money(line.net_cents)}"
+        if line.discount_cents:
+            text += f" ({line.promotion.name}: -${format_money(line.discount_cents)})"
+        return text
     
+    def update_discount(self):
         try:
-            self.discount = float(self.discount_input.text())
-            if not (0 <= self.discount <= 100):
-                raise ValueError
+            self.cart.set_discount(self.discount_input.text())
         except ValueError:
-            self.discount = 0
             self.discount_input.setText('0')
+            return
+        self.discount = self.cart.discount_percent
+        self.update_totals()
     
+    def update_totals(self):
+        # Totals are kept up to date by the cart, nothing is re-summed here
+        total_text = f"Total: ${format_money(self.cart.net_cents)}"
+        if self.cart.promotion_cents:
+            total_text += f" (promotions -${format_money(self.cart.promotion_cents)})"
+        self.total_label.setText(total_text)
         self.discount_label.setText(f"Discount (%): {self.discount}")
-        discount_amount = total * (self.discount / 100)
-        final_total = total - discount_amount
-        self.final_total_label.setText(f"Final Total: ${final_total:.2f}")
+        self.final_total_label.setText(f"Final Total: ${format_money(self.cart.final_cents)}")
     
     def process_payment(self):
         if not self.cart:
             QMessageBox.warning(self, 'Empty Cart', 'Add items to the cart before payment.')
             return
-        total = sum(item['price'] * item['quantity'] for item in self.cart)
-        discount_amount = total * (self.discount / 100)
-        final_total = total - discount_amount
+        # Promotion time windows may have opened or closed since items were added
+        self.cart.reprice_all()
+        total, discount_amount, final_total = cart_summary(self.cart)
     
         # Get selected payment type
         if self.cash_radio.isChecked():
@@ -1199,184 +1302,93 @@ class CashDeskApp(QWidget):
         if reply == QMessageBox.Yes:
             # Record the sale in the database
             try:
-                conn = sqlite3.connect('stock_management.db')
-                cursor = conn.cursor()
-                sale_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                cursor.execute('''
-                    INSERT INTO sales (date, total, discount, final_total, payment_type)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (sale_date, total, self.discount, final_total, payment_type))
-                sale_id = cursor.lastrowid
-                
-                # Insert sale items
-                for item in self.cart:
-                    cursor.execute('''
-                        INSERT INTO sales_items (sale_id, article_id, quantity, price)
-                        VALUES (?, ?, ?, ?)
-                    ''', (sale_id, item['id'], item['quantity'], item['price']))
-                
-                conn.commit()
-                conn.close()
+                with span('process_payment'):
+                    receipt, offline = self.commit_sale(payment_type)
             except Exception as e:
                 QMessageBox.critical(self, 'Database Error', f"An error occurred while recording the sale:\n{str(e)}")
                 return
     
             # Simulate payment confirmation
-            QMessageBox.information(
-                self,
-                'Payment Successful',
-                f"Payment of ${final_total:.2f} was successful!"
-            )
-            receipt_content = self.generate_receipt(sale_id, total, discount_amount, final_total, payment_type)
-            self.print_receipt(receipt_content)
-            self.show_receipt(receipt_content)
+            message = f"Payment of ${receipt['final_total']:.2f} was successful!"
+            if offline:
+                message += "\n\nThe database is unreachable; the sale is saved on this till and will be synced."
+            QMessageBox.information(self, 'Payment Successful', message)
+            self.print_receipt(receipt)
+            self.show_receipt(receipt)
             self.cart.clear()
-            self.cart_list.clear()
-            self.update_totals()
-    
-            # Refresh the History Tab
-            self.tabs.widget(1).load_history()  # Assuming HistoryTab is at index 1
-    
-    def generate_receipt(self, sale_id, total, discount, final_total, payment_type):
-        sale_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Path to the logo image
-        logo_path = os.path.join('images', 'logo.png')  # Ensure this path is correct
-        
-        # Encode the logo image to Base64
-        logo_base64 = encode_image_to_base64(logo_path)
-        
-        # Start building the HTML receipt
-        html_receipt = f"""
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Courier, monospace;
-                    width: 400px;
-                }}
-                .header {{
-                    text-align: center;
-                }}
-                .header img {{
-                    max-width: 150px;
-                    height: auto;
-                }}
-                .company-details {{
-                    text-align: center;
-                    margin-bottom: 20px;
-                }}
-                .items {{
-                    width: 100%;
-                    border-collapse: collapse;
-                }}
-                .items th, .items td {{
-                    border: 1px solid #000;
-                    padding: 5px;
-                    text-align: left;
-                }}
-                .totals {{
-                    margin-top: 20px;
-                    width: 100%;
-                }}
-                .totals td {{
-                    padding: 5px;
-                }}
-                .footer {{
-                    text-align: center;
-                    margin-top: 20px;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                {"<img src='data:image/png;base64," + logo_base64 + "' />" if logo_base64 else ""}
-            </div>
-            <div class="company-details">
-                <h2>My Retail Company</h2>
-                <p>1234 Market Street<br>
-                City, State ZIP<br>
-                Phone: (123) 456-7890<br>
-                Email: info@myretailcompany.com</p>
-            </div>
-            <hr>
-            <p><strong>Sale ID:</strong> {sale_id}<br>
-            <strong>Date:</strong> {sale_time}<br>
-            <strong>Payment Type:</strong> {payment_type}</p>
-            <table class="items">
-                <tr>
-                    <th>Item</th>
-                    <th>Qty</th>
-                    <th>Price ($)</th>
-                    <th>Total ($)</th>
-                </tr>
-        """
-        
-        # Add each cart item to the HTML table
-        for item in self.cart:
-            item_total = item['price'] * item['quantity']
-            html_receipt += f"""
-                <tr>
-                    <td>{item['name']}</td>
-                    <td>{item['quantity']}</td>
-                    <td>{item['price']:.2f}</td>
-                    <td>{item_total:.2f}</td>
-                </tr>
-            """
-        
-        # Add totals and discount
-        html_receipt += f"""
-            </table>
-            <table class="totals">
-                <tr>
-                    <td><strong>Total:</strong></td>
-                    <td>${total:.2f}</td>
-                </tr>
-                <tr>
-                    <td><strong>Discount ({self.discount}%):</strong></td>
-                    <td>-${discount:.2f}</td>
-                </tr>
-                <tr>
-                    <td><strong>Final Total:</strong></td>
-                    <td>${final_total:.2f}</td>
-                </tr>
-            </table>
-            <div class="footer">
-                <p>Thank you for shopping with us!</p>
-                <p>Visit again.</p>
-            </div>
-        </body>
-        </html>
-        """
-        
-        return html_receipt
-    
-    def print_receipt(self, receipt_content):
+            self.pending_stock.clear()
+    
+    def commit_sale(self, payment_type):
+        # Returns (receipt, offline). A cart holding stock that couldn't be taken
+        # goes to the journal even once the database is back, so the replay takes it.
+        if self.write_ahead and not self.pending_stock and self.sync_agent.online:
+            try:
+                # Its stock was taken as it was scanned; the agent adds the sale itself
+                receipt = self.journal.record_sale(self.cart, payment_type)
+            except OutOfSaleIdsError:
+                pass
+            else:
+                self.store.events.publish(sale_committed(receipt, self.cart))
+                self.sync_agent.wake()
+                return receipt, False
+        # The server may record the sale and still fail to answer; the journaled
+        # copy carries the same key, so the replay knows to leave it out
+        request_key = uuid.uuid4().hex
+        if not self.pending_stock:
+            try:
+                return self.store.commit_sale(self.cart, payment_type, request_key=request_key), False
+            except OFFLINE_ERRORS:
+                pass
+        receipt = self.journal.record_sale(self.cart, payment_type, self.pending_stock, request_key=request_key)
+        self.sync_status.setText(f"Offline: {self.journal.pending_count()} sale(s) waiting to sync")
+        self.sync_agent.wake()
+        return receipt, True
+    
+    def show_sync_report(self, report):
+        # Called through sync_reported, on the GUI thread
+        if not report.online:
+            self.sync_status.setText(f"Offline: {report.pending} sale(s) waiting to sync")
+            return
+        # With write-ahead checkout every sale is replayed; that isn't news
+        text = f"Synced {report.replayed} offline sale(s)" if report.replayed and not self.write_ahead else ''
+        if report.conflicts:
+            text += f"; {len(report.conflicts)} line(s) sold more than was in stock, see reconcile.py"
+        # The replayed sales reach History and Analytics through the change feed
+        self.sync_status.setText(text)
+    
+    def print_receipt(self, receipt):
         try:
-            if not os.path.exists('receipts'):
-                os.makedirs('receipts')
-            receipt_time = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            receipt_path = f"receipts/receipt_{receipt_time}.html"
-            with open(receipt_path, 'w') as f:
-                f.write(receipt_content)
-            # Optionally, implement actual printing here
-            # QMessageBox.information(self, 'Receipt Saved', f"Receipt saved to {receipt_path}")
+            # Queued for the background writer, which stores it in the receipt archive
+            self.receipt_writer.submit(receipt['sale_id'], receipt)
         except Exception as e:
             QMessageBox.critical(self, 'Error', f"Failed to save receipt:\n{str(e)}")
+        if self.thermal_printer:
+            try:
+                print_receipt_escpos(self.thermal_printer, receipt)
+            except Exception as e:
+                QMessageBox.critical(self, 'Print Error', f"An error occurred while printing:\n{str(e)}")
     
-    def show_receipt(self, receipt_content):
-        receipt_window = ReceiptWindow(receipt_content)
+    def show_receipt(self, receipt):
+        with span('generate_receipt'):
+            content = render_receipt_html(receipt)
+        receipt_window = ReceiptWindow(content, receipt, self.thermal_printer)
         receipt_window.exec_()
 
 def main():
-    initialize_database()
+    # Opening the store creates or migrates the database
+    store = get_store()
     app = QApplication(sys.argv)
     app.setStyle('Fusion')  # Set a modern style
     
     # Create a Tab Widget and add both Stock Management and Cash Desk apps
     main_window = QTabWidget()
-    stock_management_app = StockManagementApp()
-    cash_desk_app = CashDeskApp()
+    stock_management_app = StockManagementApp(store)
+    try:
+        cash_desk_app = CashDeskApp(store)
+    except JournalInUseError as e:
+        # Two tills on one journal would sell under the same sale numbers
+        QMessageBox.critical(None, 'Till Already Running', str(e))
+        sys.exit(1)
     
     main_window.addTab(stock_management_app, "Stock Management")
     main_window.addTab(cash_desk_app, "Cash Desk")
@@ -0,0 +1,36 @@
+import sys
+import argparse
+import datetime
+
+from core import Store
+from core.db import DB_PATH
+from core.sales_archive import ARCHIVE_MONTHS, archive_dir, default_cutoff
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move sales from closed periods into yearly archive databases.')
+    parser.add_argument('--database', default=DB_PATH)
+    parser.add_argument('--months', type=int, default=ARCHIVE_MONTHS,
+                        help='Archive sales from before the month this many months ago (default: %(default)s)')
+    parser.add_argument('--before', type=datetime.date.fromisoformat,
+                        help='Archive sales dated before this day (YYYY-MM-DD), instead of --months')
+    parser.add_argument('--vacuum', action='store_true', help='Compact the database afterwards, to give the space back')
+    args = parser.parse_args(argv)
+
+    before = args.before or default_cutoff(args.months)
+    store = Store(args.database)
+    try:
+        moved = store.archive_sales(before)
+        if args.vacuum and moved:
+            store.conn.execute('VACUUM')
+    finally:
+        store.close()
+    if not moved:
+        print(f"No sales from before {before} to archive.")
+    for year, count in moved.items():
+        print(f"{year}: moved {count:,} sale(s) to {archive_dir(args.database)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import os
+import sys
+import argparse
+
+from core.backup import BACKUP_KEEP, BackupError, backup_database, backup_dir, list_backups, restore_backup
+from core.db import DB_PATH
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Back up the database while tills keep selling, or restore a backup.')
+    parser.add_argument('--database', default=DB_PATH)
+    parser.add_argument('--dir', default=backup_dir(), help='Where backups are kept (default: %(default)s)')
+    parser.add_argument('--keep', type=int, default=BACKUP_KEEP, help='Backups kept by rotation (default: %(default)s)')
+    parser.add_argument('--no-compress', action='store_true', help="Don't gzip the backup")
+    parser.add_argument('--list', action='store_true', help='List the backups, newest first')
+    parser.add_argument('--restore', metavar='BACKUP', help='Check this backup and copy it into the database')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for path in list_backups(args.database, args.dir):
+            print(f"{path}  {os.path.getsize(path):,} bytes")
+        return 0
+    if args.restore:
+        try:
+            saved = restore_backup(args.restore, args.database, args.dir)
+        except BackupError as e:
+            print(f"Not restored: {e}", file=sys.stderr)
+            return 1
+        print(f"Restored {args.database} from {args.restore}; the database as it was is in {saved}")
+        return 0
+
+    def progress(done, total):
+        print(f"\r{done:,}/{total:,} pages", end='', flush=True)
+
+    path = backup_database(args.database, args.dir, not args.no_compress, args.keep, progress=progress)
+    print(f"\nBacked up {args.database} to {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import datetime
+import sqlite3
+import statistics
+import tempfile
+import subprocess
+
+from core import Cart, Store, cart_summary
+from core.escpos import render_escpos
+from core.offline import SalesJournal
+from core.receipts import make_receipt, render_receipt_html
+from generate_data import generate
+
+# Named database sizes, in sales
+SIZES = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+DATA_DIR = 'bench_data'
+OUTPUT_PATH = 'benchmark.json'
+# Fixed so that databases generated on different days are identical
+DATA_END = datetime.datetime(2025, 1, 1)
+SEARCH_TERMS = ['a', 'Milk', 'Fresh', 'zz', 'e 99']
+
+
+def ensure_database(name, data_dir):
+    # Databases are generated once and reused; commits made by a run are negligible
+    path = os.path.join(data_dir, f"sales_{name}.db")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generating {path} ({SIZES[name]:,} sales)...")
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        generate(tmp_path, SIZES[name], end=DATA_END)
+        os.replace(tmp_path, path)
+    return path
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'runs': repeat,
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'max': timings[-1],
+    }
+
+
+def operations(store, rng):
+    # name -> (callable, heavy); heavy operations scan the whole sales table
+    article_ids = [article.id for article in store.list_articles()]
+    cart = Cart(pricing=store.load_promotions())
+
+    def search():
+        store.search_articles(rng.choice(SEARCH_TERMS))
+
+    def add_to_cart():
+        article = store.get_article(rng.choice(article_ids))
+        if store.take_stock(article.id, 1) is not None:
+            cart.add(article.id, article.name, article.price, 1, article.category)
+
+    def commit_sale():
+        sale = Cart(pricing=cart.pricing)
+        for article_id in rng.sample(article_ids, 3):
+            article = store.get_article(article_id)
+            sale.add(article.id, article.name, article.price, 1, article.category)
+        store.commit_sale(sale, 'Card')
+
+    journal = None
+    journal_dir = tempfile.TemporaryDirectory()  # removed when the run ends
+
+    def journal_sale():
+        # Checkout with CASHIER_WRITE_AHEAD: the same sale appended to the journal
+        nonlocal journal
+        if journal is None:
+            journal = SalesJournal(os.path.join(journal_dir.name, 'bench.jsonl'))
+            journal.add_block([1, 10 ** 12])
+        sale = Cart(pricing=cart.pricing)
+        for article_id in rng.sample(article_ids, 3):
+            article = store.get_article(article_id)
+            sale.add(article.id, article.name, article.price, 1, article.category)
+        journal.record_sale(sale, 'Card')
+
+    receipt = None
+
+    def receipt_generation():
+        nonlocal receipt
+        if receipt is None:
+            sale = Cart()
+            for article_id in article_ids[:5]:
+                article = store.get_article(article_id)
+                sale.add(article.id, article.name, article.price, 2)
+            total, discount_amount, final_total = cart_summary(sale)
+            receipt = make_receipt(1, '2024-01-01 12:00:00', 'Card', sale.receipt_items(),
+                                   total, sale.discount_percent, discount_amount, final_total)
+        render_receipt_html(receipt)
+        render_escpos(receipt)
+
+    def history_load():
+        store.sales_history()
+
+    def csv_export():
+        with open(os.devnull, 'w') as f:
+            store.history_export().to_csv(f, index=False)
+
+    def month_load():
+        # The last month of the data, as the history and analytics tabs read a date range
+        since = DATA_END - datetime.timedelta(days=31)
+        store.sales_history(since, DATA_END)
+        store.sales_over_time(since, DATA_END)
+
+    def analytics():
+        store.sales_over_time()
+        store.top_selling_items()
+        store.discount_distribution()
+
+    return {
+        'search': (search, False),
+        'add_to_cart': (add_to_cart, False),
+        'commit_sale': (commit_sale, False),
+        'journal_sale': (journal_sale, False),
+        'receipt_generation': (receipt_generation, False),
+        'month_load': (month_load, False),
+        'history_load': (history_load, True),
+        'csv_export': (csv_export, True),
+        'analytics': (analytics, True),
+    }
+
+
+def run_size(name, data_dir, repeat, heavy_repeat, selected, seed):
+    store = Store(ensure_database(name, data_dir))
+    rng = random.Random(seed)
+    results = {}
+    try:
+        for op_name, (func, heavy) in operations(store, rng).items():
+            if selected and op_name not in selected:
+                continue
+            results[op_name] = measure(func, heavy_repeat if heavy else repeat)
+            print(f"  {op_name:<20} median {results[op_name]['median'] * 1000:10.3f} ms")
+    finally:
+        store.close()
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    # Ratio of medians, new / baseline: below 1.0 is faster
+    print(f"\n{'size':<6} {'operation':<20} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for size, ops in results['results'].items():
+        for op_name, stats in ops.items():
+            old = baseline.get('results', {}).get(size, {}).get(op_name)
+            if old is None:
+                continue
+            ratio = stats['median'] / old['median'] if old['median'] else float('inf')
+            print(f"{size:<6} {op_name:<20} {old['median'] * 1000:12.3f} {stats['median'] * 1000:12.3f} {ratio:7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the core operations headless against generated databases.')
+    parser.add_argument('--sizes', default='10k,1M,10M', help=f"Comma-separated database sizes from {', '.join(SIZES)}")
+    parser.add_argument('--ops', help='Comma-separated operations to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=200, help='Runs per light operation')
+    parser.add_argument('--heavy-repeat', type=int, default=3, help='Runs per full-table operation (history, export, analytics)')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='Where generated databases are kept between runs')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='JSON file to write the results to')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+    selected = set(args.ops.split(',')) if args.ops else None
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'results': {},
+    }
+    for size in sizes:
+        print(f"{size}:")
+        results['results'][size] = run_size(size, args.data_dir, args.repeat, args.heavy_repeat, selected, args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
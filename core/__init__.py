@@ -0,0 +1,10 @@
+# GUI-free core of the retail system: catalogue, cart, checkout, reporting and
+# receipts. Nothing in this package imports Qt, so it can be scripted, profiled
+# and load-tested without a display.
+from .cart import Cart, CartLine, cents_to_float, format_money, to_cents
+from .catalogue import Article, DuplicateBarcodeError, InvalidArticleError
+from .checkout import EmptyCartError, PAYMENT_TYPES, cart_summary
+from .db import DB_PATH, initialize_database
+from .events import ArticleChanged, ArticleDeleted, ChangesMissed, EventBus, SaleCommitted, StockChanged
+from .remote import RemoteStore, RemoteError
+from .store import Store, get_store
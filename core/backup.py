@@ -0,0 +1,368 @@
+import os
+import re
+import gzip
+import time
+import shutil
+import logging
+import sqlite3
+import datetime
+import threading
+
+from .changefeed import changelog_seq, mark_replaced
+from .db import DB_PATH, create_schema
+from .sales_archive import archive_dir, archive_path, archive_years
+
+# Backups are taken with SQLite's online backup API from a connection of their
+# own, a few pages at a time, so tills keep selling while one runs. Each backup
+# is checked with integrity_check, optionally gzipped, and the oldest are
+# rotated out. The yearly sales archives are copied with it, into a directory
+# beside the backup. Restoring checks the backup first and then copies it into
+# the live database through the same API, so connections that are still open
+# see the change like any other commit.
+BACKUP_DIR = 'backups'
+BACKUP_KEEP = 7
+BACKUP_STEP_PAGES = 256     # pages copied per step
+BACKUP_STEP_PAUSE = 0.005   # seconds between steps, for writers waiting on the lock
+# A write from another connection restarts a stepped backup; after this many
+# restarts the copy is done in one step instead
+BACKUP_RESTARTS = 3
+BACKUP_HOURS_ENV = 'CASHIER_BACKUP_HOURS'
+BACKUP_DIR_ENV = 'CASHIER_BACKUP_DIR'
+
+_ARCHIVE_COPY = re.compile(r'^sales_(\d{4})\.db(\.gz)?$')
+
+logger = logging.getLogger('cashier.backup')
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup_dir():
+    return os.environ.get(BACKUP_DIR_ENV) or BACKUP_DIR
+
+
+def backup_hours():
+    # Hours between scheduled backups, or None when they are off
+    hours = os.environ.get(BACKUP_HOURS_ENV, '').strip()
+    return float(hours) if hours else None
+
+
+def _stem(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def archive_copies(backup_path):
+    # Directory holding the sales archives taken with a backup
+    stem = backup_path[:-len('.gz')] if backup_path.endswith('.gz') else backup_path
+    return os.path.splitext(stem)[0] + '.archives'
+
+
+def list_backups(db_path=DB_PATH, directory=None, labelled=True):
+    # Backups of db_path, newest first: scheduled and manual ones, and unless
+    # labelled is False the labelled ones (pre-restore) as well
+    directory = directory or backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    label = r'(-[a-z]+(-[a-z]+)*)?' if labelled else ''
+    pattern = re.compile(rf'^{re.escape(_stem(db_path))}{label}-(?P<stamp>\d{{8}}-\d{{6}})\.db(\.gz)?$')
+    matches = [match for match in map(pattern.match, os.listdir(directory)) if match]
+    matches.sort(key=lambda match: (match.group('stamp'), match.group(0)), reverse=True)
+    return [os.path.join(directory, match.group(0)) for match in matches]
+
+
+def rotate_backups(db_path=DB_PATH, directory=None, keep=BACKUP_KEEP):
+    # Labelled backups are never rotated out
+    removed = list_backups(db_path, directory, labelled=False)[keep:]
+    for path in removed:
+        os.remove(path)
+        if os.path.isdir(archive_copies(path)):
+            shutil.rmtree(archive_copies(path))
+    return removed
+
+
+def check_integrity(path, name=None):
+    # name is what errors call the file, when path is a working copy of it
+    name = name or path
+    conn = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"{name} is not a usable database: {e}")
+    finally:
+        conn.close()
+    if problems != ['ok']:
+        raise BackupError(f"{name} failed its integrity check: {'; '.join(problems[:5])}")
+
+
+def _copy(source, target, pages, progress):
+    restarts = 0
+    last_remaining = None
+
+    def step(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_RESTARTS:
+                raise _Restarted()
+        last_remaining = remaining
+        if progress:
+            progress(total - remaining, total)
+        time.sleep(BACKUP_STEP_PAUSE)
+
+    try:
+        source.backup(target, pages=pages, progress=step)
+    except _Restarted:
+        logger.info('Database kept changing during the backup; copying it in one step')
+        source.backup(target)
+
+
+def _fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def _take_copy(source_path, path, pages=BACKUP_STEP_PAGES, progress=None, compress=True):
+    # Copies the database at source_path to path + '.part', checks it and
+    # gzips it if asked. Returns the part file, synced to disk, and the name it
+    # is to be renamed to; the caller renames it once the rest of the backup is done.
+    part_path = path + '.part'
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(part_path)
+    try:
+        _copy(source, target, pages, progress)
+    finally:
+        target.close()
+        source.close()
+    try:
+        check_integrity(part_path, path)
+        if compress:
+            path += '.gz'
+            with open(part_path, 'rb') as f, gzip.open(path + '.part', 'wb') as out:
+                shutil.copyfileobj(f, out)
+            os.remove(part_path)
+            part_path = path + '.part'
+        _fsync_file(part_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return part_path, path
+
+
+def backup_database(db_path=DB_PATH, directory=None, compress=True, keep=BACKUP_KEEP,
+                    pages=BACKUP_STEP_PAGES, progress=None, label=None):
+    # Returns the backup's path. progress(pages done, pages in total) is called
+    # after each step; label names a backup that rotation leaves alone.
+    directory = directory or backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    taken = datetime.datetime.now()
+    while True:
+        stamp = taken.strftime('%Y%m%d-%H%M%S')
+        name = f"{_stem(db_path)}-{label}-{stamp}.db" if label else f"{_stem(db_path)}-{stamp}.db"
+        # A second backup within the same second is stamped a second later instead of replacing the first
+        if not any(os.path.exists(os.path.join(directory, name + suffix)) for suffix in ('', '.gz')):
+            break
+        taken += datetime.timedelta(seconds=1)
+    part_path, path = _take_copy(db_path, os.path.join(directory, name), pages, progress, compress)
+    copies = archive_copies(path)
+    copies_part = copies + '.part'
+    try:
+        # The archives are copied after the database, so sales an archive run
+        # moves in between are in both copies, never in neither. A restore
+        # drops the ones the database has twice.
+        years = archive_years(db_path)
+        if years:
+            if os.path.isdir(copies_part):
+                shutil.rmtree(copies_part)
+            os.makedirs(copies_part)
+            for year in years:
+                copy_part, copy = _take_copy(archive_path(db_path, year), os.path.join(copies_part, f"sales_{year}.db"),
+                                             compress=compress)
+                os.replace(copy_part, copy)
+            os.replace(copies_part, copies)
+        # The database file appears last: a listed backup always has its archives
+        os.replace(part_path, path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        if os.path.isdir(copies_part):
+            shutil.rmtree(copies_part)
+    if keep is not None and not label:
+        rotate_backups(db_path, directory, keep)
+    return path
+
+
+def _unpack(backup_path, path):
+    if backup_path.endswith('.gz'):
+        with gzip.open(backup_path, 'rb') as f, open(path, 'wb') as out:
+            shutil.copyfileobj(f, out)
+    else:
+        shutil.copyfile(backup_path, path)
+    check_integrity(path, backup_path)
+
+
+def _archived_sales(conn, archives):
+    # Sales in conn's main database that one of the archive files also holds
+    found = {}
+    for path in archives:
+        conn.execute('ATTACH DATABASE ? AS restored_archive', (path,))
+        try:
+            (count,) = conn.execute(
+                'SELECT COUNT(*) FROM main.sales WHERE sale_id IN (SELECT sale_id FROM restored_archive.sales)'
+            ).fetchone()
+            if count:
+                found[path] = count
+        finally:
+            conn.execute('DETACH DATABASE restored_archive')
+    return found
+
+
+def _drop_archived_sales(conn, archives):
+    # A backup can hold sales that were archived after it was taken; the
+    # archive's copy is kept, so history doesn't list them twice
+    for path in archives:
+        conn.execute('ATTACH DATABASE ? AS restored_archive', (path,))
+        try:
+            with conn:
+                conn.execute(
+                    'DELETE FROM main.sales_items WHERE sale_id IN (SELECT sale_id FROM restored_archive.sales)'
+                )
+                conn.execute('DELETE FROM main.sales WHERE sale_id IN (SELECT sale_id FROM restored_archive.sales)')
+        finally:
+            conn.execute('DETACH DATABASE restored_archive')
+
+
+def restore_backup(backup_path, db_path=DB_PATH, directory=None):
+    # Replaces db_path's contents with the backup once it passes integrity_check,
+    # and the sales archives with the ones taken with it. The current database
+    # and archives are backed up first (labelled pre-restore, outside the
+    # rotation); returns that backup's path.
+    directory = directory or backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    restore_path = os.path.join(directory, f"restore-{os.getpid()}.db.part")
+    restore_dir = os.path.join(directory, f"restore-{os.getpid()}.archives.part")
+    copies = archive_copies(backup_path)
+    try:
+        _unpack(backup_path, restore_path)
+        restored = {}  # year -> unpacked copy of its archive
+        if os.path.isdir(copies):
+            os.makedirs(restore_dir, exist_ok=True)
+            for name in sorted(os.listdir(copies)):
+                match = _ARCHIVE_COPY.match(name)
+                if match:
+                    restored[int(match.group(1))] = os.path.join(restore_dir, f"sales_{match.group(1)}.db")
+                    _unpack(os.path.join(copies, name), restored[int(match.group(1))])
+            # Years archived since the backup was taken are emptied; their sales
+            # are in the backed up database
+            emptied = [year for year in archive_years(db_path) if year not in restored]
+            archives = list(restored.values())
+        else:
+            # Taken without archives: the current ones stay as they are
+            emptied = []
+            archives = [archive_path(db_path, year) for year in archive_years(db_path)]
+        # A backup taken by an older version is brought up to the current schema
+        # first, so processes reading the live database never see the old one
+        conn = sqlite3.connect(restore_path)
+        try:
+            create_schema(conn)
+            _drop_archived_sales(conn, archives)
+        finally:
+            conn.close()
+        saved = backup_database(db_path, directory, label='pre-restore')
+        if restored:
+            os.makedirs(archive_dir(db_path), exist_ok=True)
+        for year, path in restored.items():
+            source = sqlite3.connect(path)
+            target = sqlite3.connect(archive_path(db_path, year), timeout=30)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+        for year in emptied:
+            target = sqlite3.connect(archive_path(db_path, year), timeout=30)
+            try:
+                with target:
+                    target.execute('DELETE FROM sales_items')
+                    target.execute('DELETE FROM sales')
+            finally:
+                target.close()
+        source = sqlite3.connect(restore_path)
+        target = sqlite3.connect(db_path, timeout=30)
+        try:
+            last_seq = changelog_seq(target)
+            # One step: the live database is locked for the copy and changes all at once
+            source.backup(target)
+            # Running processes find out from their change feed and reload
+            with target:
+                mark_replaced(target, last_seq)
+            # Every sale must be in exactly one place, or history lists it twice
+            twice = _archived_sales(target, [archive_path(db_path, year) for year in archive_years(db_path)])
+        finally:
+            target.close()
+            source.close()
+        if twice:
+            listed = ', '.join(f"{count} in {path}" for path, count in twice.items())
+            raise BackupError(f"The restored database has sales that are also archived ({listed}); "
+                              f"the database as it was is in {saved}")
+    finally:
+        if os.path.exists(restore_path):
+            os.remove(restore_path)
+        if os.path.isdir(restore_dir):
+            shutil.rmtree(restore_dir)
+    return saved
+
+
+class BackupScheduler:
+    # Background thread that backs the database up every `hours` hours, counting
+    # from the newest backup, so a restart doesn't skip or repeat one.
+    # on_report(path or None, error or None) is called from the thread.
+    def __init__(self, db_path, hours, directory=None, compress=True, keep=BACKUP_KEEP, on_report=None):
+        self.db_path = db_path
+        self.interval = hours * 3600
+        self.directory = directory or backup_dir()
+        self.compress = compress
+        self.keep = keep
+        self.on_report = on_report
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _due_in(self):
+        backups = list_backups(self.db_path, self.directory, labelled=False)
+        if not backups:
+            return 0
+        return os.path.getmtime(backups[0]) + self.interval - time.time()
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._due_in()
+            if wait <= 0:
+                self.backup_once()
+                wait = self.interval
+            self._stop.wait(wait)
+
+    def backup_once(self):
+        try:
+            path = backup_database(self.db_path, self.directory, self.compress, self.keep)
+        except (OSError, sqlite3.Error, BackupError) as e:
+            logger.exception('Scheduled backup failed')
+            if self.on_report:
+                self.on_report(None, e)
+            # Tried again after the interval, not in a tight loop
+            return None
+        logger.info('Backed up %s to %s', self.db_path, path)
+        if self.on_report:
+            self.on_report(path, None)
+        return path
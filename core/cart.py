@@ -0,0 +1,200 @@
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+# Money is held as integer cents and percentages as integer basis points
+# (1/100 of a percent), so totals never drift the way summed floats do.
+
+
+def to_cents(amount):
+    # Accepts floats from the database as well as strings typed by the user
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def to_basis_points(percent):
+    try:
+        value = Decimal(str(percent).strip() or '0')
+    except InvalidOperation:
+        raise ValueError(f"Invalid percentage: {percent!r}")
+    return int((value * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def percent_of(cents, basis_points):
+    # Rounded half up to the cent
+    return int((Decimal(cents) * basis_points / 10000).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def cents_to_float(cents):
+    return cents / 100
+
+
+def format_money(cents):
+    sign = '-' if cents < 0 else ''
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+class CartLine:
+    __slots__ = ('article_id', 'name', 'unit_cents', 'quantity', 'category', 'discount_cents', 'promotion')
+
+    def __init__(self, article_id, name, unit_cents, quantity, category=None):
+        self.article_id = article_id
+        self.name = name
+        self.unit_cents = unit_cents
+        self.quantity = quantity
+        self.category = category
+        # Set by the pricing engine
+        self.discount_cents = 0
+        self.promotion = None
+
+    @property
+    def line_cents(self):
+        return self.unit_cents * self.quantity
+
+    @property
+    def net_cents(self):
+        return self.line_cents - self.discount_cents
+
+    def __repr__(self):
+        return f"CartLine({self.article_id!r}, {self.name!r}, {self.unit_cents}, {self.quantity})"
+
+
+class Cart:
+    # Lines are indexed by article id (dicts keep insertion order, so the cart
+    # keeps the order items were scanned in). The subtotal is maintained as lines
+    # change rather than re-summed, and listeners are told exactly which line changed.
+    ADDED = 'added'
+    CHANGED = 'changed'
+    REMOVED = 'removed'
+    CLEARED = 'cleared'
+    DISCOUNT = 'discount'
+
+    def __init__(self, pricing=None):
+        self.lines = {}
+        self.subtotal_cents = 0
+        self.promotion_cents = 0
+        self.discount_bp = 0
+        self.pricing = pricing
+        self._listeners = []
+
+    def subscribe(self, listener):
+        # listener(event, line); line is None for CLEARED and DISCOUNT
+        self._listeners.append(listener)
+
+    def _notify(self, event, line=None):
+        for listener in self._listeners:
+            listener(event, line)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines.values())
+
+    def __contains__(self, article_id):
+        return article_id in self.lines
+
+    def get(self, article_id):
+        return self.lines.get(article_id)
+
+    def _reprice(self, line, now=None):
+        # Only the rules that can apply to this line are evaluated
+        if self.pricing is None:
+            cents, promotion = 0, None
+        else:
+            cents, promotion = self.pricing.best(line.article_id, line.category, line.unit_cents, line.quantity, now)
+        changed = cents != line.discount_cents or promotion is not line.promotion
+        self.promotion_cents += cents - line.discount_cents
+        line.discount_cents = cents
+        line.promotion = promotion
+        return changed
+
+    def add(self, article_id, name, price, quantity=1, category=None):
+        line = self.lines.get(article_id)
+        if line is None:
+            line = CartLine(article_id, name, to_cents(price), quantity, category)
+            self.lines[article_id] = line
+            self.subtotal_cents += line.line_cents
+            self._reprice(line)
+            self._notify(self.ADDED, line)
+        else:
+            line.quantity += quantity
+            self.subtotal_cents += line.unit_cents * quantity
+            self._reprice(line)
+            self._notify(self.CHANGED, line)
+        return line
+
+    def set_quantity(self, article_id, quantity):
+        if quantity <= 0:
+            return self.remove(article_id)
+        line = self.lines[article_id]
+        self.subtotal_cents += line.unit_cents * (quantity - line.quantity)
+        line.quantity = quantity
+        self._reprice(line)
+        self._notify(self.CHANGED, line)
+        return line
+
+    def remove(self, article_id):
+        line = self.lines.pop(article_id)
+        self.subtotal_cents -= line.line_cents
+        self.promotion_cents -= line.discount_cents
+        self._notify(self.REMOVED, line)
+        return line
+
+    def clear(self):
+        self.lines.clear()
+        self.subtotal_cents = 0
+        self.promotion_cents = 0
+        self._notify(self.CLEARED)
+
+    def set_pricing(self, pricing):
+        self.pricing = pricing
+        self.reprice_all()
+
+    def reprice_all(self, now=None):
+        # Needed when the rules change or time windows may have opened/closed,
+        # e.g. right before checkout
+        for line in self.lines.values():
+            if self._reprice(line, now):
+                self._notify(self.CHANGED, line)
+
+    def set_discount(self, percent):
+        basis_points = to_basis_points(percent)
+        if not 0 <= basis_points <= 10000:
+            raise ValueError(f"Discount must be between 0 and 100: {percent!r}")
+        if basis_points != self.discount_bp:
+            self.discount_bp = basis_points
+            self._notify(self.DISCOUNT)
+
+    @property
+    def discount_percent(self):
+        return self.discount_bp / 100
+
+    @property
+    def net_cents(self):
+        # After promotions, before the whole-cart discount
+        return self.subtotal_cents - self.promotion_cents
+
+    @property
+    def discount_cents(self):
+        return percent_of(self.net_cents, self.discount_bp)
+
+    @property
+    def final_cents(self):
+        return self.net_cents - self.discount_cents
+
+    def sale_items(self):
+        # (article_id, quantity, unit price, promotion name, promotion saving)
+        # per line, as the line is stored with its sale
+        return [
+            (line.article_id, line.quantity, cents_to_float(line.unit_cents),
+             line.promotion.name if line.discount_cents else None, cents_to_float(line.discount_cents))
+            for line in self.lines.values()
+        ]
+
+    def receipt_items(self):
+        # Promotion savings follow their line as a negative row
+        items = []
+        for line in self.lines.values():
+            items.append((line.name, line.quantity, cents_to_float(line.unit_cents)))
+            if line.discount_cents:
+                items.append((f"  {line.promotion.name}", 1, -cents_to_float(line.discount_cents)))
+        return items
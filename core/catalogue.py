@@ -0,0 +1,149 @@
+import math
+import numbers
+import sqlite3
+import datetime
+from collections import namedtuple
+
+# Still a plain tuple underneath, so code indexing article[0]..article[6] keeps working
+Article = namedtuple('Article', 'id name price stock photo barcode category')
+
+ARTICLE_COLUMNS = 'id, name, price, stock, photo, barcode, category'
+
+
+class DuplicateBarcodeError(ValueError):
+    pass
+
+
+class InvalidArticleError(ValueError):
+    pass
+
+
+def _articles(cursor):
+    return [Article(*row) for row in cursor.fetchall()]
+
+
+def list_articles(conn):
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {ARTICLE_COLUMNS} FROM articles')
+    return _articles(cursor)
+
+
+def search_articles(conn, query):
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {ARTICLE_COLUMNS} FROM articles WHERE name LIKE ?', ('%' + query + '%',))
+    return _articles(cursor)
+
+
+def get_article(conn, article_id):
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {ARTICLE_COLUMNS} FROM articles WHERE id = ?', (article_id,))
+    row = cursor.fetchone()
+    return Article(*row) if row else None
+
+
+def find_by_barcode(conn, code):
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {ARTICLE_COLUMNS} FROM articles WHERE barcode = ?', (code,))
+    row = cursor.fetchone()
+    return Article(*row) if row else None
+
+
+def _check_barcode(error, barcode):
+    # The unique barcode index is the only constraint an article write can break
+    if barcode and 'barcode' in str(error):
+        raise DuplicateBarcodeError(f"Another article already uses barcode {barcode}.") from error
+    raise error
+
+
+def _check_stock(stock):
+    if isinstance(stock, bool) or not isinstance(stock, numbers.Integral) or stock < 0:
+        raise InvalidArticleError(f"Stock must be a whole number of at least 0, not {stock!r}.")
+
+
+def _check_article(name, price, stock):
+    # The same rules as the articles table's constraints, with messages a user can act on
+    if not isinstance(name, str) or not name.strip():
+        raise InvalidArticleError('An article needs a name.')
+    if isinstance(price, bool) or not isinstance(price, numbers.Real) or not math.isfinite(price) or price < 0:
+        raise InvalidArticleError(f"Price must be a number of at least 0, not {price!r}.")
+    _check_stock(stock)
+
+
+# Writes leave the transaction to the caller: the Store commits each one on its
+# own, the server groups many into one commit
+
+
+def add_article(conn, name, price, stock, photo=None, barcode=None, category=None):
+    _check_article(name, price, stock)
+    try:
+        cursor = conn.execute('''
+            INSERT INTO articles (name, price, stock, photo, barcode, category)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, price, stock, photo, barcode, category))
+    except sqlite3.IntegrityError as e:
+        _check_barcode(e, barcode)
+    return cursor.lastrowid
+
+
+def update_article(conn, article_id, name, price, stock, photo=None, barcode=None, category=None):
+    # Returns the photo the article used before, so the caller can release it
+    _check_article(name, price, stock)
+    cursor = conn.cursor()
+    cursor.execute('SELECT photo FROM articles WHERE id = ?', (article_id,))
+    result = cursor.fetchone()
+    try:
+        cursor.execute('''
+            UPDATE articles
+            SET name = ?, price = ?, stock = ?, photo = ?, barcode = ?, category = ?
+            WHERE id = ?
+        ''', (name, price, stock, photo, barcode, category, article_id))
+    except sqlite3.IntegrityError as e:
+        _check_barcode(e, barcode)
+    return result[0] if result else None
+
+
+def delete_article(conn, article_id):
+    # Returns the deleted article's photo, so the caller can release it
+    cursor = conn.cursor()
+    cursor.execute('SELECT photo FROM articles WHERE id = ?', (article_id,))
+    result = cursor.fetchone()
+    cursor.execute('DELETE FROM articles WHERE id = ?', (article_id,))
+    return result[0] if result else None
+
+
+def set_stock(conn, article_id, stock):
+    _check_stock(stock)
+    conn.execute('UPDATE articles SET stock = ? WHERE id = ?', (stock, article_id))
+
+
+def stock_taken(conn, request_key):
+    # Whether the take sent under this key has already been applied
+    if request_key is None:
+        return False
+    return conn.execute('SELECT 1 FROM stock_takes WHERE request_key = ?', (request_key,)).fetchone() is not None
+
+
+def take_stock(conn, article_id, quantity, request_key=None):
+    # Decrements stock only if enough is left, in one statement, so two tills
+    # can't both sell the last unit. Returns the new stock, or None if short.
+    # A take sent again under the same request_key (its reply was lost) is not
+    # applied twice; the current stock is returned.
+    cursor = conn.cursor()
+    if not stock_taken(conn, request_key):
+        cursor.execute(
+            'UPDATE articles SET stock = stock - ? WHERE id = ? AND stock >= ?',
+            (quantity, article_id, quantity)
+        )
+        if cursor.rowcount == 0:
+            return None
+        if request_key is not None:
+            cursor.execute('INSERT INTO stock_takes (request_key, article_id, quantity, taken_at) VALUES (?, ?, ?, ?)',
+                           (request_key, article_id, quantity, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    cursor.execute('SELECT stock FROM articles WHERE id = ?', (article_id,))
+    return cursor.fetchone()[0]
+
+
+def photo_references(conn, photo):
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM articles WHERE photo = ?', (photo,))
+    return cursor.fetchone()[0]
@@ -0,0 +1,195 @@
+from collections import OrderedDict
+
+from .catalogue import ARTICLE_COLUMNS, Article
+from .events import ArticleChanged, ArticleDeleted, ChangesMissed, SaleCommitted, StockChanged
+
+# Triggers append one row per changed article or new sale to changelog, in
+# commit order, whichever process or tool made the change. Other processes
+# follow it from the last sequence number they saw and turn the rows into the
+# same events the Store publishes for its own writes.
+CHANGELOG_KEEP = 100_000  # rows kept when the log is pruned at startup
+FEED_BATCH = 1000
+# SQLite caps the number of ? parameters in one statement
+_IN_CHUNK = 500
+
+CHANGELOG_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS changelog (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL
+    )
+'''
+
+CHANGELOG_TRIGGERS = {
+    'articles_changelog_insert': '''
+        AFTER INSERT ON articles BEGIN
+            INSERT INTO changelog (table_name, row_id, op) VALUES ('articles', NEW.id, 'insert');
+        END
+    ''',
+    'articles_changelog_update': '''
+        AFTER UPDATE OF name, price, photo, barcode, category ON articles BEGIN
+            INSERT INTO changelog (table_name, row_id, op) VALUES ('articles', NEW.id, 'update');
+        END
+    ''',
+    # Kept apart from other edits so a sale only costs readers a stock lookup
+    'articles_changelog_stock': '''
+        AFTER UPDATE OF stock ON articles WHEN OLD.stock IS NOT NEW.stock BEGIN
+            INSERT INTO changelog (table_name, row_id, op) VALUES ('articles', NEW.id, 'stock');
+        END
+    ''',
+    'articles_changelog_delete': '''
+        AFTER DELETE ON articles BEGIN
+            INSERT INTO changelog (table_name, row_id, op) VALUES ('articles', OLD.id, 'delete');
+        END
+    ''',
+    'sales_changelog_insert': '''
+        AFTER INSERT ON sales BEGIN
+            INSERT INTO changelog (table_name, row_id, op) VALUES ('sales', NEW.sale_id, 'insert');
+        END
+    ''',
+}
+
+
+def create_changelog(cursor, keep=CHANGELOG_KEEP):
+    cursor.execute(CHANGELOG_SCHEMA)
+    for name, body in CHANGELOG_TRIGGERS.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    cursor.execute('DELETE FROM changelog WHERE seq <= (SELECT MAX(seq) FROM changelog) - ?', (keep,))
+
+
+def drop_changelog_triggers(cursor):
+    # For bulk loads into a new database; create_changelog() puts them back
+    for name in CHANGELOG_TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def changelog_seq(conn):
+    return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changelog').fetchone()[0]
+
+
+def mark_replaced(conn, after_seq):
+    # After the whole database was replaced (a backup restored): logs an entry
+    # numbered past after_seq, the old log's end, that makes every feed reload.
+    # The gap leaves room for writes committed after after_seq was read.
+    cursor = conn.cursor()
+    create_changelog(cursor)
+    after_seq += FEED_BATCH
+    cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'changelog'", (after_seq,))
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('changelog', ?)", (after_seq,))
+    cursor.execute("INSERT INTO changelog (table_name, row_id, op) VALUES ('database', 0, 'replaced')")
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), _IN_CHUNK):
+        yield ids[start:start + _IN_CHUNK]
+
+
+def collect_changes(conn, since, limit=FEED_BATCH):
+    # The rows changed after sequence number since, at most limit log entries,
+    # as plain lists so they can also be sent by the server
+    cursor = conn.cursor()
+    cursor.execute('SELECT MIN(seq), MAX(seq) FROM changelog')
+    oldest, latest = cursor.fetchone()
+    changes = {'seq': since, 'count': 0, 'missed': False, 'articles': [], 'stock': [], 'deleted': [], 'sales': []}
+    if latest is None or latest == since:
+        return changes
+    if latest < since or oldest > since + 1:
+        # Pruned past what we last saw, or gone back to an older copy of the database
+        changes.update(seq=latest, missed=True)
+        return changes
+    cursor.execute('SELECT seq, table_name, row_id, op FROM changelog WHERE seq > ? ORDER BY seq LIMIT ?',
+                   (since, limit))
+    log = cursor.fetchall()
+    changes['seq'] = log[-1][0]
+    changes['count'] = len(log)
+    if any(table == 'database' for _, table, _, _ in log):
+        changes.update(seq=latest, missed=True)
+        return changes
+
+    # What matters is each row's state now, not every step that led to it
+    articles = OrderedDict()
+    sale_ids = []
+    for _, table, row_id, op in log:
+        if table == 'sales':
+            sale_ids.append(row_id)
+        elif op == 'stock':
+            articles.setdefault(row_id, 'stock')
+        else:
+            articles[row_id] = 'delete' if op == 'delete' else 'update'
+            articles.move_to_end(row_id)
+
+    changes['deleted'] = [article_id for article_id, op in articles.items() if op == 'delete']
+    wanted = [article_id for article_id, op in articles.items() if op != 'delete']
+    current = {}
+    for chunk in _chunks(wanted):
+        cursor.execute(f"SELECT {ARTICLE_COLUMNS} FROM articles WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        current.update((row[0], row) for row in cursor.fetchall())
+    for article_id in wanted:
+        row = current.get(article_id)
+        if row is None:
+            # Deleted after this batch; a later batch reports it
+            continue
+        if articles[article_id] == 'stock':
+            changes['stock'].append([article_id, row[3]])
+        else:
+            changes['articles'].append(list(row))
+
+    for chunk in _chunks(sale_ids):
+        marks = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+            SELECT sale_id, date, total, discount, final_total, payment_type
+            FROM sales WHERE sale_id IN ({marks})
+        ''', chunk)
+        sales = {row[0]: [list(row), []] for row in cursor.fetchall()}
+        cursor.execute(f'''
+            SELECT sales_items.sale_id, sales_items.article_id, articles.name, sales_items.quantity, sales_items.price
+            FROM sales_items
+            LEFT JOIN articles ON sales_items.article_id = articles.id
+            WHERE sales_items.sale_id IN ({marks})
+        ''', chunk)
+        for sale_id, article_id, name, quantity, price in cursor.fetchall():
+            sales[sale_id][1].append([article_id, name, quantity, price])
+        changes['sales'].extend(sales[sale_id] for sale_id in chunk if sale_id in sales)
+    return changes
+
+
+class ChangeFeed:
+    # Follows the changelog for one store and publishes what changed on its
+    # events, from whichever thread calls poll(). With a local database, a poll
+    # with nothing new costs one PRAGMA data_version, which only moves when
+    # another connection has committed.
+    def __init__(self, store, batch_size=FEED_BATCH):
+        self.store = store
+        self.batch_size = batch_size
+        self.seq = store.changelog_seq()
+        self._version = store.data_version()
+
+    def poll(self):
+        # Returns the number of log entries applied
+        version = self.store.data_version()
+        if version is not None and version == self._version:
+            return 0
+        events = self.store.events
+        applied = 0
+        while True:
+            changes = self.store.changes_since(self.seq, self.batch_size)
+            # Only once the changes are in hand, so a failed poll is tried again
+            self._version = version
+            self.seq = changes['seq']
+            if changes['missed']:
+                events.publish(ChangesMissed(self.seq))
+                return applied
+            for article_id in changes['deleted']:
+                events.publish(ArticleDeleted(article_id))
+            for row in changes['articles']:
+                events.publish(ArticleChanged(Article(*row)))
+            for article_id, stock in changes['stock']:
+                events.publish(StockChanged(article_id, stock))
+            for sale, items in changes['sales']:
+                events.publish(SaleCommitted(tuple(sale), tuple(tuple(item) for item in items)))
+            applied += changes['count']
+            if changes['count'] < self.batch_size:
+                return applied
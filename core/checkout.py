@@ -0,0 +1,59 @@
+import datetime
+
+from .cart import cents_to_float
+from .db import sale_time
+from .receipts import load_receipts_from_db, make_receipt
+
+PAYMENT_TYPES = ('Cash', 'Card')
+
+
+class EmptyCartError(ValueError):
+    pass
+
+
+def cart_summary(cart):
+    # (total, discount_amount, final_total) as floats, for confirmation prompts
+    return cents_to_float(cart.net_cents), cents_to_float(cart.discount_cents), cents_to_float(cart.final_cents)
+
+
+def recorded_sale(conn, request_key):
+    # The sale id already recorded for this request key, or None
+    if request_key is None:
+        return None
+    row = conn.execute('SELECT sale_id FROM sales WHERE request_key = ?', (request_key,)).fetchone()
+    return row[0] if row else None
+
+
+def commit_sale(conn, cart, payment_type, when=None, request_key=None):
+    # Records the cart as one sale and returns its receipt; the caller owns the
+    # transaction. Stock has already been taken as items were added; the cart is left as is.
+    # request_key is the till's name for this checkout: sent again, it returns
+    # the receipt of the sale already recorded instead of adding another.
+    sale_id = recorded_sale(conn, request_key)
+    if sale_id is not None:
+        return load_receipts_from_db(conn, [sale_id])[sale_id]
+    if not cart:
+        raise EmptyCartError('Add items to the cart before payment.')
+    if payment_type not in PAYMENT_TYPES:
+        raise ValueError(f"Unknown payment type: {payment_type}")
+    # Promotion time windows may have opened or closed since items were added
+    cart.reprice_all()
+    total, discount_amount, final_total = cart_summary(cart)
+    when = when or datetime.datetime.now()
+    sale_date = when.strftime('%Y-%m-%d %H:%M:%S')
+
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO sales (ts, total, discount, final_total, payment_type, request_key)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (sale_time(when), total, cart.discount_percent, final_total, payment_type, request_key))
+    sale_id = cursor.lastrowid
+    cursor.executemany('''
+        INSERT INTO sales_items (sale_id, article_id, quantity, price, promotion, promotion_discount)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(sale_id, *item) for item in cart.sale_items()])
+
+    return make_receipt(
+        sale_id, sale_date, payment_type, cart.receipt_items(),
+        total, cart.discount_percent, discount_amount, final_total
+    )
@@ -0,0 +1,253 @@
+import sqlite3
+import calendar
+import datetime
+
+from . import querylog
+from .changefeed import create_changelog
+from .promotions import PROMOTIONS_SCHEMA
+
+DB_PATH = 'stock_management.db'
+
+# Typed tables: SQLite rejects a value of the wrong type instead of storing it
+# as it came, so reads get the types they expect without coercion. STRICT needs
+# SQLite 3.37; older versions still enforce the CHECK constraints.
+STRICT = sqlite3.sqlite_version_info >= (3, 37)
+TABLE_OPTIONS = ' STRICT' if STRICT else ''
+
+# Sales are timed by ts, whole seconds since 1970 on the shop's clock: the
+# local time counted as if it were UTC, so it turns back into the same
+# wall-clock time without time zone rules. Date ranges are index range scans
+# on ts; date is the same time as text for display, generated from ts when the
+# sale is written (generated columns need SQLite 3.31).
+SALE_DATE = "strftime('%Y-%m-%d %H:%M:%S', ts, 'unixepoch')"
+# ts for a sale dated only by text, when older tables are rebuilt
+TS_FROM_DATE = "COALESCE(CAST(strftime('%s', date) AS INTEGER), 0)"
+
+TABLES = {
+    'articles': '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            price REAL NOT NULL CHECK (price >= 0),
+            stock INTEGER NOT NULL CHECK (stock >= 0),
+            photo TEXT,
+            barcode TEXT,
+            category TEXT
+        )''' + TABLE_OPTIONS,
+    'sales': '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            date TEXT GENERATED ALWAYS AS (''' + SALE_DATE + ''') STORED,
+            total REAL NOT NULL CHECK (total >= 0),
+            discount REAL NOT NULL CHECK (discount BETWEEN 0 AND 100),
+            final_total REAL NOT NULL CHECK (final_total >= 0),
+            payment_type TEXT NOT NULL CHECK (payment_type <> ''),
+            request_key TEXT
+        )''' + TABLE_OPTIONS,
+    'sales_items': '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            sale_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sale_id INTEGER NOT NULL,
+            article_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            price REAL NOT NULL CHECK (price >= 0),
+            promotion TEXT,
+            promotion_discount REAL NOT NULL DEFAULT 0 CHECK (promotion_discount >= 0),
+            FOREIGN KEY (sale_id) REFERENCES sales(sale_id),
+            FOREIGN KEY (article_id) REFERENCES articles(id)
+        )''' + TABLE_OPTIONS,
+}
+
+# How rows are converted when a table is rebuilt, to make it STRICT or to give
+# sales their ts. Text that isn't a number becomes 0, as clean_sales_data used
+# to do, and values outside a CHECK constraint are clamped into it.
+_REBUILD_COPY = {
+    'articles': {
+        'id': 'id',
+        'name': "COALESCE(CAST(name AS TEXT), '')",
+        'price': 'MAX(COALESCE(CAST(price AS REAL), 0), 0)',
+        'stock': 'MAX(COALESCE(CAST(stock AS INTEGER), 0), 0)',
+        'photo': 'CAST(photo AS TEXT)',
+        'barcode': 'CAST(barcode AS TEXT)',
+        'category': 'CAST(category AS TEXT)',
+    },
+    'sales': {
+        'sale_id': 'sale_id',
+        'ts': TS_FROM_DATE,
+        'total': 'MAX(COALESCE(CAST(total AS REAL), 0), 0)',
+        'discount': 'MIN(MAX(COALESCE(CAST(discount AS REAL), 0), 0), 100)',
+        'final_total': 'MAX(COALESCE(CAST(final_total AS REAL), 0), 0)',
+        'payment_type': "COALESCE(NULLIF(CAST(payment_type AS TEXT), ''), 'Cash')",
+        'request_key': 'CAST(request_key AS TEXT)',
+    },
+    'sales_items': {
+        'sale_item_id': 'sale_item_id',
+        'sale_id': 'CAST(sale_id AS INTEGER)',
+        'article_id': 'CAST(article_id AS INTEGER)',
+        'quantity': 'MAX(COALESCE(CAST(quantity AS INTEGER), 1), 1)',
+        'price': 'MAX(COALESCE(CAST(price AS REAL), 0), 0)',
+        'promotion': 'CAST(promotion AS TEXT)',
+        'promotion_discount': 'MAX(COALESCE(CAST(promotion_discount AS REAL), 0), 0)',
+    },
+}
+
+SAMPLE_ARTICLES = [
+    ('Apple', 0.50, 100),
+    ('Banana', 0.30, 150),
+    ('Orange', 0.80, 80),
+    ('Milk', 1.20, 50),
+    ('Bread', 1.00, 60),
+]
+
+
+def connect(db_path=DB_PATH):
+    # All application connections come from here, so query tracing covers them all
+    query_log = querylog.configured_log()
+    if query_log is not None:
+        return querylog.connect(db_path, query_log, timeout=30)
+    return sqlite3.connect(db_path, timeout=30)
+
+
+def initialize_database(db_path=DB_PATH):
+    conn = connect(db_path)
+    create_schema(conn)
+    conn.close()
+
+
+def sale_time(value):
+    # A datetime, date or 'YYYY-MM-DD[ HH:MM:SS]' text as a ts value
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return calendar.timegm(value.timetuple())
+
+
+def _is_strict(cursor, table):
+    cursor.execute("SELECT strict FROM pragma_table_list WHERE schema = 'main' AND name = ?", (table,))
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def _has_column(cursor, table, column):
+    cursor.execute('SELECT 1 FROM pragma_table_xinfo(?) WHERE name = ?', (table, column))
+    return cursor.fetchone() is not None
+
+
+def _needs_rebuild(cursor, table):
+    if STRICT and not _is_strict(cursor, table):
+        return True
+    # Sales were dated by text alone before ts
+    return table == 'sales' and not _has_column(cursor, table, 'ts')
+
+
+def _rebuild_tables(conn):
+    # Rebuilds tables created before they were STRICT, or before sales had ts,
+    # in one transaction. Their indexes and triggers go with the old table and
+    # are created again by create_schema; the AUTOINCREMENT counters are carried
+    # over, since offline reservations can have moved them past the largest id.
+    cursor = conn.cursor()
+    tables = [table for table in TABLES if _needs_rebuild(cursor, table)]
+    if not tables:
+        return
+    if conn.in_transaction:
+        conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for table in tables:
+            columns = _REBUILD_COPY[table]
+            cursor.execute(TABLES[table].format(name=f'{table}_rebuilt'))
+            cursor.execute(f'''
+                INSERT INTO {table}_rebuilt ({', '.join(columns)})
+                SELECT {', '.join(columns.values())} FROM {table}
+            ''')
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+            row = cursor.fetchone()
+            cursor.execute(f'DROP TABLE {table}')
+            cursor.execute(f'ALTER TABLE {table}_rebuilt RENAME TO {table}')
+            if row:
+                cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (row[0], table))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def create_schema(conn):
+    # Creates missing tables, migrates older databases and seeds an empty catalogue
+    cursor = conn.cursor()
+
+    # Create the catalogue and sales tables
+    for table, definition in TABLES.items():
+        cursor.execute(definition.format(name=table))
+
+    # Add columns introduced later to databases created before they existed
+    # (the standalone POS database started out without photos)
+    cursor.execute('PRAGMA table_info(articles)')
+    existing_columns = [column[1] for column in cursor.fetchall()]
+    for column in ('photo', 'barcode', 'category'):
+        if column not in existing_columns:
+            cursor.execute(f'ALTER TABLE articles ADD COLUMN {column} TEXT')
+    # Sales from before tills tagged each checkout with a request key
+    if not _has_column(cursor, 'sales', 'request_key'):
+        cursor.execute('ALTER TABLE sales ADD COLUMN request_key TEXT')
+    # Sale lines only kept their list price before promotion savings were stored with them
+    if not _has_column(cursor, 'sales_items', 'promotion'):
+        cursor.execute('ALTER TABLE sales_items ADD COLUMN promotion TEXT')
+        cursor.execute('ALTER TABLE sales_items ADD COLUMN promotion_discount REAL NOT NULL DEFAULT 0 '
+                       'CHECK (promotion_discount >= 0)')
+    _rebuild_tables(conn)
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_articles_barcode ON articles(barcode)')
+    # Date ranges are read by ts, and their items by sale
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_ts ON sales(ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_items_sale ON sales_items(sale_id)')
+    # A checkout sent twice (the reply to the first was lost) is recorded once
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_request_key ON sales(request_key) '
+                   'WHERE request_key IS NOT NULL')
+
+    # Create promotions table
+    cursor.execute(PROMOTIONS_SCHEMA)
+
+    # Sale id blocks handed to tills for selling offline, and what their replay couldn't reconcile
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sale_id_reservations (
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            till_id TEXT NOT NULL,
+            reserved_at TEXT NOT NULL
+        )
+    ''')
+    # Stock taken under a till's request key, so a take sent twice is applied once
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_takes (
+            request_key TEXT PRIMARY KEY,
+            article_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            taken_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_conflicts (
+            conflict_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sale_id INTEGER NOT NULL,
+            till_id TEXT NOT NULL,
+            article_id INTEGER NOT NULL,
+            requested INTEGER NOT NULL,
+            available INTEGER NOT NULL,
+            recorded_at TEXT NOT NULL
+        )
+    ''')
+
+    # Photos are reference-counted by looking up the articles that use them
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_articles_photo ON articles(photo)')
+
+    # Change feed for other running processes
+    create_changelog(cursor)
+
+    # Insert sample data if articles table is empty
+    cursor.execute('SELECT COUNT(*) FROM articles')
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany('INSERT INTO articles (name, price, stock) VALUES (?, ?, ?)', SAMPLE_ARTICLES)
+
+    conn.commit()
@@ -0,0 +1,138 @@
+import os
+import socket
+import subprocess
+import threading
+
+# ESC/POS command bytes
+INIT = b'\x1b@'
+ALIGN_LEFT = b'\x1ba\x00'
+ALIGN_CENTER = b'\x1ba\x01'
+BOLD_ON = b'\x1bE\x01'
+BOLD_OFF = b'\x1bE\x00'
+DOUBLE_SIZE = b'\x1d!\x11'
+NORMAL_SIZE = b'\x1d!\x00'
+FEED_AND_CUT = b'\x1dV\x42\x00'
+
+# Characters per line in the default font (Font A, 12x24)
+PAPER_COLUMNS = {58: 32, 80: 48}
+
+PRINTER_ENV = 'CASHIER_RECEIPT_PRINTER'
+PAPER_WIDTH_ENV = 'CASHIER_RECEIPT_WIDTH'
+
+COMPANY_LINES = [
+    '1234 Market Street',
+    'City, State ZIP',
+    'Phone: (123) 456-7890',
+    'info@myretailcompany.com',
+]
+
+
+def _encode(text):
+    # Printers start in code page 437
+    return text.encode('cp437', errors='replace')
+
+
+def _columns(left, right, width):
+    space = width - len(right) - 1
+    if len(left) > space:
+        left = left[:space]
+    return left.ljust(width - len(right)) + right
+
+
+def render_escpos(receipt, paper_width=80, cut=True):
+    width = PAPER_COLUMNS.get(paper_width, PAPER_COLUMNS[80])
+    rule = '-' * width
+    lines = []
+    out = [INIT, ALIGN_CENTER, DOUBLE_SIZE, BOLD_ON, _encode('My Retail Company\n'), BOLD_OFF, NORMAL_SIZE]
+    out.append(_encode('\n'.join(COMPANY_LINES) + '\n'))
+    out.append(ALIGN_LEFT)
+
+    lines.append(rule)
+    lines.append(f"Sale ID: {receipt['sale_id']}")
+    lines.append(f"Date: {receipt['date']}")
+    lines.append(f"Payment Type: {receipt['payment_type']}")
+    lines.append(rule)
+    for name, quantity, price in receipt['items']:
+        lines.append(str(name)[:width])
+        lines.append(_columns(f"  {quantity} x {price:.2f}", f"{price * quantity:.2f}", width))
+    lines.append(rule)
+    lines.append(_columns('Total:', f"${receipt['total']:.2f}", width))
+    lines.append(_columns(f"Discount ({receipt['discount_pct']}%):", f"-${receipt['discount_amount']:.2f}", width))
+    out.append(_encode('\n'.join(lines) + '\n'))
+
+    out.append(BOLD_ON)
+    out.append(_encode(_columns('Final Total:', f"${receipt['final_total']:.2f}", width) + '\n'))
+    out.append(BOLD_OFF)
+    out.append(ALIGN_CENTER)
+    out.append(_encode('\nThank you for shopping with us!\nVisit again.\n'))
+    if cut:
+        out.append(FEED_AND_CUT)
+    return b''.join(out)
+
+
+class FilePrinter:
+    # Writes jobs to a device node such as /dev/usb/lp0, or appends them to a
+    # plain file, which makes it a stand-in printer for tests and development
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, data):
+        with self._lock:
+            with open(self.path, 'ab', buffering=0) as device:
+                device.write(data)
+
+
+class NetworkPrinter:
+    # Raw TCP printing (JetDirect / port 9100), supported by most Ethernet printers
+    def __init__(self, host, port=9100, timeout=3.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def send(self, data):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as conn:
+            conn.sendall(data)
+
+
+class SpoolPrinter:
+    # Submits a raw job to a CUPS/lpd queue through the lp command
+    def __init__(self, queue_name, timeout=10.0):
+        self.queue_name = queue_name
+        self.timeout = timeout
+
+    def send(self, data):
+        subprocess.run(
+            ['lp', '-d', self.queue_name, '-o', 'raw'],
+            input=data, check=True, capture_output=True, timeout=self.timeout
+        )
+
+
+def printer_from_uri(uri):
+    # file:/dev/usb/lp0, tcp://192.168.1.50:9100 or lp://QueueName
+    if uri.startswith('tcp://'):
+        host, _, port = uri[len('tcp://'):].partition(':')
+        return NetworkPrinter(host, int(port) if port else 9100)
+    if uri.startswith('lp://'):
+        return SpoolPrinter(uri[len('lp://'):])
+    if uri.startswith('file:'):
+        uri = uri[len('file:'):]
+    return FilePrinter(uri)
+
+
+def configured_printer():
+    uri = os.environ.get(PRINTER_ENV)
+    return printer_from_uri(uri) if uri else None
+
+
+def configured_paper_width():
+    try:
+        return int(os.environ.get(PAPER_WIDTH_ENV, 80))
+    except ValueError:
+        return 80
+
+
+def print_receipt_escpos(printer, receipt, paper_width=None):
+    if paper_width is None:
+        paper_width = configured_paper_width()
+    printer.send(render_escpos(receipt, paper_width))
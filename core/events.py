@@ -0,0 +1,57 @@
+import logging
+from collections import namedtuple
+
+from .catalogue import Article
+
+# What the Store publishes after a write has been committed. Each event carries
+# the rows that changed, so views can patch what they show instead of
+# re-querying whole tables.
+
+# An article was added or edited; article is the full Article row
+ArticleChanged = namedtuple('ArticleChanged', 'article')
+ArticleDeleted = namedtuple('ArticleDeleted', 'article_id')
+StockChanged = namedtuple('StockChanged', 'article_id stock')
+# sale is a row as sales_history returns it:
+#   (sale_id, date, total, discount, final_total, payment_type)
+# items are (article_id, name, quantity, price)
+SaleCommitted = namedtuple('SaleCommitted', 'sale items')
+# Published by the change feed when it fell behind changes that have since been
+# pruned from the changelog; views reload in full
+ChangesMissed = namedtuple('ChangesMissed', 'seq')
+
+logger = logging.getLogger('cashier.events')
+
+
+class EventBus:
+    # Handlers are looked up by the exact event type and called synchronously,
+    # on the publishing thread, in the order they subscribed. A failing handler
+    # is logged and doesn't stop the others: the write it reports has already
+    # been committed.
+    def __init__(self):
+        self._handlers = {}
+
+    def subscribe(self, event_type, handler):
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def unsubscribe(self, event_type, handler):
+        handlers = self._handlers.get(event_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def publish(self, event):
+        for handler in list(self._handlers.get(type(event), ())):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception('%s handler %r failed', type(event).__name__, handler)
+
+
+def article_changed(article_id, name, price, stock, photo=None, barcode=None, category=None):
+    return ArticleChanged(Article(article_id, name, price, stock, photo, barcode, category))
+
+
+def sale_committed(receipt, cart):
+    sale = (receipt['sale_id'], receipt['date'], receipt['total'], receipt['discount_pct'],
+            receipt['final_total'], receipt['payment_type'])
+    items = tuple((line.article_id, line.name, line.quantity, line.unit_cents / 100) for line in cart)
+    return SaleCommitted(sale, items)
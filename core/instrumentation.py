@@ -0,0 +1,117 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from functools import wraps
+
+# Off unless CASHIER_TIMINGS is set (or enabled from the diagnostics tab); when
+# off, a timed call costs one flag check
+WINDOW = 1000
+_enabled = os.environ.get('CASHIER_TIMINGS', '') not in ('', '0')
+_histograms = {}
+_lock = threading.Lock()
+
+
+class LatencyHistogram:
+    # Rolling window of the most recent samples, plus all-time count and total
+    __slots__ = ('samples', 'count', 'total')
+
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return None
+
+        def percentile(q):
+            # Nearest rank
+            return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+        return {
+            'count': self.count,
+            'mean': self.total / self.count,
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+            'max': samples[-1],
+        }
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def record(name, seconds):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(name, LatencyHistogram())
+    histogram.record(seconds)
+
+
+class span:
+    # with span('process_payment'): ...
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if _enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is not None:
+            record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timed(name=None):
+    # @timed('load_history') on a function or method
+    def decorate(func):
+        label = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    # name -> summary dict (seconds), for operations that have samples
+    with _lock:
+        histograms = list(_histograms.items())
+    summaries = {}
+    for name, histogram in histograms:
+        summary = histogram.summary()
+        if summary:
+            summaries[name] = summary
+    return summaries
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
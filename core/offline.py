@@ -0,0 +1,432 @@
+import os
+import json
+import socket
+import logging
+import sqlite3
+import datetime
+import threading
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from .catalogue import stock_taken
+from .checkout import EmptyCartError, cart_summary, recorded_sale
+from .db import sale_time
+from .receipts import make_receipt
+
+# A till that can't reach the database (or the server) keeps selling: each sale
+# is appended to a local journal under a sale id from a block the till reserved
+# while it was online, and a background agent replays the journal once the
+# database is reachable again.
+JOURNAL_DIR = 'journal'
+TILL_ENV = 'CASHIER_TILL_ID'
+RESERVE_BLOCK = 100   # sale ids reserved at a time
+RESERVE_LOW = 20      # reserve another block when fewer than this are left
+SYNC_INTERVAL = 5
+SYNC_BATCH = 100
+# The journal is rewritten without its synced sales once they take up this much
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+# Request keys of stock takes are kept this long, for journals replayed late
+STOCK_TAKE_DAYS = 30
+# With write-ahead checkout, every sale goes to the journal first and the agent
+# applies it to the database moments later, off the cashier's critical path
+WRITE_AHEAD_ENV = 'CASHIER_WRITE_AHEAD'
+
+# Errors that mean the database can't be reached right now, rather than a bad request
+OFFLINE_ERRORS = (OSError, sqlite3.OperationalError)
+
+logger = logging.getLogger('cashier.sync')
+
+
+def _now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# fdatasync skips the inode timestamps a journal append doesn't need
+_fsync = getattr(os, 'fdatasync', os.fsync)
+
+
+def write_ahead_enabled():
+    return os.environ.get(WRITE_AHEAD_ENV, '') not in ('', '0')
+
+
+def till_id():
+    return os.environ.get(TILL_ENV) or socket.gethostname()
+
+
+def journal_path(till=None, directory=JOURNAL_DIR):
+    return os.path.join(directory, f"{till or till_id()}.jsonl")
+
+
+# Database side: both run inside the caller's transaction
+
+
+def reserve_sale_ids(conn, till, count=RESERVE_BLOCK):
+    # Returns [first, last]. The sales table's AUTOINCREMENT counter is moved past
+    # the block, so sales committed online never take one of its ids.
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT MAX(COALESCE((SELECT MAX(last_id) FROM sale_id_reservations), 0),
+                   COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'sales'), 0),
+                   COALESCE((SELECT MAX(sale_id) FROM sales), 0))
+    ''')
+    first = cursor.fetchone()[0] + 1
+    last = first + count - 1
+    cursor.execute('INSERT INTO sale_id_reservations (first_id, last_id, till_id, reserved_at) VALUES (?, ?, ?, ?)',
+                   (first, last, till, _now()))
+    cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'sales'", (last,))
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('sales', ?)", (last,))
+    # Tills reserve whenever they come online, which makes this a good time to forget old keys
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=STOCK_TAKE_DAYS)
+    cursor.execute('DELETE FROM stock_takes WHERE taken_at < ?', (cutoff.strftime('%Y-%m-%d %H:%M:%S'),))
+    return [first, last]
+
+
+def replay_sales(conn, till, records):
+    # Applies journaled sales as they were rung up. A sale id that is already
+    # there was replayed before (the till went down before noting it), so it is
+    # skipped, as is a sale whose request key is there: the server recorded it
+    # but its reply never reached the till. Stock the till couldn't take while offline is taken now; where
+    # there isn't enough, the sale still stands (the goods have left the shop),
+    # stock stops at zero and the shortfall is recorded in stock_conflicts.
+    # Returns one [applied, conflicts] per record.
+    cursor = conn.cursor()
+    results = []
+    for record in records:
+        cursor.execute('SELECT 1 FROM sales WHERE sale_id = ?', (record['sale_id'],))
+        if cursor.fetchone() or recorded_sale(conn, record.get('request_key')) is not None:
+            results.append([False, []])
+            continue
+        cursor.execute('''
+            INSERT INTO sales (sale_id, ts, total, discount, final_total, payment_type, request_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (record['sale_id'], sale_time(record['date']), record['total'], record['discount'],
+              record['final_total'], record['payment_type'], record.get('request_key')))
+        # Items journaled before promotions were stored with them have three fields
+        cursor.executemany('''
+            INSERT INTO sales_items (sale_id, article_id, quantity, price, promotion, promotion_discount)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(record['sale_id'], *item[:3], *(item[3:] or [None, 0])) for item in record['items']])
+        conflicts = []
+        for article_id, quantity, *request_key in record['stock']:
+            # The take reached the database after all; its reply was lost
+            if request_key and stock_taken(conn, request_key[0]):
+                continue
+            cursor.execute('SELECT stock FROM articles WHERE id = ?', (article_id,))
+            row = cursor.fetchone()
+            available = row[0] if row else 0
+            if available < quantity:
+                conflicts.append([article_id, quantity, available])
+                cursor.execute('''
+                    INSERT INTO stock_conflicts (sale_id, till_id, article_id, requested, available, recorded_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (record['sale_id'], till, article_id, quantity, available, _now()))
+            cursor.execute('UPDATE articles SET stock = MAX(stock - ?, 0) WHERE id = ?', (quantity, article_id))
+        results.append([True, conflicts])
+    return results
+
+
+def _fsync_directory(directory):
+    # Makes a rename durable; Windows has no directory handles to sync
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class OutOfSaleIdsError(RuntimeError):
+    pass
+
+
+class JournalInUseError(RuntimeError):
+    pass
+
+
+def _lock_file(f):
+    # Non-blocking exclusive lock, held until the file is closed
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+class SalesJournal:
+    # Append-only JSON lines: "reserve" records for each block of sale ids, and
+    # "sale" records. Every append is fsynced before the sale is confirmed, as a
+    # group commit: one fsync covers every record written before it, so appends
+    # from several threads share it. How far the journal has been replayed is
+    # kept next to it, in <path>.synced; once the replayed part is large, the
+    # journal is rewritten without it. One process at a time owns a journal:
+    # two would hand out the same sale ids.
+    def __init__(self, path):
+        self.path = path
+        self.synced_path = path + '.synced'
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.blocks = []
+        self.next_id = None
+        self.sales = []  # (end offset, record) for every sale in the journal
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The lock is on a file of its own, as compacting replaces the journal
+        self._lock_file = open(path + '.lock', 'a+b')
+        try:
+            _lock_file(self._lock_file)
+        except OSError:
+            self._lock_file.close()
+            raise JournalInUseError(
+                f"{path} is in use by another till on this computer. Give each till "
+                f"its own journal with the {TILL_ENV} environment variable."
+            )
+        self._load()
+        self._file = open(path, 'ab')
+        self._durable = self._file.tell()
+
+    def _load(self):
+        offset = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn write from a crash; the sale was never confirmed
+                        break
+                    offset += len(line)
+                    self._apply(json.loads(line), offset)
+            if offset != os.path.getsize(self.path):
+                with open(self.path, 'r+b') as f:
+                    f.truncate(offset)
+        self.synced = 0
+        if os.path.exists(self.synced_path):
+            with open(self.synced_path) as f:
+                self.synced = int(f.read().strip() or 0)
+        self.sales = [(end, record) for end, record in self.sales if end > self.synced]
+
+    def _apply(self, record, offset):
+        if record['type'] == 'reserve':
+            self.blocks.append(record['ids'])
+            if self.next_id is None:
+                self._advance()
+        elif record['type'] == 'sale':
+            self.sales.append((offset, record))
+            self.next_id = record['sale_id'] + 1
+            self._advance()
+
+    def _advance(self):
+        # Moves next_id into the first block that still has ids left
+        while self.blocks:
+            first, last = self.blocks[0]
+            if self.next_id is None or self.next_id < first:
+                self.next_id = first
+            if self.next_id <= last:
+                return
+            self.blocks.pop(0)
+        self.next_id = None
+
+    def _append(self, record):
+        # Called under _lock; the record is on disk once _sync(offset) returns
+        data = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+        self._file.write(data)
+        self._file.flush()
+        return self._file.tell()
+
+    def _sync(self, offset):
+        with self._sync_lock:
+            if self._durable >= offset:
+                # An fsync started after this record was written has covered it
+                return
+            with self._lock:
+                written = self._file.tell()
+            _fsync(self._file.fileno())
+            self._durable = written
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._lock_file.close()
+
+    def ids_left(self):
+        with self._lock:
+            return sum(last - max(first, self.next_id or first) + 1 for first, last in self.blocks)
+
+    def add_block(self, ids):
+        with self._lock:
+            record = {'type': 'reserve', 'ids': list(ids)}
+            offset = self._append(record)
+            self._apply(record, offset)
+        self._sync(offset)
+
+    def record_sale(self, cart, payment_type, pending_stock=(), when=None, request_key=None):
+        # Journals the cart as a sale and returns its receipt. pending_stock is
+        # [(article_id, quantity, request_key)] the till sold without taking it
+        # from stock, with the key each take was sent under;
+        # request_key is the checkout's key when it was also sent to the database.
+        if not cart:
+            raise EmptyCartError('Add items to the cart before payment.')
+        cart.reprice_all()
+        total, discount_amount, final_total = cart_summary(cart)
+        sale_date = (when or datetime.datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            if self.next_id is None:
+                raise OutOfSaleIdsError('This till has no reserved sale numbers left to sell offline.')
+            record = {
+                'type': 'sale',
+                'sale_id': self.next_id,
+                'date': sale_date,
+                'total': total,
+                'discount': cart.discount_percent,
+                'final_total': final_total,
+                'payment_type': payment_type,
+                'items': [list(item) for item in cart.sale_items()],
+                'stock': [list(entry) for entry in pending_stock],
+                'request_key': request_key,
+            }
+            offset = self._append(record)
+            self._apply(record, offset)
+        self._sync(offset)
+        return make_receipt(
+            record['sale_id'], sale_date, payment_type, cart.receipt_items(),
+            total, cart.discount_percent, discount_amount, final_total
+        )
+
+    def unsynced(self, limit=SYNC_BATCH):
+        with self._lock:
+            # Not before it is durable: a sale lost in a crash must not reach the database
+            pending = [(offset, record) for offset, record in self.sales if self.synced < offset <= self._durable]
+        return pending[:limit]
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for offset, _ in self.sales if offset > self.synced)
+
+    def _write_synced(self, offset):
+        tmp_path = self.synced_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.synced_path)
+        self.synced = offset
+
+    def mark_synced(self, offset):
+        with self._lock:
+            self._write_synced(offset)
+            # Synced sales are only needed again if the journal is reopened
+            self.sales = [(end, record) for end, record in self.sales if end > offset]
+        if offset >= JOURNAL_COMPACT_BYTES:
+            self.compact()
+
+    def compact(self):
+        # Rewrites the journal as the sale ids still reserved and the sales not
+        # yet synced. The new file is on disk before .synced is reset and it
+        # replaces the old one; a crash in between replays the old journal from
+        # the start, and the replay skips the sales it already has.
+        with self._sync_lock, self._lock:
+            records = []
+            if self.blocks:
+                # The used part of the current block is left out; next_id starts the new one
+                first, last = self.blocks[0]
+                records.append({'type': 'reserve', 'ids': [max(first, self.next_id), last]})
+                records.extend({'type': 'reserve', 'ids': list(ids)} for ids in self.blocks[1:])
+            tail = [record for end, record in self.sales if end > self.synced]
+            tmp_path = self.path + '.tmp'
+            sales = []
+            offset = 0
+            with open(tmp_path, 'wb') as f:
+                for record in records + tail:
+                    data = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+                    f.write(data)
+                    offset += len(data)
+                    if record['type'] == 'sale':
+                        sales.append((offset, record))
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            self._write_synced(0)
+            os.replace(tmp_path, self.path)
+            _fsync_directory(os.path.dirname(self.path))
+            self._file = open(self.path, 'ab')
+            self.sales = sales
+            self._durable = offset
+
+
+SyncReport = namedtuple('SyncReport', 'online replayed duplicates conflicts pending')
+
+
+class SyncAgent:
+    # Background thread that keeps a block of sale ids in reserve and replays
+    # the journal into the store in batches. on_report(SyncReport) is called
+    # from the agent's thread whenever something changed.
+    def __init__(self, store, journal, till=None, interval=SYNC_INTERVAL, batch_size=SYNC_BATCH, on_report=None):
+        self.store = store
+        self.journal = journal
+        self.till = till or till_id()
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_report = on_report
+        self.online = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sync-agent', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sync_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def sync_once(self):
+        replayed = duplicates = 0
+        conflicts = []
+        was_online = self.online
+        try:
+            if self.journal.ids_left() < RESERVE_LOW:
+                self.journal.add_block(self.store.reserve_sale_ids(self.till, RESERVE_BLOCK))
+            while True:
+                pending = self.journal.unsynced(self.batch_size)
+                if not pending:
+                    break
+                results = self.store.replay_sales(self.till, [record for _, record in pending])
+                for (_, record), (applied, sale_conflicts) in zip(pending, results):
+                    if applied:
+                        replayed += 1
+                    else:
+                        duplicates += 1
+                    conflicts.extend([record['sale_id']] + conflict for conflict in sale_conflicts)
+                self.journal.mark_synced(pending[-1][0])
+            self.online = True
+        except OFFLINE_ERRORS as e:
+            if self.online is not False:
+                logger.warning('Database unreachable, selling offline: %s', e)
+            self.online = False
+        except Exception:
+            # A record the store rejects stays in the journal; say so every time it is retried
+            logger.exception('Journal sync failed')
+        for sale_id, article_id, requested, available in conflicts:
+            logger.warning('Sale %s sold %s of article %s with only %s in stock',
+                           sale_id, requested, article_id, available)
+        report = SyncReport(self.online, replayed, duplicates, conflicts, self.journal.pending_count())
+        if replayed:
+            logger.info('Replayed %d offline sales (%d already applied, %d stock conflicts)',
+                        replayed, duplicates, len(conflicts))
+        if self.on_report and (replayed or duplicates or self.online != was_online):
+            self.on_report(report)
+        return report
@@ -0,0 +1,134 @@
+import datetime
+
+from .cart import to_cents, to_basis_points, percent_of
+
+# Promotion kinds
+PERCENT = 'percent'    # percent off the line
+MULTIBUY = 'multibuy'  # buy N, pay for M ("3 for 2") or buy N for a fixed price
+
+PROMOTIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS promotions (
+        promotion_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        article_id INTEGER,
+        category TEXT,
+        percent REAL,
+        buy_quantity INTEGER,
+        pay_quantity INTEGER,
+        bundle_price REAL,
+        starts_at TEXT,
+        ends_at TEXT,
+        active INTEGER NOT NULL DEFAULT 1,
+        FOREIGN KEY (article_id) REFERENCES articles(id)
+    )
+'''
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value)
+
+
+class Promotion:
+    __slots__ = (
+        'promotion_id', 'name', 'kind', 'article_id', 'category', 'percent_bp',
+        'buy_quantity', 'pay_quantity', 'bundle_cents', 'starts_at', 'ends_at'
+    )
+
+    def __init__(self, promotion_id, name, kind, article_id=None, category=None, percent=None,
+                 buy_quantity=None, pay_quantity=None, bundle_price=None, starts_at=None, ends_at=None):
+        self.promotion_id = promotion_id
+        self.name = name
+        self.kind = kind
+        self.article_id = article_id
+        self.category = category
+        self.percent_bp = to_basis_points(percent) if percent is not None else 0
+        self.buy_quantity = buy_quantity
+        self.pay_quantity = pay_quantity
+        self.bundle_cents = to_cents(bundle_price) if bundle_price is not None else None
+        self.starts_at = _parse_time(starts_at)
+        self.ends_at = _parse_time(ends_at)
+
+    def active_at(self, now):
+        if self.starts_at and now < self.starts_at:
+            return False
+        if self.ends_at and now >= self.ends_at:
+            return False
+        return True
+
+    def discount_cents(self, unit_cents, quantity):
+        if self.kind == PERCENT:
+            return percent_of(unit_cents * quantity, self.percent_bp)
+        if self.kind == MULTIBUY and self.buy_quantity:
+            groups = quantity // self.buy_quantity
+            if self.bundle_cents is not None:
+                saving = self.buy_quantity * unit_cents - self.bundle_cents
+            else:
+                saving = (self.buy_quantity - (self.pay_quantity or 0)) * unit_cents
+            return max(groups * saving, 0)
+        return 0
+
+
+class PromotionEngine:
+    # Promotions are compiled into lookups by article id and by category, so a
+    # cart change only evaluates the handful of rules that can touch that line,
+    # however many promotions are active overall. Rules do not stack: each line
+    # gets the single best applicable promotion.
+    def __init__(self, promotions=()):
+        self.by_article = {}
+        self.by_category = {}
+        self._candidates = {}
+        for promotion in promotions:
+            if promotion.article_id is not None:
+                self.by_article.setdefault(promotion.article_id, []).append(promotion)
+            elif promotion.category:
+                self.by_category.setdefault(promotion.category, []).append(promotion)
+
+    def __len__(self):
+        return sum(map(len, self.by_article.values())) + sum(map(len, self.by_category.values()))
+
+    def candidates(self, article_id, category):
+        key = (article_id, category)
+        rules = self._candidates.get(key)
+        if rules is None:
+            rules = self.by_article.get(article_id, []) + self.by_category.get(category, [])
+            self._candidates[key] = rules
+        return rules
+
+    def best(self, article_id, category, unit_cents, quantity, now=None):
+        # Returns (discount_cents, promotion); (0, None) when nothing applies
+        rules = self.candidates(article_id, category)
+        if not rules:
+            return 0, None
+        now = now or datetime.datetime.now()
+        best_cents, best_rule = 0, None
+        for rule in rules:
+            if not rule.active_at(now):
+                continue
+            cents = min(rule.discount_cents(unit_cents, quantity), unit_cents * quantity)
+            if cents > best_cents:
+                best_cents, best_rule = cents, rule
+        return best_cents, best_rule
+
+
+def active_promotion_rows(conn):
+    # Promotions that have already ended are not compiled at all
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT promotion_id, name, kind, article_id, category, percent,
+               buy_quantity, pay_quantity, bundle_price, starts_at, ends_at
+        FROM promotions
+        WHERE active = 1 AND (ends_at IS NULL OR ends_at > ?)
+    ''', (now,))
+    return cursor.fetchall()
+
+
+def build_engine(rows):
+    return PromotionEngine(Promotion(*row) for row in rows)
+
+
+def load_promotions(conn):
+    return build_engine(active_promotion_rows(conn))
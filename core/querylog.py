@@ -0,0 +1,280 @@
+import os
+import re
+import time
+import logging
+import sqlite3
+import threading
+from logging.handlers import RotatingFileHandler
+
+# Set CASHIER_SLOW_QUERY_MS to log statements slower than that many milliseconds
+# (0 logs every statement). Unset, connections are plain sqlite3 connections.
+THRESHOLD_ENV = 'CASHIER_SLOW_QUERY_MS'
+LOG_PATH_ENV = 'CASHIER_SLOW_QUERY_LOG'
+LOG_PATH = os.path.join('logs', 'slow_queries.log')
+MAX_LOG_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 5
+
+_PLANNABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _describe(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return f"str[{len(value)}]"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"blob[{len(value)}]"
+    return type(value).__name__
+
+
+def param_shape(params):
+    # Types and lengths only; values never reach the log
+    if not params:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f"{key}: {_describe(value)}" for key, value in params.items()) + '}'
+    return '(' + ', '.join(_describe(value) for value in params) + ')'
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, path=LOG_PATH, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+        self.threshold = threshold_ms / 1000
+        self.path = path
+        self._plans = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(f"cashier.slow_queries.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        self.logger.addHandler(handler)
+
+    def close(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+
+    def plan(self, conn, sql, params):
+        # Plans are cached per statement text; a statement's plan only changes with the schema
+        key = (conn.db_path, sql)
+        with self._lock:
+            if key in self._plans:
+                return self._plans[key]
+        if not sql.lstrip().upper().startswith(_PLANNABLE):
+            plan = None
+        else:
+            try:
+                rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, params or ()).fetchall()
+                depth = {0: -1}
+                lines = []
+                for node_id, parent, _, detail in rows:
+                    depth[node_id] = depth.get(parent, -1) + 1
+                    lines.append('  ' * depth[node_id] + detail)
+                plan = lines
+            except sqlite3.Error as e:
+                plan = [f"(no plan: {e})"]
+        with self._lock:
+            self._plans[key] = plan
+        return plan
+
+    def record(self, conn, sql, params, seconds, rows, executions=1):
+        # rows is None for statements timed through the trace callback
+        if seconds < self.threshold:
+            return
+        shape = param_shape(params)
+        if executions != 1:
+            shape = f"{executions} x {shape}"
+        counted = 'traced' if rows is None else f"{rows} rows"
+        lines = [
+            f"{seconds * 1000:.1f} ms, {counted}, {conn.db_path}",
+            f"  sql: {_WHITESPACE.sub(' ', sql).strip()}",
+            f"  params: {shape}",
+        ]
+        plan = self.plan(conn, sql, params)
+        if plan:
+            lines.append('  plan:')
+            lines.extend('    ' + line for line in plan)
+        self.logger.info('\n'.join(lines))
+
+
+class TracedConnection(sqlite3.Connection):
+    # Created through connect(); every cursor it hands out is a TracedCursor.
+    # Statements that don't go through a cursor's execute - commits, rollbacks
+    # and executescript() - are caught by the trace callback instead, and each
+    # is timed until the next one starts or the call returns.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.db_path = str(args[0] if args else kwargs.get('database'))
+        self.query_log = None
+        self._traced = None  # (statement, start) while a call timed by tracing runs
+        self.set_trace_callback(self._trace)
+
+    def _trace(self, statement):
+        # Called as each statement starts; the cursor wrappers time the rest
+        if self._traced is not None:
+            self._traced.append((statement, time.perf_counter()))
+
+    def _timed_by_trace(self, method, *args):
+        if self.query_log is None or self._traced is not None:
+            return method(*args)
+        self._traced = []
+        try:
+            return method(*args)
+        finally:
+            end = time.perf_counter()
+            traced, self._traced = self._traced, None
+            self._record_traced(traced, end)
+
+    def _record_traced(self, traced, end):
+        statements = []
+        for statement, start in traced:
+            # SQLite traces trigger programs with their statement's text again,
+            # and programs it runs internally (table-valued pragmas) as "-- ...";
+            # both are part of the statement before them
+            if statements and (statement.startswith('-- ') or statement == statements[-1][0]):
+                continue
+            statements.append((statement, start))
+        for i, (statement, start) in enumerate(statements):
+            finish = statements[i + 1][1] if i + 1 < len(statements) else end
+            self.query_log.record(self, statement, None, finish - start, None)
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or TracedCursor)
+
+    # The shortcuts on sqlite3.Connection don't go through cursor(), so route them
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def executescript(self, script):
+        return self._timed_by_trace(super().executescript, script)
+
+    def commit(self):
+        return self._timed_by_trace(super().commit)
+
+    def rollback(self):
+        return self._timed_by_trace(super().rollback)
+
+    # "with conn:" commits or rolls back without calling the methods above
+    def __exit__(self, *exc):
+        return self._timed_by_trace(super().__exit__, *exc)
+
+
+class TracedCursor(sqlite3.Cursor):
+    # Times a statement from execute() until its last row has been fetched
+    _pending = None
+
+    def _start(self, sql, params, executions, seconds):
+        self._pending = [sql, params, executions, seconds, 0]
+        if self.description is None:
+            # Nothing to fetch: DML, DDL, PRAGMA without results
+            self._pending[4] = max(self.rowcount, 0)
+            self._finish()
+
+    def _add(self, seconds, rows):
+        pending = self._pending
+        if pending is not None:
+            pending[3] += seconds
+            pending[4] += rows
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        conn = self.connection
+        if conn.query_log is not None:
+            sql, params, executions, seconds, rows = pending
+            conn.query_log.record(conn, sql, params, seconds, rows, executions)
+
+    def execute(self, sql, params=()):
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, params)
+        self._start(sql, params, 1, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        first = []
+        count = 0
+
+        def counting(params_iter):
+            nonlocal count
+            for params in params_iter:
+                if not first:
+                    first.append(params)
+                count += 1
+                yield params
+
+        start = time.perf_counter()
+        super().executemany(sql, counting(seq_of_params))
+        self._start(sql, first[0] if first else (), count, time.perf_counter() - start)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - start, 0 if row is None else 1)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._add(time.perf_counter() - start, len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - start, len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - start, 0)
+            self._finish()
+            raise
+        self._add(time.perf_counter() - start, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+def connect(db_path, query_log, **kwargs):
+    conn = sqlite3.connect(db_path, factory=TracedConnection, **kwargs)
+    conn.query_log = query_log
+    return conn
+
+
+_configured = None
+_configured_lock = threading.Lock()
+
+
+def configured_log():
+    # The process-wide slow-query log from the environment, or None when disabled
+    global _configured
+    threshold = os.environ.get(THRESHOLD_ENV, '').strip()
+    if not threshold:
+        return None
+    with _configured_lock:
+        if _configured is None:
+            _configured = SlowQueryLog(float(threshold), os.environ.get(LOG_PATH_ENV) or LOG_PATH)
+        return _configured
@@ -0,0 +1,532 @@
+import os
+import atexit
+import base64
+import html
+import json
+import logging
+import itertools
+import queue
+import threading
+import time
+import zlib
+from string import Template
+
+from . import sales_archive
+from .db import connect
+
+LOGO_PATH = os.path.join('images', 'logo.png')
+RECEIPTS_DIR = 'receipts'
+ARCHIVE_PATH = os.path.join(RECEIPTS_DIR, 'archive.db')
+# Receipts the writer couldn't save by shutdown, saved again on the next start
+PENDING_PATH = os.path.join(RECEIPTS_DIR, 'pending.jsonl')
+SHUTDOWN_ATTEMPTS = 3
+
+logger = logging.getLogger('cashier.receipts')
+
+RECEIPT_STYLE = '''
+        body {
+            font-family: Courier, monospace;
+            width: 400px;
+        }
+        .header {
+            text-align: center;
+        }
+        .header img {
+            max-width: 150px;
+            height: auto;
+        }
+        .company-details {
+            text-align: center;
+            margin-bottom: 20px;
+        }
+        .items {
+            width: 100%;
+            border-collapse: collapse;
+        }
+        .items th, .items td {
+            border: 1px solid #000;
+            padding: 5px;
+            text-align: left;
+        }
+        .totals {
+            margin-top: 20px;
+            width: 100%;
+        }
+        .totals td {
+            padding: 5px;
+        }
+        .footer {
+            text-align: center;
+            margin-top: 20px;
+        }
+'''
+
+# Everything up to the item rows only changes when the logo does,
+# so it is substituted once per logo version and reused for every sale.
+HEAD_TEMPLATE = Template('''<html>
+<head>
+    <style>$style</style>
+</head>
+<body>
+    <div class="header">
+        $logo
+    </div>
+    <div class="company-details">
+        <h2>My Retail Company</h2>
+        <p>1234 Market Street<br>
+        City, State ZIP<br>
+        Phone: (123) 456-7890<br>
+        Email: info@myretailcompany.com</p>
+    </div>
+    <hr>
+''')
+
+SALE_TEMPLATE = Template('''    <p><strong>Sale ID:</strong> $sale_id<br>
+    <strong>Date:</strong> $date<br>
+    <strong>Payment Type:</strong> $payment_type</p>
+    <table class="items">
+        <tr>
+            <th>Item</th>
+            <th>Qty</th>
+            <th>Price ($$)</th>
+            <th>Total ($$)</th>
+        </tr>
+$rows    </table>
+    <table class="totals">
+        <tr>
+            <td><strong>Total:</strong></td>
+            <td>$$$total</td>
+        </tr>
+        <tr>
+            <td><strong>Discount ($discount_pct%):</strong></td>
+            <td>-$$$discount_amount</td>
+        </tr>
+        <tr>
+            <td><strong>Final Total:</strong></td>
+            <td>$$$final_total</td>
+        </tr>
+    </table>
+    <div class="footer">
+        <p>Thank you for shopping with us!</p>
+        <p>Visit again.</p>
+    </div>
+</body>
+</html>
+''')
+
+ROW_FORMAT = '        <tr><td>{}</td><td>{}</td><td>{:.2f}</td><td>{:.2f}</td></tr>\n'
+
+
+def encode_image_to_base64(image_path):
+    if not os.path.exists(image_path):
+        return ''
+    with open(image_path, 'rb') as image_file:
+        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
+    return encoded_string
+
+
+class AssetCache:
+    # Keeps loaded assets in memory and reloads one only when its file changes
+    def __init__(self, loader):
+        self.loader = loader
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != version:
+                entry = (version, self.loader(path))
+                self._entries[path] = entry
+            return entry[1]
+
+
+def _build_head(logo_path):
+    logo_base64 = encode_image_to_base64(logo_path)
+    logo = f"<img src='data:image/png;base64,{logo_base64}' />" if logo_base64 else ''
+    return HEAD_TEMPLATE.substitute(style=RECEIPT_STYLE, logo=logo)
+
+
+def _linked_head_builder(logo_url):
+    # Refers to the logo by URL instead of embedding it, for renderers that
+    # register the image once as a document resource
+    def build(logo_path):
+        return HEAD_TEMPLATE.substitute(style=RECEIPT_STYLE, logo=f"<img src='{logo_url}' />")
+    return build
+
+
+def make_receipt(sale_id, date, payment_type, items, total, discount_pct, discount_amount, final_total):
+    # Compact, serialisable receipt record: items are (name, quantity, price)
+    return {
+        'sale_id': sale_id,
+        'date': date,
+        'payment_type': payment_type,
+        'items': list(items),
+        'total': total,
+        'discount_pct': discount_pct,
+        'discount_amount': discount_amount,
+        'final_total': final_total,
+    }
+
+
+class ReceiptRenderer:
+    def __init__(self, logo_path=LOGO_PATH, logo_url=None):
+        self.logo_path = logo_path
+        self.assets = AssetCache(_linked_head_builder(logo_url) if logo_url else _build_head)
+        self._empty_head = HEAD_TEMPLATE.substitute(style=RECEIPT_STYLE, logo='')
+
+    def render_html(self, receipt):
+        head = self.assets.get(self.logo_path) or self._empty_head
+        rows = ''.join([
+            ROW_FORMAT.format(html.escape(str(name)), quantity, price, price * quantity)
+            for name, quantity, price in receipt['items']
+        ])
+        return head + SALE_TEMPLATE.substitute(
+            sale_id=receipt['sale_id'],
+            date=receipt['date'],
+            payment_type=html.escape(str(receipt['payment_type'])),
+            rows=rows,
+            total=f"{receipt['total']:.2f}",
+            discount_pct=receipt['discount_pct'],
+            discount_amount=f"{receipt['discount_amount']:.2f}",
+            final_total=f"{receipt['final_total']:.2f}",
+        )
+
+
+default_renderer = ReceiptRenderer()
+
+
+def render_receipt_html(receipt):
+    return default_renderer.render_html(receipt)
+
+
+def render_receipt_text(receipt):
+    # Plain-text receipt, as shown by the standalone POS
+    lines = [
+        "----- Receipt -----",
+        f"Sale ID: {receipt['sale_id']}",
+        f"Date: {receipt['date']}",
+        "",
+        "Items:",
+    ]
+    for name, quantity, price in receipt['items']:
+        lines.append(f"{name} x{quantity} @ ${price:.2f} each: ${price * quantity:.2f}")
+    lines += [
+        "",
+        f"Total: ${receipt['total']:.2f}",
+        f"Discount: ${receipt['discount_amount']:.2f}",
+        f"Final Total: ${receipt['final_total']:.2f}",
+        "-------------------",
+    ]
+    return "\n".join(lines)
+
+
+def receipt_path(sale_id, directory=RECEIPTS_DIR):
+    # Sale IDs are unique, so two sales in the same second no longer collide
+    return os.path.join(directory, f"receipt_{sale_id:08d}.html")
+
+
+def write_receipt_files(batch, directory=RECEIPTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for sale_id, content in batch:
+        path = receipt_path(sale_id, directory)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+# Receipt records share most of their bytes (keys, payment types, number formats),
+# so a preset dictionary lets zlib compress even a one-line receipt well.
+# Never change it in place: stored records depend on it, bump ARCHIVE_FORMAT instead.
+ARCHIVE_FORMAT = 1
+ARCHIVE_ZDICT = (
+    b'{"sale_id": , "date": "20 00:00:00", "payment_type": "Cash", "Card", '
+    b'"items": [[", 1, 0.5], [", 2, 1.0]], "total": , "discount_pct": 0.0, '
+    b'"discount_amount": 0.0, "final_total": 0.00 .50 .99'
+)
+
+
+def pack_receipt(receipt):
+    compressor = zlib.compressobj(9, zdict=ARCHIVE_ZDICT)
+    data = json.dumps(receipt, separators=(',', ':')).encode('utf-8')
+    return bytes([ARCHIVE_FORMAT]) + compressor.compress(data) + compressor.flush()
+
+
+def unpack_receipt(blob):
+    if blob[0] != ARCHIVE_FORMAT:
+        raise ValueError(f"Unsupported receipt archive format {blob[0]}")
+    decompressor = zlib.decompressobj(zdict=ARCHIVE_ZDICT)
+    data = decompressor.decompress(blob[1:]) + decompressor.flush()
+    return json.loads(data)
+
+
+class ReceiptArchive:
+    # One SQLite file holding the compressed receipt record of every sale,
+    # indexed by sale_id. The logo and stylesheet are not stored; receipts are
+    # re-rendered from the shared template when they are viewed.
+    def __init__(self, path=ARCHIVE_PATH, renderer=None):
+        self.path = path
+        self.renderer = renderer or default_renderer
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self.connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS receipts (
+                sale_id INTEGER PRIMARY KEY,
+                data BLOB NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def connect(self):
+        return connect(self.path)
+
+    def store_batch(self, batch):
+        # batch is a list of (sale_id, receipt) pairs, written in one transaction
+        rows = [(sale_id, pack_receipt(receipt)) for sale_id, receipt in batch]
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO receipts (sale_id, data) VALUES (?, ?)', rows)
+        finally:
+            conn.close()
+
+    def get(self, sale_id):
+        conn = self.connect()
+        try:
+            row = conn.execute('SELECT data FROM receipts WHERE sale_id = ?', (sale_id,)).fetchone()
+        finally:
+            conn.close()
+        return unpack_receipt(row[0]) if row else None
+
+    def get_many(self, sale_ids):
+        # Returns {sale_id: receipt} for the IDs that are archived
+        receipts = {}
+        conn = self.connect()
+        try:
+            ids = list(sale_ids)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                query = f'SELECT sale_id, data FROM receipts WHERE sale_id IN ({placeholders})'
+                for sale_id, data in conn.execute(query, chunk):
+                    receipts[sale_id] = unpack_receipt(data)
+        finally:
+            conn.close()
+        return receipts
+
+    def sale_ids(self, first=None, last=None):
+        query = 'SELECT sale_id FROM receipts WHERE sale_id >= ? AND sale_id <= ? ORDER BY sale_id'
+        bounds = (first if first is not None else -2 ** 63, last if last is not None else 2 ** 63 - 1)
+        conn = self.connect()
+        try:
+            return [row[0] for row in conn.execute(query, bounds)]
+        finally:
+            conn.close()
+
+    def render_html(self, sale_id):
+        receipt = self.get(sale_id)
+        return self.renderer.render_html(receipt) if receipt else None
+
+
+def load_receipts_from_db(conn, sale_ids):
+    # Rebuilds receipt records from the sales tables, for sales that were
+    # made before the archive existed or are missing from it. Sales moved to the
+    # yearly sales archives are looked up there too.
+    receipts = {}
+    ids = list(sale_ids)
+    cursor = conn.cursor()
+    for schemas in sales_archive.sales_source_groups(conn):
+        _load_receipts_from(cursor, schemas, ids, receipts)
+        # Older archives are only attached for sales still not found
+        ids = [sale_id for sale_id in ids if sale_id not in receipts]
+        if not ids:
+            break
+    return receipts
+
+
+def _load_receipts_from(cursor, schemas, ids, receipts):
+    for schema, start in itertools.product(schemas, range(0, len(ids), 500)):
+        chunk = ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+            SELECT sale_id, date, total, discount, final_total, payment_type
+            FROM {schema}.sales WHERE sale_id IN ({placeholders})
+        ''', chunk)
+        for sale_id, date, total, discount, final_total, payment_type in cursor.fetchall():
+            total = float(total or 0)
+            final_total = float(final_total or 0)
+            receipts[sale_id] = {
+                'sale_id': sale_id,
+                'date': date,
+                'payment_type': payment_type,
+                'items': [],
+                'total': total,
+                'discount_pct': discount,
+                'discount_amount': total - final_total,
+                'final_total': final_total,
+            }
+        cursor.execute(f'''
+            SELECT sales_items.sale_id, COALESCE(articles.name, 'Article #' || sales_items.article_id),
+                   sales_items.quantity, sales_items.price, sales_items.promotion, sales_items.promotion_discount
+            FROM {schema}.sales_items
+            LEFT JOIN articles ON sales_items.article_id = articles.id
+            WHERE sales_items.sale_id IN ({placeholders})
+            ORDER BY sales_items.sale_item_id
+        ''', chunk)
+        for sale_id, name, quantity, price, promotion, promotion_discount in cursor.fetchall():
+            if sale_id in receipts:
+                items = receipts[sale_id]['items']
+                items.append((name, quantity, price))
+                # The saving follows its line, as on the receipt printed at the till
+                if promotion_discount:
+                    items.append((f"  {promotion}", 1, -promotion_discount))
+
+
+_STOP = object()
+
+
+class ReceiptWriter:
+    # Persists receipts on a background thread so checkout never waits on the disk.
+    # Everything queued when a batch starts is written together, and close() drains
+    # the queue before returning so nothing submitted is lost on shutdown. A batch
+    # the sink still refuses at shutdown is appended to pending_path, and the
+    # next writer started with the same file saves it first.
+    def __init__(self, sink=write_receipt_files, max_batch=200, retry_delay=1.0, on_error=None,
+                 pending_path=PENDING_PATH):
+        self.sink = sink
+        self.max_batch = max_batch
+        self.retry_delay = retry_delay
+        self.on_error = on_error
+        self.pending_path = pending_path
+        self.queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='receipt-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, sale_id, content):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Receipt writer is closed')
+            self.queue.put((sale_id, content))
+
+    def flush(self):
+        # Block until everything submitted so far has been written
+        self.queue.join()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.queue.put(_STOP)
+        self._thread.join()
+
+    def _next_batch(self):
+        batch = []
+        stop = False
+        item = self.queue.get()
+        while True:
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+            if stop or len(batch) >= self.max_batch:
+                break
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        return batch, stop
+
+    def _save(self, batch):
+        # True once the sink has taken the batch; retried while running, and a
+        # few times at shutdown
+        attempts = 0
+        while True:
+            try:
+                self.sink(batch)
+                return True
+            except Exception as e:
+                attempts += 1
+                if self.on_error:
+                    self.on_error(e)
+                else:
+                    logger.warning('Failed to save %d receipt(s) (attempt %d): %s', len(batch), attempts, e)
+                if self._closed and attempts >= SHUTDOWN_ATTEMPTS:
+                    return False
+                time.sleep(self.retry_delay)
+
+    def _keep_pending(self, batch):
+        try:
+            directory = os.path.dirname(self.pending_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.pending_path, 'a', encoding='utf-8') as f:
+                for sale_id, content in batch:
+                    f.write(json.dumps([sale_id, content]) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError:
+            logger.exception('Could not keep %d unsaved receipt(s) in %s', len(batch), self.pending_path)
+        else:
+            logger.warning('Kept %d unsaved receipt(s) in %s; they are saved on the next start',
+                           len(batch), self.pending_path)
+
+    def _save_pending(self):
+        # Receipts a previous run kept; the file goes once all of them are saved
+        if not os.path.exists(self.pending_path):
+            return
+        with open(self.pending_path, encoding='utf-8') as f:
+            # A line cut short by a crash was never finished being kept
+            batch = [tuple(json.loads(line)) for line in f if line.endswith('\n')]
+        for start in range(0, len(batch), self.max_batch):
+            if not self._save(batch[start:start + self.max_batch]):
+                return
+        os.remove(self.pending_path)
+        logger.info('Saved %d receipt(s) kept from the last run', len(batch))
+
+    def _run(self):
+        self._save_pending()
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch and not self._save(batch):
+                self._keep_pending(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+
+
+_default_archive = None
+_default_writer = None
+_default_writer_lock = threading.Lock()
+
+
+def get_receipt_archive():
+    global _default_archive
+    with _default_writer_lock:
+        if _default_archive is None:
+            _default_archive = ReceiptArchive()
+        return _default_archive
+
+
+def get_receipt_writer():
+    global _default_writer
+    archive = get_receipt_archive()
+    with _default_writer_lock:
+        if _default_writer is None:
+            _default_writer = ReceiptWriter(sink=archive.store_batch)
+        return _default_writer
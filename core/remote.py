@@ -0,0 +1,294 @@
+import json
+import socket
+import sqlite3
+import datetime
+import itertools
+import threading
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from .cart import Cart
+from .catalogue import Article, DuplicateBarcodeError, InvalidArticleError
+from .changefeed import FEED_BATCH, ChangeFeed
+from .checkout import EmptyCartError
+from .events import ArticleDeleted, EventBus, StockChanged, article_changed, sale_committed
+from .promotions import build_engine
+
+# Set CASHIER_SERVER=host:port to run the tills against a shared server.py
+# instead of opening the database file themselves
+SERVER_ENV = 'CASHIER_SERVER'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# The wire format is one JSON object per line in each direction:
+#   {"id": 1, "op": "take_stock", "args": [3, 1]}
+#   {"id": 1, "ok": true, "result": 99}
+#   {"id": 1, "ok": false, "error": {"type": "DuplicateBarcodeError", "message": "..."}}
+
+
+class RemoteError(RuntimeError):
+    # An error raised on the server that has no local equivalent
+    pass
+
+
+# Errors the views handle are raised again as their own type
+ERRORS = {cls.__name__: cls for cls in (DuplicateBarcodeError, InvalidArticleError, EmptyCartError, ValueError, KeyError)}
+# The server's database being unavailable counts as the till being offline
+ERRORS['OperationalError'] = sqlite3.OperationalError
+
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f"Cannot send {type(value).__name__} to the server")
+
+
+def dumps(message):
+    return json.dumps(message, default=_plain, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def loads(line):
+    return json.loads(line)
+
+
+def encode_value(value):
+    # DataFrames travel as columns and rows, datetime columns as text
+    if isinstance(value, pd.DataFrame):
+        dates = [column for column in value.columns if pd.api.types.is_datetime64_any_dtype(value[column])]
+        if dates:
+            value = value.copy()
+            for column in dates:
+                value[column] = value[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+        return {'__frame__': {'columns': list(value.columns), 'data': value.values.tolist(), 'dates': dates}}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict) and '__frame__' in value:
+        frame = value['__frame__']
+        df = pd.DataFrame(frame['data'], columns=frame['columns'])
+        for column in frame['dates']:
+            df[column] = pd.to_datetime(df[column])
+        return df
+    return value
+
+
+def cart_to_wire(cart):
+    # Only what was scanned; the server prices the sale with its own promotions
+    return {
+        'discount_bp': cart.discount_bp,
+        'lines': [[line.article_id, line.name, line.unit_cents, line.quantity, line.category] for line in cart],
+    }
+
+
+def cart_from_wire(data, pricing=None):
+    cart = Cart(pricing)
+    for article_id, name, unit_cents, quantity, category in data['lines']:
+        # A Decimal price converts back to exactly the same cents
+        cart.add(article_id, name, Decimal(unit_cents) / 100, quantity, category)
+    cart.discount_bp = data['discount_bp']
+    return cart
+
+
+def parse_address(address):
+    # "host:port", ":port" or "host"
+    host, _, port = address.rpartition(':')
+    if not _:
+        return address or DEFAULT_HOST, DEFAULT_PORT
+    return host or DEFAULT_HOST, int(port)
+
+
+def _article(row):
+    return Article(*row) if row else None
+
+
+class RemoteStore:
+    # Store's methods, served by server.py. Each thread gets its own socket,
+    # opened on first use; calls are synchronous, one request per line. Writes
+    # made through this RemoteStore are published on events, like Store's.
+    READS = frozenset((
+        'list_articles', 'search_articles', 'get_article', 'find_by_barcode', 'photo_references',
+        'load_promotions', 'sales_history', 'history_export', 'articles_export',
+        'sales_over_time', 'top_selling_items', 'discount_distribution', 'stock_conflicts', 'stats',
+        'changelog_seq', 'changes_since',
+    ))
+
+    def __init__(self, address, timeout=30):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sockets = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.events = EventBus()
+        self._feed = None
+
+    def _stream(self):
+        stream = getattr(self._local, 'stream', None)
+        if stream is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            stream = sock.makefile('rwb')
+            self._local.sock = sock
+            self._local.stream = stream
+            with self._lock:
+                self._sockets.append(sock)
+        return stream
+
+    def _drop(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            with self._lock:
+                if sock in self._sockets:
+                    self._sockets.remove(sock)
+            self._local.stream.close()
+            sock.close()
+        self._local.sock = None
+        self._local.stream = None
+
+    def close(self):
+        with self._lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            sock.close()
+        self._local = threading.local()
+
+    def call(self, op, *args, retry=False):
+        request = dumps({'id': next(self._ids), 'op': op, 'args': args})
+        # A dropped connection is retried once for reads, and for writes the
+        # server recognises when they arrive twice (retry=True); any other write
+        # may already have been applied, so its failure is reported instead
+        attempts = 2 if retry or op in self.READS else 1
+        for attempt in range(attempts):
+            try:
+                stream = self._stream()
+                stream.write(request)
+                stream.flush()
+                line = stream.readline()
+                if not line:
+                    raise ConnectionError('The server closed the connection')
+                break
+            except OSError:
+                self._drop()
+                if attempt == attempts - 1:
+                    raise
+        response = loads(line)
+        if not response['ok']:
+            error = response['error']
+            raise ERRORS.get(error['type'], RemoteError)(error['message'])
+        return decode_value(response['result'])
+
+    # Changes made by other processes
+
+    @property
+    def feed(self):
+        if self._feed is None:
+            self._feed = ChangeFeed(self)
+        return self._feed
+
+    def data_version(self):
+        # Not visible through the server, so every poll asks for changes
+        return None
+
+    def changelog_seq(self):
+        return self.call('changelog_seq')
+
+    def changes_since(self, seq, limit=FEED_BATCH):
+        return self.call('changes_since', seq, limit)
+
+    # Catalogue
+
+    def list_articles(self):
+        return [Article(*row) for row in self.call('list_articles')]
+
+    def search_articles(self, query):
+        return [Article(*row) for row in self.call('search_articles', query)]
+
+    def get_article(self, article_id):
+        return _article(self.call('get_article', article_id))
+
+    def find_by_barcode(self, code):
+        return _article(self.call('find_by_barcode', code))
+
+    def add_article(self, name, price, stock, photo=None, barcode=None, category=None):
+        article_id = self.call('add_article', name, price, stock, photo, barcode, category)
+        self.events.publish(article_changed(article_id, name, price, stock, photo, barcode, category))
+        return article_id
+
+    def update_article(self, article_id, name, price, stock, photo=None, barcode=None, category=None):
+        old_photo = self.call('update_article', article_id, name, price, stock, photo, barcode, category)
+        self.events.publish(article_changed(article_id, name, price, stock, photo, barcode, category))
+        return old_photo
+
+    def delete_article(self, article_id):
+        photo = self.call('delete_article', article_id)
+        self.events.publish(ArticleDeleted(article_id))
+        return photo
+
+    def set_stock(self, article_id, stock):
+        self.call('set_stock', article_id, stock)
+        self.events.publish(StockChanged(article_id, stock))
+
+    def take_stock(self, article_id, quantity, request_key=None):
+        stock = self.call('take_stock', article_id, quantity, request_key, retry=request_key is not None)
+        if stock is not None:
+            self.events.publish(StockChanged(article_id, stock))
+        return stock
+
+    def photo_references(self, photo):
+        return self.call('photo_references', photo)
+
+    def load_promotions(self):
+        return build_engine(self.call('load_promotions'))
+
+    # Checkout
+
+    def commit_sale(self, cart, payment_type, when=None, request_key=None):
+        when = when.strftime('%Y-%m-%d %H:%M:%S') if when else None
+        receipt = self.call('commit_sale', cart_to_wire(cart), payment_type, when, request_key,
+                            retry=request_key is not None)
+        self.events.publish(sale_committed(receipt, cart))
+        return receipt
+
+    # Offline tills
+
+    def reserve_sale_ids(self, till_id, count):
+        return self.call('reserve_sale_ids', till_id, count)
+
+    def replay_sales(self, till_id, records):
+        return self.call('replay_sales', till_id, records)
+
+    # Reporting
+
+    def sales_history(self, since=None, until=None):
+        rows, total_sellings = self.call('sales_history', since, until)
+        return [tuple(row) for row in rows], total_sellings
+
+    def history_export(self, since=None, until=None):
+        return self.call('history_export', since, until)
+
+    def articles_export(self):
+        return self.call('articles_export')
+
+    def sales_over_time(self, since=None, until=None):
+        return self.call('sales_over_time', since, until)
+
+    def top_selling_items(self, limit=10, since=None, until=None):
+        return self.call('top_selling_items', limit, since, until)
+
+    def discount_distribution(self, since=None, until=None):
+        return self.call('discount_distribution', since, until)
+
+    def stock_conflicts(self):
+        return self.call('stock_conflicts')
+
+    # Server
+
+    def stats(self):
+        return self.call('stats')
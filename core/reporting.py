@@ -0,0 +1,192 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from . import sales_archive
+from .db import sale_time
+
+HISTORY_COLUMNS = ['sale_id', 'date', 'total', 'discount', 'final_total', 'payment_type']
+
+
+def _across_archives(conn, query, since=None, until=None):
+    # query reads {schema}.sales (and {schema}.sales_items) filtered by {where};
+    # it is repeated for the database and each archive the date range reaches,
+    # and the copies are combined with UNION ALL. The range is compared with ts,
+    # which each copy reads through its index. Yields (union, params) for each
+    # group of schemas that can be attached at once; more archived years than
+    # that take several queries, which the caller combines. Run each query
+    # before taking the next.
+    since, until = sale_time(since), sale_time(until)
+    conditions, params = [], []
+    if since is not None:
+        conditions.append('ts >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append('ts < ?')
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    for sources in sales_archive.sales_source_groups(conn, since, until):
+        union = ' UNION ALL '.join(query.format(schema=schema, where=where) for schema in sources)
+        yield union, params * len(sources)
+
+
+def _concat(frames):
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _typed_frame(conn, query, params, dtype):
+    # The tables are STRICT, so rows go from the cursor into NumPy columns as
+    # they are, without a cleanup pass
+    rows = np.fromiter(conn.execute(query, params), dtype=dtype)
+    return pd.DataFrame({name: rows[name] for name in rows.dtype.names})
+
+
+def sales_history(conn, since=None, until=None):
+    # Returns (rows, total of all final totals) for the sales dated in [since, until)
+    cursor = conn.cursor()
+    parts = []
+    for union, params in _across_archives(
+            conn, 'SELECT sale_id, date, total, discount, final_total, payment_type, ts FROM {schema}.sales {where}',
+            since, until):
+        cursor.execute(f'SELECT {", ".join(HISTORY_COLUMNS)} FROM ({union}) ORDER BY ts DESC, sale_id DESC', params)
+        parts.append(cursor.fetchall())
+    # date text sorts as ts does
+    sales = parts[0] if len(parts) == 1 else list(
+        heapq.merge(*parts, key=lambda sale: (sale[1], sale[0]), reverse=True))
+    return sales, sum(sale[4] for sale in sales)
+
+
+def history_export(conn, since=None, until=None):
+    # A line's amount is quantity * price - promotion_discount; the sale's total is the sum of its lines
+    columns = ', '.join(HISTORY_COLUMNS + ['name', 'quantity', 'price', 'promotion', 'promotion_discount'])
+    query = '''
+        SELECT sales.sale_id, sales.date, sales.total, sales.discount, sales.final_total, sales.payment_type,
+               articles.name, sales_items.quantity, sales_items.price,
+               sales_items.promotion, sales_items.promotion_discount, sales.ts
+        FROM {schema}.sales
+        JOIN {schema}.sales_items ON sales.sale_id = sales_items.sale_id
+        JOIN articles ON sales_items.article_id = articles.id
+        {where}
+    '''
+    frames = [
+        pd.read_sql_query(f'SELECT {columns} FROM ({union}) ORDER BY ts DESC, sale_id DESC', conn, params=params)
+        for union, params in _across_archives(conn, query, since, until)
+    ]
+    if len(frames) == 1:
+        return frames[0]
+    # date text sorts as ts does
+    return pd.concat(frames).sort_values(['date', 'sale_id'], ascending=False, kind='stable', ignore_index=True)
+
+
+def articles_export(conn):
+    return pd.read_sql_query('SELECT id, name, price, stock, photo, barcode, category FROM articles', conn)
+
+
+def sales_over_time(conn, since=None, until=None):
+    # ts goes straight into datetime64 seconds; no date text is read or parsed
+    return _concat([
+        _typed_frame(conn, union, params, [('date', 'datetime64[s]'), ('final_total', 'f8')])
+        for union, params in _across_archives(conn, 'SELECT ts, final_total FROM {schema}.sales {where}', since, until)
+    ])
+
+
+def top_selling_items(conn, limit=10, since=None, until=None):
+    # limit=None returns every item
+    query = 'SELECT sales_items.article_id, sales_items.quantity FROM {schema}.sales_items'
+    if since is not None or until is not None:
+        # Only a date range needs the sales themselves
+        query += ' JOIN {schema}.sales ON sales.sale_id = sales_items.sale_id {where}'
+    frames = [
+        _typed_frame(conn, f'''
+            SELECT articles.name, SUM(items.quantity) as quantity
+            FROM ({union}) AS items
+            JOIN articles ON items.article_id = articles.id
+            GROUP BY articles.name
+        ''', params, [('name', object), ('quantity', 'i8')])
+        for union, params in _across_archives(conn, query, since, until)
+    ]
+    items = frames[0] if len(frames) == 1 else pd.concat(frames).groupby('name', as_index=False, sort=False).sum()
+    items = items.sort_values('quantity', ascending=False, kind='stable', ignore_index=True)
+    return items if limit is None else items.head(limit)
+
+
+def stock_conflicts(conn):
+    # Offline sales that sold more than was left in stock, newest first
+    return pd.read_sql_query('''
+        SELECT stock_conflicts.recorded_at, stock_conflicts.till_id, stock_conflicts.sale_id,
+               stock_conflicts.article_id, articles.name, stock_conflicts.requested, stock_conflicts.available
+        FROM stock_conflicts
+        LEFT JOIN articles ON stock_conflicts.article_id = articles.id
+        ORDER BY stock_conflicts.conflict_id DESC
+    ''', conn)
+
+
+def discount_distribution(conn, since=None, until=None):
+    return _concat([
+        _typed_frame(conn, union, params, [('discount', 'f8')])
+        for union, params in _across_archives(conn, 'SELECT discount FROM {schema}.sales {where}', since, until)
+    ])
+
+
+class AnalyticsData:
+    # The analytics frames, loaded once and then kept current by adding each
+    # committed sale to them instead of re-reading the sales tables. Sales are
+    # queued and folded in with one concat when the frames are next read.
+    def __init__(self, sales, item_quantities, discounts):
+        self._sales = sales
+        self._items = item_quantities.set_index('name')['quantity']
+        self._discounts = discounts
+        self._pending = []
+        # Sales added since loading, so one reported twice is only counted once
+        self._added = set()
+
+    @classmethod
+    def load(cls, store, since=None, until=None):
+        # Every item, so new sales can move any of them into the top ten
+        return cls(
+            store.sales_over_time(since, until),
+            store.top_selling_items(limit=None, since=since, until=until),
+            store.discount_distribution(since, until),
+        )
+
+    def add_sale(self, sale, items):
+        # sale and items as SaleCommitted carries them; False if the sale was already added
+        if sale[0] in self._added:
+            return False
+        self._added.add(sale[0])
+        self._pending.append((sale, items))
+        return True
+
+    def has_pending(self):
+        return bool(self._pending)
+
+    def _fold(self):
+        if not self._pending:
+            return
+        sales = [sale for sale, _ in self._pending]
+        self._sales = pd.concat([self._sales, pd.DataFrame({
+            'date': np.array([sale[1] for sale in sales], dtype='datetime64[s]'),
+            'final_total': [float(sale[4]) for sale in sales],
+        })], ignore_index=True)
+        self._discounts = pd.concat([self._discounts, pd.DataFrame({
+            'discount': [float(sale[3]) for sale in sales],
+        })], ignore_index=True)
+        quantities = self._items.to_dict()
+        for _, items in self._pending:
+            for _, name, quantity, _ in items:
+                quantities[name] = quantities.get(name, 0) + quantity
+        self._items = pd.Series(quantities, name='quantity', dtype=self._items.dtype).rename_axis('name')
+        self._pending = []
+
+    def sales_over_time(self):
+        self._fold()
+        return self._sales
+
+    def top_selling_items(self, limit=10):
+        self._fold()
+        return self._items.sort_values(ascending=False, kind='stable').head(limit).reset_index()
+
+    def discount_distribution(self):
+        self._fold()
+        return self._discounts
@@ -0,0 +1,191 @@
+import os
+import re
+import time
+import datetime
+
+from .db import SALE_DATE, TABLE_OPTIONS, TS_FROM_DATE, sale_time
+
+# Sales from closed periods are moved out of the database into one archive
+# database per year, kept in <database name>_archive/ next to it. Queries reach
+# them with ATTACH, and only attach the years their date range covers, so the
+# hot database stays small.
+ARCHIVE_MONTHS = 13   # sales older than this are archived by default
+# Archives attached at once, leaving room for main under SQLite's default limit of 10
+MAX_ATTACHED = 9
+_ARCHIVE_FILE = re.compile(r'^sales_(\d{4})\.db$')
+
+ARCHIVE_SALES = '''
+    CREATE TABLE IF NOT EXISTS {schema}.{name} (
+        sale_id INTEGER PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        date TEXT GENERATED ALWAYS AS (''' + SALE_DATE + ''') STORED,
+        total REAL NOT NULL,
+        discount REAL NOT NULL,
+        final_total REAL NOT NULL,
+        payment_type TEXT NOT NULL
+    )
+    ''' + TABLE_OPTIONS
+
+ARCHIVE_SCHEMA = (
+    ARCHIVE_SALES.format(schema='{schema}', name='sales'),
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.sales_items (
+        sale_item_id INTEGER PRIMARY KEY,
+        sale_id INTEGER NOT NULL,
+        article_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL,
+        promotion TEXT,
+        promotion_discount REAL NOT NULL DEFAULT 0
+    )
+    ''' + TABLE_OPTIONS,
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_sales_ts ON sales(ts)',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_sales_items_sale ON sales_items(sale_id)',
+)
+
+
+def archive_dir(db_path):
+    return os.path.splitext(db_path)[0] + '_archive'
+
+
+def archive_path(db_path, year):
+    return os.path.join(archive_dir(db_path), f"sales_{year}.db")
+
+
+def archive_years(db_path):
+    directory = archive_dir(db_path)
+    if not os.path.isdir(directory):
+        return []
+    matches = (_ARCHIVE_FILE.match(name) for name in os.listdir(directory))
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+def _year(ts):
+    return time.gmtime(ts).tm_year
+
+
+def _year_start(year):
+    return sale_time(datetime.date(year, 1, 1))
+
+
+def _database_file(conn, schema='main'):
+    for _, name, path in conn.execute('PRAGMA database_list'):
+        if name == schema:
+            return path
+    return None
+
+
+def _attached(conn):
+    return {name for _, name, _ in conn.execute('PRAGMA database_list')}
+
+
+def _columns(conn, schema, table):
+    return {row[0] for row in conn.execute('SELECT name FROM pragma_table_xinfo(?, ?)', (table, schema))}
+
+
+def _attach(conn, db_path, year):
+    schema = f"archive_{year}"
+    conn.execute(f'ATTACH DATABASE ? AS {schema}', (archive_path(db_path, year),))
+    item_columns = _columns(conn, schema, 'sales_items')
+    if item_columns and 'promotion' not in item_columns:
+        # Archived before promotion savings were stored with their lines
+        with conn:
+            conn.execute(f'ALTER TABLE {schema}.sales_items ADD COLUMN promotion TEXT')
+            conn.execute(f'ALTER TABLE {schema}.sales_items ADD COLUMN promotion_discount REAL NOT NULL DEFAULT 0')
+    columns = _columns(conn, schema, 'sales')
+    if columns and 'ts' not in columns:
+        # Archived before sales had ts: rebuilt once, the way create_schema rebuilds the database's sales
+        with conn:
+            conn.execute(ARCHIVE_SALES.format(schema=schema, name='sales_rebuilt'))
+            conn.execute(f'''
+                INSERT INTO {schema}.sales_rebuilt (sale_id, ts, total, discount, final_total, payment_type)
+                SELECT sale_id, {TS_FROM_DATE}, total, discount, final_total, payment_type FROM {schema}.sales
+            ''')
+            conn.execute(f'DROP TABLE {schema}.sales')
+            conn.execute(f'ALTER TABLE {schema}.sales_rebuilt RENAME TO sales')
+            for statement in ARCHIVE_SCHEMA:
+                conn.execute(statement.format(schema=schema))
+
+
+def _years_in(db_path, since, until):
+    # Archived years with sales in [since, until); until is exclusive, so a
+    # range ending on January 1st stops at the year before
+    since, until = sale_time(since), sale_time(until)
+    return [
+        year for year in archive_years(db_path)
+        if (since is None or year >= _year(since)) and (until is None or year <= _year(until - 1))
+    ]
+
+
+def _use_archives(conn, db_path, years):
+    # Attaches the archives of years, detaching every other archive first
+    attached = _attached(conn)
+    wanted = {f"archive_{year}" for year in years}
+    for name in attached:
+        if name.startswith('archive_') and name not in wanted:
+            conn.execute(f'DETACH DATABASE {name}')
+    for year in years:
+        if f"archive_{year}" not in attached:
+            _attach(conn, db_path, year)
+    return [f"archive_{year}" for year in years]
+
+
+def sales_source_groups(conn, since=None, until=None):
+    # The schemas holding sales dated in [since, until), in groups that fit
+    # within SQLite's limit on attached databases: main with the newest archive
+    # years, then older years MAX_ATTACHED at a time. Each group is attached
+    # when it is reached and the one before detached, so read a group in full
+    # before asking for the next.
+    db_path = _database_file(conn)
+    years = sorted(_years_in(db_path, since, until), reverse=True) if db_path else []
+    groups = [years[start:start + MAX_ATTACHED] for start in range(0, len(years), MAX_ATTACHED)] or [[]]
+    for index, group in enumerate(groups):
+        yield (['main'] if index == 0 else []) + _use_archives(conn, db_path, group)
+
+
+def default_cutoff(months=ARCHIVE_MONTHS, today=None):
+    # The first day of the month `months` months before today's month
+    today = today or datetime.date.today()
+    month = today.year * 12 + today.month - 1 - months
+    return datetime.date(month // 12, month % 12 + 1, 1)
+
+
+def archive_sales(conn, before):
+    # Moves sales dated before `before`, with their items, into the yearly
+    # archives. Each year is one transaction; copies are INSERT OR IGNORE, so a
+    # run interrupted between archive and database simply completes next time.
+    # Returns {year: sales moved}.
+    db_path = _database_file(conn)
+    if not db_path:
+        raise ValueError('Only a database file can be archived.')
+    before = sale_time(before)
+    os.makedirs(archive_dir(db_path), exist_ok=True)
+    moved = {}
+    # Each year starts from the oldest sale left, found on the ts index
+    first = conn.execute('SELECT MIN(ts) FROM main.sales').fetchone()[0]
+    while first is not None and first < before:
+        year = _year(first)
+        schema = f"archive_{year}"
+        if schema not in _attached(conn):
+            _attach(conn, db_path, year)
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement.format(schema=schema))
+        start, end = _year_start(year), min(_year_start(year + 1), before)
+        in_period = 'SELECT sale_id FROM main.sales WHERE ts >= ? AND ts < ?'
+        with conn:
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {schema}.sales (sale_id, ts, total, discount, final_total, payment_type)
+                SELECT sale_id, ts, total, discount, final_total, payment_type
+                FROM main.sales WHERE ts >= ? AND ts < ?
+            ''', (start, end))
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {schema}.sales_items
+                    (sale_item_id, sale_id, article_id, quantity, price, promotion, promotion_discount)
+                SELECT sale_item_id, sale_id, article_id, quantity, price, promotion, promotion_discount
+                FROM main.sales_items WHERE sale_id IN ({in_period})
+            ''', (start, end))
+            conn.execute(f'DELETE FROM main.sales_items WHERE sale_id IN ({in_period})', (start, end))
+            moved[year] = conn.execute('DELETE FROM main.sales WHERE ts >= ? AND ts < ?', (start, end)).rowcount
+        conn.execute(f'DETACH DATABASE {schema}')
+        first = conn.execute('SELECT MIN(ts) FROM main.sales WHERE ts >= ?', (end,)).fetchone()[0]
+    return moved
@@ -0,0 +1,173 @@
+import os
+import threading
+
+from . import catalogue, changefeed, checkout, offline, reporting, sales_archive
+from .db import DB_PATH, connect, create_schema
+from .events import ArticleDeleted, EventBus, StockChanged, article_changed, sale_committed
+from .promotions import load_promotions
+from .remote import SERVER_ENV, RemoteStore
+
+
+class Store:
+    # The application's single entry point to its data: views, scripts and
+    # benchmarks call these methods and never touch SQL themselves. Each thread
+    # gets its own connection, opened on first use and kept for the Store's life.
+    # Every write method is its own transaction, and is published on events
+    # once it has been committed.
+    def __init__(self, db_path=DB_PATH, initialize=True):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self.events = EventBus()
+        self._feed = None
+        if initialize:
+            create_schema(self.conn)
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.db_path)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    # Changes made by other processes
+
+    @property
+    def feed(self):
+        # Created on first use, starting from the changelog's current end
+        if self._feed is None:
+            self._feed = changefeed.ChangeFeed(self)
+        return self._feed
+
+    def data_version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def changelog_seq(self):
+        return changefeed.changelog_seq(self.conn)
+
+    def changes_since(self, seq, limit=changefeed.FEED_BATCH):
+        return changefeed.collect_changes(self.conn, seq, limit)
+
+    # Catalogue
+
+    def list_articles(self):
+        return catalogue.list_articles(self.conn)
+
+    def search_articles(self, query):
+        return catalogue.search_articles(self.conn, query)
+
+    def get_article(self, article_id):
+        return catalogue.get_article(self.conn, article_id)
+
+    def find_by_barcode(self, code):
+        return catalogue.find_by_barcode(self.conn, code)
+
+    def add_article(self, name, price, stock, photo=None, barcode=None, category=None):
+        with self.conn:
+            article_id = catalogue.add_article(self.conn, name, price, stock, photo, barcode, category)
+        self.events.publish(article_changed(article_id, name, price, stock, photo, barcode, category))
+        return article_id
+
+    def update_article(self, article_id, name, price, stock, photo=None, barcode=None, category=None):
+        with self.conn:
+            old_photo = catalogue.update_article(self.conn, article_id, name, price, stock, photo, barcode, category)
+        self.events.publish(article_changed(article_id, name, price, stock, photo, barcode, category))
+        return old_photo
+
+    def delete_article(self, article_id):
+        with self.conn:
+            photo = catalogue.delete_article(self.conn, article_id)
+        self.events.publish(ArticleDeleted(article_id))
+        return photo
+
+    def set_stock(self, article_id, stock):
+        with self.conn:
+            catalogue.set_stock(self.conn, article_id, stock)
+        self.events.publish(StockChanged(article_id, stock))
+
+    def take_stock(self, article_id, quantity, request_key=None):
+        with self.conn:
+            stock = catalogue.take_stock(self.conn, article_id, quantity, request_key)
+        if stock is not None:
+            self.events.publish(StockChanged(article_id, stock))
+        return stock
+
+    def photo_references(self, photo):
+        return catalogue.photo_references(self.conn, photo)
+
+    def load_promotions(self):
+        return load_promotions(self.conn)
+
+    # Checkout
+
+    def commit_sale(self, cart, payment_type, when=None, request_key=None):
+        with self.conn:
+            receipt = checkout.commit_sale(self.conn, cart, payment_type, when, request_key)
+        self.events.publish(sale_committed(receipt, cart))
+        return receipt
+
+    # Offline tills
+
+    def reserve_sale_ids(self, till_id, count):
+        with self.conn:
+            return offline.reserve_sale_ids(self.conn, till_id, count)
+
+    def replay_sales(self, till_id, records):
+        # Not published: replays arrive in bulk, views reload once afterwards
+        with self.conn:
+            return offline.replay_sales(self.conn, till_id, records)
+
+    # Reporting: since and until limit sales to a date range, and keep
+    # archives outside it from being read
+
+    def sales_history(self, since=None, until=None):
+        return reporting.sales_history(self.conn, since, until)
+
+    def history_export(self, since=None, until=None):
+        return reporting.history_export(self.conn, since, until)
+
+    def articles_export(self):
+        return reporting.articles_export(self.conn)
+
+    def sales_over_time(self, since=None, until=None):
+        return reporting.sales_over_time(self.conn, since, until)
+
+    def top_selling_items(self, limit=10, since=None, until=None):
+        return reporting.top_selling_items(self.conn, limit, since, until)
+
+    def discount_distribution(self, since=None, until=None):
+        return reporting.discount_distribution(self.conn, since, until)
+
+    def stock_conflicts(self):
+        return reporting.stock_conflicts(self.conn)
+
+    # Archiving
+
+    def archive_sales(self, before):
+        # Commits year by year itself; returns {year: sales moved}
+        return sales_archive.archive_sales(self.conn, before)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_store():
+    # With CASHIER_SERVER set, the application is a client of server.py
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            address = os.environ.get(SERVER_ENV, '').strip()
+            _default_store = RemoteStore(address) if address else Store()
+        return _default_store
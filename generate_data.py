@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import argparse
+import datetime
+import sqlite3
+
+import numpy as np
+
+from core.changefeed import create_changelog, drop_changelog_triggers
+from core.db import create_schema
+
+ADJECTIVES = ['Fresh', 'Organic', 'Classic', 'Premium', 'Light', 'Family', 'Spicy', 'Sweet', 'Whole', 'Mini']
+PRODUCTS = ['Apples', 'Bananas', 'Milk', 'Bread', 'Cheese', 'Coffee', 'Tea', 'Pasta', 'Rice', 'Yogurt',
+            'Juice', 'Water', 'Chocolate', 'Cereal', 'Butter', 'Eggs', 'Tomatoes', 'Chicken', 'Soap', 'Beer']
+CATEGORIES = ['Fruit', 'Dairy', 'Bakery', 'Drinks', 'Pantry', 'Household', 'Snacks', 'Meat']
+
+DEFAULT_DISCOUNT_MIX = '0:70,5:15,10:10,20:5'
+DEFAULT_PAYMENT_SPLIT = 'Cash:40,Card:60'
+
+
+def parse_mix(text, value_type=str):
+    # "0:70,5:15" -> ([0, 5], [0.8235..., 0.1764...]); weights need not sum to 100
+    values, weights = [], []
+    for part in text.split(','):
+        value, _, weight = part.partition(':')
+        values.append(value_type(value.strip()))
+        weights.append(float(weight or 1))
+    weights = np.asarray(weights, dtype=float)
+    if weights.sum() <= 0:
+        raise ValueError(f"Mix needs a positive weight: {text!r}")
+    return values, weights / weights.sum()
+
+
+def zipf_weights(count, skew):
+    # Popularity by rank is proportional to 1 / rank^skew; skew 0 is uniform
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+
+def _generate_articles(rng, count):
+    names = [f"{ADJECTIVES[i % len(ADJECTIVES)]} {PRODUCTS[(i // len(ADJECTIVES)) % len(PRODUCTS)]} {i + 1}"
+             for i in range(count)]
+    prices = np.maximum(np.round(rng.lognormal(mean=1.3, sigma=0.8, size=count), 2), 0.1)
+    categories = rng.integers(0, len(CATEGORIES), size=count)
+    return [
+        (article_id, names[i], float(prices[i]), 10 ** 9, f"{2000000000000 + article_id}", CATEGORIES[categories[i]])
+        for i, article_id in enumerate(range(1, count + 1))
+    ], prices
+
+
+def generate(path, sales, articles=1000, skew=1.1, start=None, end=None,
+             discount_mix=DEFAULT_DISCOUNT_MIX, payment_split=DEFAULT_PAYMENT_SPLIT,
+             items_per_sale=3.0, seed=0, batch_size=200_000, progress=None):
+    # Creates a new database at path. The same arguments and seed always produce the same data.
+    # Defaults to midnight today; pass end for data that is identical on every day
+    end = end or datetime.datetime.combine(datetime.date.today(), datetime.time())
+    start = start or end - datetime.timedelta(days=365)
+    if end <= start:
+        raise ValueError('end must be after start')
+    discounts, discount_p = parse_mix(discount_mix, float)
+    payment_types, payment_p = parse_mix(payment_split)
+    discounts = np.asarray(discounts)
+    payment_types = np.asarray(payment_types, dtype=object)
+
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    # Nothing to protect while the file is being built from scratch
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -200000')
+    create_schema(conn)
+    # Nobody is following a database that is still being generated
+    drop_changelog_triggers(conn.cursor())
+    conn.execute('DELETE FROM articles')
+
+    article_rows, prices = _generate_articles(rng, articles)
+    with conn:
+        conn.executemany('INSERT INTO articles (id, name, price, stock, barcode, category) VALUES (?, ?, ?, ?, ?, ?)',
+                         article_rows)
+
+    # Popularity ranks are shuffled so the best sellers aren't simply the lowest ids
+    popularity = zipf_weights(articles, skew)[rng.permutation(articles)]
+    cumulative = np.cumsum(popularity)
+    cumulative[-1] = 1.0
+    # Sale times are naive local times, so they are counted from a naive epoch, as ts is
+    first_second = int((start - datetime.datetime(1970, 1, 1)).total_seconds())
+    span = int((end - start).total_seconds())
+
+    sale_id = 0
+    item_id = 0
+    while sale_id < sales:
+        count = min(batch_size, sales - sale_id)
+        sale_ids = np.arange(sale_id + 1, sale_id + count + 1)
+        # Sale ids increase with time, as they do in a live database
+        offsets = np.sort(rng.integers(sale_id * span // sales, (sale_id + count) * span // sales + 1, size=count))
+        times = offsets + first_second
+
+        lines = 1 + rng.poisson(max(items_per_sale - 1, 0), size=count)
+        line_count = int(lines.sum())
+        line_sales = np.repeat(sale_ids, lines)
+        line_articles = np.searchsorted(cumulative, rng.random(line_count), side='right') + 1
+        line_articles = np.minimum(line_articles, articles)
+        quantities = 1 + rng.poisson(0.4, size=line_count)
+        line_prices = prices[line_articles - 1]
+
+        starts = np.concatenate(([0], np.cumsum(lines)[:-1]))
+        totals = np.round(np.add.reduceat(quantities * line_prices, starts), 2)
+        sale_discounts = discounts[rng.choice(len(discounts), size=count, p=discount_p)]
+        finals = np.round(totals * (100 - sale_discounts) / 100, 2)
+        sale_payments = payment_types[rng.choice(len(payment_types), size=count, p=payment_p)]
+
+        with conn:
+            conn.executemany(
+                'INSERT INTO sales (sale_id, ts, total, discount, final_total, payment_type) VALUES (?, ?, ?, ?, ?, ?)',
+                zip(sale_ids.tolist(), times.tolist(), totals.tolist(), sale_discounts.tolist(),
+                    finals.tolist(), sale_payments.tolist())
+            )
+            conn.executemany(
+                'INSERT INTO sales_items (sale_item_id, sale_id, article_id, quantity, price) VALUES (?, ?, ?, ?, ?)',
+                zip(range(item_id + 1, item_id + line_count + 1), line_sales.tolist(), line_articles.tolist(),
+                    quantities.tolist(), line_prices.tolist())
+            )
+        sale_id += count
+        item_id += line_count
+        if progress:
+            progress(sale_id, sales)
+
+    create_changelog(conn.cursor())
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return item_id
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d')
+
+
+def _parse_count(value):
+    # Accepts 10000, 10k, 1M, 10M
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    value = value.strip().lower().replace('_', '')
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fill a new database with reproducible synthetic articles and sales.')
+    parser.add_argument('output', help='Database file to create')
+    parser.add_argument('--sales', type=_parse_count, default=100_000, help='Number of sales, e.g. 10k, 1M, 10M')
+    parser.add_argument('--articles', type=_parse_count, default=1000)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for article popularity (0 = uniform)')
+    parser.add_argument('--start', type=_parse_date, help='First sale date, YYYY-MM-DD (default: a year before --end)')
+    parser.add_argument('--end', type=_parse_date, help='End of the sales period, YYYY-MM-DD (default: today)')
+    parser.add_argument('--discount-mix', default=DEFAULT_DISCOUNT_MIX,
+                        help='Discount percentages and their weights, e.g. "0:70,5:15,10:10,20:5"')
+    parser.add_argument('--payment-split', default=DEFAULT_PAYMENT_SPLIT,
+                        help='Payment types and their weights, e.g. "Cash:40,Card:60"')
+    parser.add_argument('--items-per-sale', type=float, default=3.0, help='Average number of lines per sale')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=200_000, help='Sales per transaction')
+    parser.add_argument('--force', action='store_true', help='Overwrite the output file if it exists')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.output):
+        if not args.force:
+            parser.error(f"{args.output} already exists (use --force to overwrite)")
+        os.remove(args.output)
+
+    started = time.perf_counter()
+
+    def progress(done, total):
+        elapsed = time.perf_counter() - started
+        print(f"\r{done:,}/{total:,} sales ({elapsed:.0f}s)", end='', flush=True)
+
+    items = generate(args.output, args.sales, args.articles, args.skew, args.start, args.end,
+                     args.discount_mix, args.payment_split, args.items_per_sale, args.seed,
+                     args.batch_size, progress)
+    print(f"\nWrote {args.sales:,} sales, {items:,} sale items and {args.articles:,} articles "
+          f"to {args.output} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
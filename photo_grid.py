@@ -0,0 +1,140 @@
+from PyQt5.QtCore import (
+    Qt, QAbstractListModel, QModelIndex, QObject, QRunnable, QSize, QThreadPool, pyqtSignal
+)
+from PyQt5.QtGui import QPixmap, QColor
+from PyQt5.QtWidgets import QListView
+
+from thumbnails import get_thumbnail_cache
+
+TILE_SIZE = QSize(150, 160)
+ICON_SIZE = QSize(100, 100)
+
+
+class _LoaderSignals(QObject):
+    loaded = pyqtSignal(str, object)
+
+
+class _ThumbnailLoader(QRunnable):
+    def __init__(self, path, signals):
+        super().__init__()
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        # Decoding (or reading the disk thumbnail) happens off the GUI thread;
+        # only the QImage -> QPixmap conversion is left for the GUI thread
+        image = get_thumbnail_cache().image(self.path)
+        self.signals.loaded.emit(self.path, image)
+
+
+class ArticleGridModel(QAbstractListModel):
+    # Thumbnails are requested lazily from data(), which the view only calls for
+    # tiles it is about to paint, so loading follows the visible viewport
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.articles = []
+        self._rows_by_id = {}
+        self._rows_by_photo = {}
+        self._pending = set()
+        self._pool = QThreadPool(self)
+        self._signals = _LoaderSignals()
+        self._signals.loaded.connect(self._on_loaded)
+        self._thumbnails = get_thumbnail_cache()
+        self._placeholder = QPixmap(ICON_SIZE)
+        self._placeholder.fill(QColor('#e0e0e0'))
+
+    def set_articles(self, articles):
+        # Drop queued loads for the previous result set
+        self._pool.clear()
+        self._pending.clear()
+        self.beginResetModel()
+        self.articles = list(articles)
+        self._rows_by_id = {article[0]: row for row, article in enumerate(self.articles)}
+        self._rows_by_photo = {}
+        for row, article in enumerate(self.articles):
+            if article[4]:
+                self._rows_by_photo.setdefault(article[4], []).append(row)
+        self.endResetModel()
+
+    def update_article(self, article):
+        row = self._rows_by_id.get(article[0])
+        if row is None:
+            return
+        old_photo = self.articles[row][4]
+        if old_photo != article[4]:
+            # Keep the tile findable when its new photo's thumbnail arrives
+            if old_photo:
+                rows = self._rows_by_photo.get(old_photo, [])
+                if row in rows:
+                    rows.remove(row)
+                if not rows:
+                    self._rows_by_photo.pop(old_photo, None)
+            if article[4]:
+                self._rows_by_photo.setdefault(article[4], []).append(row)
+        self.articles[row] = article
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.articles)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        article = self.articles[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{article[1]}\n${article[2]:.2f} (Stock: {article[3]})"
+        if role == Qt.DecorationRole:
+            return self._thumbnail(article[4])
+        if role == Qt.UserRole:
+            return article
+        if role == Qt.ToolTipRole:
+            return article[1]
+        return None
+
+    def _thumbnail(self, photo):
+        if not photo:
+            return self._placeholder
+        pixmap = self._thumbnails.cached_pixmap(photo)
+        if pixmap is not None:
+            return pixmap
+        if photo not in self._pending:
+            self._pending.add(photo)
+            self._pool.start(_ThumbnailLoader(photo, self._signals))
+        return self._placeholder
+
+    def _on_loaded(self, path, image):
+        self._pending.discard(path)
+        if image.isNull():
+            return
+        self._thumbnails.store_pixmap(path, image)
+        for row in self._rows_by_photo.get(path, []):
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class ArticleGridView(QListView):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setViewMode(QListView.IconMode)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        self.setWrapping(True)
+        # Fixed tile sizes let the view lay out thousands of items without
+        # asking the model for each item's size hint
+        self.setUniformItemSizes(True)
+        self.setGridSize(TILE_SIZE)
+        self.setIconSize(ICON_SIZE)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(200)
+        self.setWordWrap(True)
+        self.setSelectionMode(QListView.SingleSelection)
+        self.grid_model = ArticleGridModel(self)
+        self.setModel(self.grid_model)
+
+    def set_articles(self, articles):
+        self.grid_model.set_articles(articles)
+
+    def selected_article(self):
+        index = self.currentIndex()
+        return index.data(Qt.UserRole) if index.isValid() else None
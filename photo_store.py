@@ -0,0 +1,85 @@
+import os
+import hashlib
+import threading
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QImage, QImageReader
+
+from thumbnails import get_thumbnail_cache
+
+PHOTO_DIR = 'images'
+# Photos are normalised at ingest: EXIF orientation applied, longest side capped
+MAX_PHOTO_SIZE = 1024
+JPEG_QUALITY = 88
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stored_photo_path(digest, extension, directory=PHOTO_DIR):
+    # Fan out over 256 subdirectories so no single directory grows huge
+    return os.path.join(directory, digest[:2], f"{digest}.{extension}")
+
+
+def is_stored_photo(path, directory=PHOTO_DIR):
+    if not path:
+        return False
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(directory))
+    parts = relative.split(os.sep)
+    return len(parts) == 2 and len(parts[0]) == 2 and parts[1].startswith(parts[0])
+
+
+def _normalise(source_path):
+    reader = QImageReader(source_path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid() and (size.width() > MAX_PHOTO_SIZE or size.height() > MAX_PHOTO_SIZE):
+        reader.setScaledSize(size.scaled(QSize(MAX_PHOTO_SIZE, MAX_PHOTO_SIZE), Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        raise ValueError(f"Unsupported or corrupt image: {reader.errorString()}")
+    return image
+
+
+def ingest_photo(source_path, directory=PHOTO_DIR):
+    # Stores the photo under the SHA-256 of the uploaded file and returns the stored path.
+    # Uploading the same file again (e.g. for another variant) reuses the existing copy
+    # without decoding it. The source file is left where it is.
+    digest = _file_digest(source_path)
+    for extension in ('jpg', 'png'):
+        existing = stored_photo_path(digest, extension, directory)
+        if os.path.exists(existing):
+            return existing
+
+    image = _normalise(source_path)
+    # Keep transparency as PNG; everything else is re-encoded as JPEG
+    extension = 'png' if image.hasAlphaChannel() else 'jpg'
+    if extension == 'jpg':
+        image = image.convertToFormat(QImage.Format_RGB32)
+    destination = stored_photo_path(digest, extension, directory)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tmp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fmt = 'PNG' if extension == 'png' else 'JPEG'
+    if not image.save(tmp_path, fmt, -1 if extension == 'png' else JPEG_QUALITY):
+        raise OSError(f"Could not write {destination}")
+    os.replace(tmp_path, destination)
+    return destination
+
+
+def release_photo(store, photo):
+    # Deletes the photo file once no article references it any more.
+    # Call after the change that dropped the reference has been committed.
+    if not photo:
+        return False
+    if store.photo_references(photo):
+        return False
+    try:
+        os.remove(photo)
+    except FileNotFoundError:
+        pass
+    get_thumbnail_cache().invalidate(photo)
+    return True
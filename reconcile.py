@@ -0,0 +1,45 @@
+import os
+import sys
+import argparse
+
+from core import RemoteStore, Store
+from core.db import DB_PATH
+from core.offline import JournalInUseError, SalesJournal, journal_path
+from core.remote import SERVER_ENV
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report offline sales waiting to sync and the stock conflicts their replay recorded.')
+    parser.add_argument('--database', default=DB_PATH)
+    parser.add_argument('--server', default=os.environ.get(SERVER_ENV), help='host:port of server.py, instead of --database')
+    parser.add_argument('--journal', help="This till's journal (default: journal/<till id>.jsonl)")
+    parser.add_argument('--csv', help='Also write the stock conflicts to this CSV file')
+    args = parser.parse_args(argv)
+
+    path = args.journal or journal_path()
+    if os.path.exists(path):
+        try:
+            journal = SalesJournal(path)
+        except JournalInUseError:
+            print(f"{path}: the till is running; its POS tab shows the sales waiting to sync")
+        else:
+            print(f"{path}: {journal.pending_count()} sale(s) waiting to sync, {journal.ids_left()} sale id(s) in reserve")
+            journal.close()
+
+    store = RemoteStore(args.server) if args.server else Store(args.database)
+    try:
+        conflicts = store.stock_conflicts()
+    finally:
+        store.close()
+    if conflicts.empty:
+        print('No stock conflicts.')
+    else:
+        print(f"{len(conflicts)} offline sale line(s) sold more than was in stock; these articles need a stock count:")
+        print(conflicts.to_string(index=False))
+    if args.csv:
+        conflicts.to_csv(args.csv, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import os
+import sys
+import argparse
+import datetime
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from core.receipts import (
+    ARCHIVE_PATH, LOGO_PATH, ReceiptArchive, ReceiptRenderer, load_receipts_from_db
+)
+from core.db import DB_PATH, sale_time
+from core.sales_archive import sales_source_groups
+from core.escpos import render_escpos, printer_from_uri
+
+LOGO_URL = 'receipt-logo'
+
+# Per-process state, set up once by the pool initializer
+_worker = {}
+
+
+def select_sale_ids(db_path, from_id=None, to_id=None, from_date=None, to_date=None):
+    conditions = []
+    params = []
+    if from_id is not None:
+        conditions.append('sale_id >= ?')
+        params.append(from_id)
+    if to_id is not None:
+        conditions.append('sale_id <= ?')
+        params.append(to_id)
+    if from_date:
+        conditions.append('ts >= ?')
+        params.append(sale_time(from_date))
+    if to_date:
+        # Inclusive end date
+        conditions.append('ts < ?')
+        params.append(sale_time(to_date + datetime.timedelta(days=1)))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = sqlite3.connect(db_path)
+    try:
+        # Archived years are only read when the dates reach them, a group at a time
+        sale_ids = []
+        for schemas in sales_source_groups(conn, from_date, to_date and to_date + datetime.timedelta(days=1)):
+            union = ' UNION ALL '.join(f'SELECT sale_id FROM {schema}.sales {where}' for schema in schemas)
+            sale_ids.extend(row[0] for row in conn.execute(f'SELECT sale_id FROM ({union})', params * len(schemas)))
+        return sorted(sale_ids)
+    finally:
+        conn.close()
+
+
+def _init_worker(db_path, archive_path, output_format):
+    _worker['db_path'] = db_path
+    _worker['archive'] = ReceiptArchive(archive_path) if os.path.exists(archive_path) else None
+    if output_format == 'pdf':
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtGui import QGuiApplication, QImage
+        _worker['app'] = QGuiApplication.instance() or QGuiApplication([])
+        _worker['logo'] = QImage(LOGO_PATH)
+        _worker['renderer'] = ReceiptRenderer(logo_url=LOGO_URL)
+
+
+def _load_receipts(sale_ids):
+    archive = _worker['archive']
+    receipts = archive.get_many(sale_ids) if archive else {}
+    missing = [sale_id for sale_id in sale_ids if sale_id not in receipts]
+    if missing:
+        conn = sqlite3.connect(_worker['db_path'])
+        try:
+            receipts.update(load_receipts_from_db(conn, missing))
+        finally:
+            conn.close()
+    return [receipts[sale_id] for sale_id in sale_ids if sale_id in receipts]
+
+
+def _write_pdf(receipts, path):
+    from PyQt5.QtCore import QRectF, QSizeF, QUrl
+    from PyQt5.QtGui import QFont, QPageSize, QPainter, QPdfWriter, QTextDocument
+
+    writer = QPdfWriter(path)
+    writer.setPageSize(QPageSize(QPageSize.A5))
+    writer.setResolution(150)
+    painter = QPainter(writer)
+    page_width = writer.width()
+    page_height = writer.height()
+    logo = _worker['logo']
+    first_page = True
+    try:
+        for receipt in receipts:
+            doc = QTextDocument()
+            doc.documentLayout().setPaintDevice(writer)
+            doc.setDefaultFont(QFont('Courier', 10))
+            if not logo.isNull():
+                doc.addResource(QTextDocument.ImageResource, QUrl(LOGO_URL), logo)
+            doc.setHtml(_worker['renderer'].render_html(receipt))
+            doc.setPageSize(QSizeF(page_width, page_height))
+            for page in range(doc.pageCount()):
+                if not first_page:
+                    writer.newPage()
+                first_page = False
+                painter.save()
+                painter.translate(0, -page * page_height)
+                doc.drawContents(painter, QRectF(0, page * page_height, page_width, page_height))
+                painter.restore()
+    finally:
+        painter.end()
+
+
+def render_chunk(sale_ids, output_format, output_dir, paper_width):
+    receipts = _load_receipts(sale_ids)
+    extension = 'pdf' if output_format == 'pdf' else 'bin'
+    path = os.path.join(output_dir, f"receipts_{sale_ids[0]:08d}-{sale_ids[-1]:08d}.{extension}")
+    if output_format == 'pdf':
+        _write_pdf(receipts, path)
+    else:
+        with open(path, 'wb') as f:
+            f.write(b''.join(render_escpos(receipt, paper_width) for receipt in receipts))
+    return path, len(receipts)
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reprint receipts in bulk across a pool of worker processes.')
+    parser.add_argument('--from-id', type=int, help='First sale ID (inclusive)')
+    parser.add_argument('--to-id', type=int, help='Last sale ID (inclusive)')
+    parser.add_argument('--from-date', type=_parse_date, help='First sale date, YYYY-MM-DD (inclusive)')
+    parser.add_argument('--to-date', type=_parse_date, help='Last sale date, YYYY-MM-DD (inclusive)')
+    parser.add_argument('--format', choices=['pdf', 'escpos'], default='pdf',
+                        help='PDF documents, or concatenated ESC/POS print jobs')
+    parser.add_argument('--output', default='reprints', help='Directory for the generated files')
+    parser.add_argument('--printer', help='Send ESC/POS jobs to this printer (file:, tcp:// or lp:// URI)')
+    parser.add_argument('--paper-width', type=int, choices=[58, 80], default=80)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Receipts per output file')
+    parser.add_argument('--database', default=DB_PATH)
+    parser.add_argument('--archive', default=ARCHIVE_PATH)
+    args = parser.parse_args(argv)
+
+    if args.printer and args.format != 'escpos':
+        parser.error('--printer requires --format escpos')
+
+    sale_ids = select_sale_ids(args.database, args.from_id, args.to_id, args.from_date, args.to_date)
+    if not sale_ids:
+        print('No sales match the requested range.')
+        return 0
+
+    os.makedirs(args.output, exist_ok=True)
+    chunks = [sale_ids[i:i + args.chunk_size] for i in range(0, len(sale_ids), args.chunk_size)]
+    results = {}
+    done = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.database, args.archive, args.format)) as pool:
+        futures = {
+            pool.submit(render_chunk, chunk, args.format, args.output, args.paper_width): index
+            for index, chunk in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            path, count = future.result()
+            results[futures[future]] = path
+            done += count
+            print(f"{done}/{len(sale_ids)} receipts rendered ({path})")
+
+    if args.printer:
+        # Jobs are sent in sale order, one concatenated job per chunk
+        printer = printer_from_uri(args.printer)
+        for index in range(len(chunks)):
+            with open(results[index], 'rb') as f:
+                printer.send(f.read())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import datetime
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from core import Store, catalogue, changefeed, checkout, offline, reporting
+from core.backup import BackupScheduler, backup_hours
+from core.db import DB_PATH
+from core.promotions import active_promotion_rows, build_engine
+from core.remote import DEFAULT_HOST, DEFAULT_PORT, cart_from_wire, dumps, encode_value, loads
+
+# Compiled promotions are reused by commits for this long before being reloaded
+PROMOTION_TTL = 30
+# Largest request line a till may send (a cart with a few thousand lines)
+MAX_LINE = 4 * 1024 * 1024
+
+logger = logging.getLogger('cashier.server')
+
+
+# Operations that only read run concurrently on a small pool of connections
+READS = {
+    'list_articles': catalogue.list_articles,
+    'search_articles': catalogue.search_articles,
+    'get_article': catalogue.get_article,
+    'find_by_barcode': catalogue.find_by_barcode,
+    'photo_references': catalogue.photo_references,
+    'load_promotions': active_promotion_rows,
+    'sales_history': reporting.sales_history,
+    'history_export': reporting.history_export,
+    'articles_export': reporting.articles_export,
+    'sales_over_time': reporting.sales_over_time,
+    'top_selling_items': reporting.top_selling_items,
+    'discount_distribution': reporting.discount_distribution,
+    'stock_conflicts': reporting.stock_conflicts,
+    'changelog_seq': changefeed.changelog_seq,
+    'changes_since': changefeed.collect_changes,
+}
+
+WRITES = {
+    'add_article': catalogue.add_article,
+    'update_article': catalogue.update_article,
+    'delete_article': catalogue.delete_article,
+    'set_stock': catalogue.set_stock,
+    'take_stock': catalogue.take_stock,
+    'reserve_sale_ids': offline.reserve_sale_ids,
+    'replay_sales': offline.replay_sales,
+}
+
+
+class TillServer:
+    # Owns the database for any number of tills. Writes from every connection go
+    # through one queue to a single writer thread, which applies whatever has
+    # queued up while the previous commit was in flight as one transaction, each
+    # request in its own savepoint so a failing one doesn't undo its neighbours.
+    def __init__(self, db_path=DB_PATH, max_batch=256, readers=4):
+        self.store = Store(db_path)
+        # Readers keep working while the writer holds its transaction open
+        self.store.conn.execute('PRAGMA journal_mode = WAL')
+        self.max_batch = max_batch
+        self.stats = {'connections': 0, 'writes': 0, 'commits': 0, 'largest_batch': 0}
+        self._reads = ThreadPoolExecutor(readers, thread_name_prefix='till-read')
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix='till-write')
+        self._queue = None
+        self._commit_task = None
+        self._pricing = None
+        self._pricing_loaded = 0
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self._queue = asyncio.Queue()
+        self._commit_task = asyncio.create_task(self._commit_loop())
+        return await asyncio.start_server(self._serve, host, port, limit=MAX_LINE)
+
+    def close(self):
+        if self._commit_task is not None:
+            self._commit_task.cancel()
+        self._reads.shutdown()
+        self._writer.shutdown()
+        self.store.close()
+
+    async def _serve(self, reader, writer):
+        self.stats['connections'] += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(dumps(await self._dispatch(line)))
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            logger.warning('Dropping connection: %s', e)
+        finally:
+            self.stats['connections'] -= 1
+            writer.close()
+
+    async def _dispatch(self, line):
+        request_id = None
+        try:
+            request = loads(line)
+            request_id = request.get('id')
+            op = request['op']
+            args = request.get('args', [])
+            if op in READS:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._reads, self._read, READS[op], args)
+            elif op in WRITES or op == 'commit_sale':
+                future = asyncio.get_running_loop().create_future()
+                await self._queue.put((op, args, future))
+                result = await future
+            elif op == 'stats':
+                result = dict(self.stats)
+            else:
+                raise ValueError(f"Unknown operation: {op}")
+        except Exception as e:
+            return {'id': request_id, 'ok': False, 'error': {'type': type(e).__name__, 'message': str(e)}}
+        return {'id': request_id, 'ok': True, 'result': result}
+
+    def _read(self, func, args):
+        return encode_value(func(self.store.conn, *args))
+
+    async def _commit_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            results = await loop.run_in_executor(self._writer, self._apply, batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _apply(self, batch):
+        # Runs on the writer thread: one transaction, one commit, for the whole batch
+        conn = self.store.conn
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for op, args, _ in batch:
+                conn.execute('SAVEPOINT request')
+                try:
+                    if op == 'commit_sale':
+                        value = self._commit_sale(conn, *args)
+                    else:
+                        value = WRITES[op](conn, *args)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO request')
+                    results.append((False, e))
+                else:
+                    results.append((True, encode_value(value)))
+                conn.execute('RELEASE request')
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.exception('Group commit of %d writes failed', len(batch))
+            if conn.in_transaction:
+                conn.rollback()
+            return [(False, e)] * len(batch)
+        self.stats['writes'] += len(batch)
+        self.stats['commits'] += 1
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+        return results
+
+    def _commit_sale(self, conn, cart, payment_type, when=None, request_key=None):
+        # The server prices the sale; tills only send what was scanned
+        if when:
+            when = datetime.datetime.strptime(when, '%Y-%m-%d %H:%M:%S')
+        return checkout.commit_sale(conn, cart_from_wire(cart, self._promotions(conn)), payment_type, when, request_key)
+
+    def _promotions(self, conn):
+        if self._pricing is None or time.monotonic() - self._pricing_loaded > PROMOTION_TTL:
+            self._pricing = build_engine(active_promotion_rows(conn))
+            self._pricing_loaded = time.monotonic()
+        return self._pricing
+
+
+async def serve(db_path, host, port, max_batch, readers, backup_every=None):
+    till_server = TillServer(db_path, max_batch, readers)
+    server = await till_server.start(host, port)
+    addresses = ', '.join(f"{sock.getsockname()[0]}:{sock.getsockname()[1]}" for sock in server.sockets)
+    print(f"Serving {db_path} on {addresses}", flush=True)
+    scheduler = None
+    if backup_every:
+        # Tills in client mode have no database of their own to back up
+        scheduler = BackupScheduler(db_path, backup_every)
+        scheduler.start()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+        till_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Share one database between several tills over the local network.')
+    parser.add_argument('--database', default=DB_PATH, help='Database file the server owns')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to listen on (default: localhost only)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch', type=int, default=256, help='Most writes grouped into one commit')
+    parser.add_argument('--readers', type=int, default=4, help='Connections serving reads in parallel')
+    parser.add_argument('--backup-hours', type=float, default=backup_hours(),
+                        help='Back the database up every this many hours (default: CASHIER_BACKUP_HOURS, or off)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    try:
+        asyncio.run(serve(args.database, args.host, args.port, args.max_batch, args.readers, args.backup_hours))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
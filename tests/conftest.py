@@ -0,0 +1,16 @@
+import pytest
+
+from core import Cart, Store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = Store(str(tmp_path / 'shop.db'))
+    yield store
+    store.close()
+
+
+def make_cart(article_id, quantity=1, price=2.5):
+    cart = Cart()
+    cart.add(article_id, 'Tea', price, quantity)
+    return cart
@@ -0,0 +1,38 @@
+import datetime
+import os
+import sqlite3
+
+from core.backup import archive_copies, backup_database, list_backups, restore_backup
+from core.sales_archive import archive_path
+
+from conftest import make_cart
+
+
+def _sale_ids(store):
+    return sorted(sale[0] for sale in store.sales_history()[0])
+
+
+def test_restore_round_trip_with_archives(store, tmp_path):
+    directory = str(tmp_path / 'backups')
+    article_id = store.add_article('Tea', 2.5, 10)
+    store.commit_sale(make_cart(article_id), 'Cash', when=datetime.datetime(2023, 5, 1, 12))
+    store.commit_sale(make_cart(article_id), 'Card', when=datetime.datetime(2025, 5, 1, 12))
+    before_archiving = backup_database(store.db_path, directory)
+    store.archive_sales('2024-01-01')
+    archived = backup_database(store.db_path, directory)
+    assert not os.path.isdir(archive_copies(before_archiving))
+    assert os.listdir(archive_copies(archived)) == ['sales_2023.db.gz']
+
+    # The 2023 sale is in this backup and in the archive; history lists it once
+    saved = restore_backup(before_archiving, store.db_path, directory)
+    assert _sale_ids(store) == [1, 2]
+    assert saved in list_backups(store.db_path, directory)
+
+    # Archived again and sold since: restoring brings back the archives as they were
+    store.commit_sale(make_cart(article_id), 'Cash')
+    store.archive_sales('2026-01-01')
+    restore_backup(archived, store.db_path, directory)
+    assert _sale_ids(store) == [1, 2]
+    conn = sqlite3.connect(archive_path(store.db_path, 2025))
+    assert conn.execute('SELECT COUNT(*) FROM sales').fetchone()[0] == 0
+    conn.close()
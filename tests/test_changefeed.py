@@ -0,0 +1,24 @@
+from core.changefeed import changelog_seq, collect_changes, create_changelog, mark_replaced
+
+
+def test_collect_changes_reports_missed_after_pruning(store):
+    seq = store.changelog_seq()
+    for i in range(5):
+        store.add_article(f"Article {i}", 1.0, 1)
+    with store.conn:
+        create_changelog(store.conn.cursor(), keep=2)
+    changes = collect_changes(store.conn, seq)
+    assert changes['missed'] is True
+    assert changes['seq'] == store.changelog_seq()
+    # A reader that kept up sees the changes as usual
+    recent = collect_changes(store.conn, store.changelog_seq() - 1)
+    assert recent['missed'] is False
+    assert [row[1] for row in recent['articles']] == ['Article 4']
+
+
+def test_collect_changes_reports_missed_after_a_restore(store):
+    store.add_article('Tea', 2.5, 1)
+    seq = changelog_seq(store.conn)
+    with store.conn:
+        mark_replaced(store.conn, seq)
+    assert collect_changes(store.conn, seq)['missed'] is True
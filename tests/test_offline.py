@@ -0,0 +1,71 @@
+import pytest
+
+from core.offline import JournalInUseError, SalesJournal
+
+from conftest import make_cart
+
+
+def test_second_journal_on_one_path_is_refused(tmp_path):
+    path = str(tmp_path / 'till.jsonl')
+    journal = SalesJournal(path)
+    journal.add_block([1, 100])
+    with pytest.raises(JournalInUseError):
+        SalesJournal(path)
+    journal.close()
+    # Free again once the owner closes it
+    reopened = SalesJournal(path)
+    assert reopened.next_id == 1
+    reopened.close()
+
+
+def test_replay_skips_a_sale_id_already_applied(store, tmp_path):
+    article_id = store.add_article('Tea', 2.5, 10)
+    journal = SalesJournal(str(tmp_path / 'till.jsonl'))
+    journal.add_block(store.reserve_sale_ids('till', 10))
+    journal.record_sale(make_cart(article_id, 2), 'Cash', pending_stock=[[article_id, 2, 'take-1']])
+    records = [record for _, record in journal.unsynced()]
+    assert store.replay_sales('till', records) == [[True, []]]
+    # The till went down before noting the replay, so the same records come again
+    assert store.replay_sales('till', records) == [[False, []]]
+    assert len(store.sales_history()[0]) == 1
+    assert store.get_article(article_id).stock == 8
+    journal.close()
+
+
+def test_replay_skips_a_sale_recorded_under_its_request_key(store, tmp_path):
+    article_id = store.add_article('Tea', 2.5, 10)
+    journal = SalesJournal(str(tmp_path / 'till.jsonl'))
+    journal.add_block(store.reserve_sale_ids('till', 10))
+    # The server recorded the checkout, but its reply was lost and the till journaled it
+    store.commit_sale(make_cart(article_id), 'Card', request_key='sale-1')
+    journal.record_sale(make_cart(article_id), 'Card', request_key='sale-1')
+    assert store.replay_sales('till', [record for _, record in journal.unsynced()]) == [[False, []]]
+    assert len(store.sales_history()[0]) == 1
+    journal.close()
+
+
+def test_compacted_journal_reopens_with_its_unsynced_sales(tmp_path):
+    path = str(tmp_path / 'till.jsonl')
+    journal = SalesJournal(path)
+    journal.add_block([1, 50])
+    for _ in range(5):
+        journal.record_sale(make_cart(1), 'Cash')
+    pending = journal.unsynced()
+    journal.mark_synced(pending[2][0])
+    journal.compact()
+    journal.close()
+
+    reopened = SalesJournal(path)
+    assert reopened.synced == 0
+    assert [record['sale_id'] for _, record in reopened.unsynced()] == [4, 5]
+    assert reopened.next_id == 6
+    assert reopened.ids_left() == 45
+    reopened.close()
+
+
+def test_checkout_sent_again_under_its_key_is_recorded_once(store):
+    article_id = store.add_article('Tea', 2.5, 10)
+    first = store.commit_sale(make_cart(article_id), 'Card', request_key='sale-1')
+    again = store.commit_sale(make_cart(article_id), 'Card', request_key='sale-1')
+    assert again['sale_id'] == first['sale_id']
+    assert len(store.sales_history()[0]) == 1
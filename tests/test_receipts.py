@@ -0,0 +1,21 @@
+from core.receipts import ReceiptWriter
+
+
+def test_receipts_unsaved_at_shutdown_are_saved_on_next_start(tmp_path):
+    pending = str(tmp_path / 'pending.jsonl')
+    saved = []
+
+    def failing(batch):
+        raise OSError('disk full')
+
+    writer = ReceiptWriter(sink=failing, retry_delay=0, pending_path=pending)
+    writer.submit(1, {'sale_id': 1, 'final_total': 9.5})
+    writer.submit(2, '<html></html>')
+    writer.close()
+    assert (tmp_path / 'pending.jsonl').exists()
+
+    writer = ReceiptWriter(sink=saved.extend, retry_delay=0, pending_path=pending)
+    writer.submit(3, '<html></html>')
+    writer.close()
+    assert sorted(sale_id for sale_id, _ in saved) == [1, 2, 3]
+    assert not (tmp_path / 'pending.jsonl').exists()
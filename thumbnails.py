@@ -0,0 +1,123 @@
+import os
+import hashlib
+import threading
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QImage, QImageReader, QPixmap, QPixmapCache
+
+THUMBNAIL_DIR = os.path.join('images', '.thumbnails')
+THUMBNAIL_SIZE = 100
+
+# In-memory pixmap cache budget, in kilobytes (a 100x100 thumbnail is ~40 KB)
+PIXMAP_CACHE_KB = 64 * 1024
+
+
+def _disk_path(photo_path, size, directory):
+    digest = hashlib.sha1(os.path.abspath(photo_path).encode('utf-8')).hexdigest()
+    return os.path.join(directory, f"{digest}_{size}.png")
+
+
+def _decode_scaled(photo_path, size):
+    # Lets the decoder downscale while reading (JPEG decodes at 1/2, 1/4, 1/8),
+    # so the full-resolution image is never materialised
+    reader = QImageReader(photo_path)
+    reader.setAutoTransform(True)
+    original = reader.size()
+    if original.isValid():
+        reader.setScaledSize(original.scaled(QSize(size, size), Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        return image
+    if image.width() > size or image.height() > size:
+        image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return image
+
+
+class ThumbnailCache:
+    # Two levels: QPixmapCache in memory, backed by PNG thumbnails on disk.
+    # A disk thumbnail carries its source's mtime and is regenerated when the
+    # source changes; memory keys include the mtime, so stale entries just age out.
+    def __init__(self, size=THUMBNAIL_SIZE, directory=THUMBNAIL_DIR):
+        self.size = size
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        if QPixmapCache.cacheLimit() < PIXMAP_CACHE_KB:
+            QPixmapCache.setCacheLimit(PIXMAP_CACHE_KB)
+
+    def image(self, photo_path):
+        # Safe to call from worker threads (QImage, unlike QPixmap, is not tied to the GUI thread)
+        try:
+            source_mtime = os.stat(photo_path).st_mtime_ns
+        except OSError:
+            return QImage()
+        return self._load_image(photo_path, source_mtime)
+
+    def _memory_key(self, photo_path, source_mtime):
+        return f"thumb:{self.size}:{os.path.abspath(photo_path)}:{source_mtime}"
+
+    def pixmap(self, photo_path):
+        # Must be called from the GUI thread; returns None if the photo can't be read
+        try:
+            source_mtime = os.stat(photo_path).st_mtime_ns
+        except OSError:
+            return None
+        key = self._memory_key(photo_path, source_mtime)
+        pixmap = QPixmapCache.find(key)
+        if pixmap is not None:
+            return pixmap
+        image = self._load_image(photo_path, source_mtime)
+        if image.isNull():
+            return None
+        pixmap = QPixmap.fromImage(image)
+        QPixmapCache.insert(key, pixmap)
+        return pixmap
+
+    def cached_pixmap(self, photo_path):
+        # Memory level only: never touches the disk thumbnail or the original
+        try:
+            source_mtime = os.stat(photo_path).st_mtime_ns
+        except OSError:
+            return None
+        return QPixmapCache.find(self._memory_key(photo_path, source_mtime))
+
+    def store_pixmap(self, photo_path, image):
+        # GUI thread only; used to publish images loaded by worker threads
+        try:
+            source_mtime = os.stat(photo_path).st_mtime_ns
+        except OSError:
+            return None
+        pixmap = QPixmap.fromImage(image)
+        QPixmapCache.insert(self._memory_key(photo_path, source_mtime), pixmap)
+        return pixmap
+
+    def _load_image(self, photo_path, source_mtime):
+        disk_path = _disk_path(photo_path, self.size, self.directory)
+        try:
+            if os.stat(disk_path).st_mtime_ns == source_mtime:
+                image = QImage(disk_path)
+                if not image.isNull():
+                    return image
+        except OSError:
+            pass
+        image = _decode_scaled(photo_path, self.size)
+        if not image.isNull():
+            tmp_path = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp.png"
+            if image.save(tmp_path, 'PNG'):
+                os.utime(tmp_path, ns=(source_mtime, source_mtime))
+                os.replace(tmp_path, disk_path)
+        return image
+
+    def invalidate(self, photo_path):
+        try:
+            os.remove(_disk_path(photo_path, self.size, self.directory))
+        except OSError:
+            pass
+
+
+_default_cache = None
+
+
+def get_thumbnail_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ThumbnailCache()
+    return _default_cache